@@ -3,24 +3,27 @@ import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 import numpy as np
-from web3 import Web3
-from eth_account import Account
 import time
 
+from receipt_tracker import ReceiptTracker
+
 # --- CONFIGURATION ---
-SEPOLIA_RPC_URL_ENV = os.environ.get("SEPOLIA_RPC_URL")
-if not SEPOLIA_RPC_URL_ENV:
-    raise ValueError("SEPOLIA_RPC_URL environment variable not set.")
-SEPOLIA_RPC_URL = SEPOLIA_RPC_URL_ENV
+def load_config():
+    """Reads the RPC URL, contract address and owner key from the environment."""
+    SEPOLIA_RPC_URL = os.environ.get("SEPOLIA_RPC_URL")
+    if not SEPOLIA_RPC_URL:
+        raise ValueError("SEPOLIA_RPC_URL environment variable not set.")
+
+    CONTRACT_ADDRESS = os.environ.get("CONTRACT_ADDRESS")
+    if not CONTRACT_ADDRESS:
+        raise ValueError("CONTRACT_ADDRESS environment variable not set.")
 
-CONTRACT_ADDRESS_ENV = os.environ.get("CONTRACT_ADDRESS")
-if not CONTRACT_ADDRESS_ENV:
-    raise ValueError("CONTRACT_ADDRESS environment variable not set.")
-CONTRACT_ADDRESS = CONTRACT_ADDRESS_ENV
+    OWNER_PRIVATE_KEY = os.environ.get("OWNER_PRIVATE_KEY")
+    if not OWNER_PRIVATE_KEY:
+        raise ValueError("OWNER_PRIVATE_KEY environment variable not set.")
+    return SEPOLIA_RPC_URL, CONTRACT_ADDRESS, OWNER_PRIVATE_KEY
 
-OWNER_PRIVATE_KEY = os.environ.get("OWNER_PRIVATE_KEY")
-if not OWNER_PRIVATE_KEY:
-    raise ValueError("OWNER_PRIVATE_KEY environment variable not set.")
+GLOBAL_MODEL_NPZ = os.environ.get("GLOBAL_MODEL_NPZ", "global_model_weights_mlp.npz")
 
 # Contract ABI (minimal - just what we need for aggregation)
 CONTRACT_ABI = [
@@ -54,7 +57,75 @@ CONTRACT_ABI = [
     }
 ]
 
+def fetch_local_models(contract, participants):
+    """Reads every participant's local weights from the contract, in participant order."""
+    all_local_weights = []
+    for i, addr in enumerate(participants):
+        local_weights = contract.functions.getLocalModel(addr).call()
+        all_local_weights.append(local_weights)
+        logging.info(f" Prosumer {i+1}: {len(local_weights)} weights")
+        logging.info(f"   First 3: {local_weights[:3]}")
+    return all_local_weights
+
+def federated_average(all_local_weights, weights=None):
+    """Element-wise mean of the scaled integer weights, truncated back to int.
+
+    weights optionally gives each participant's share (e.g. down-weighting stale updates).
+    """
+    weights_array = np.array(all_local_weights, dtype=np.int64)
+    logging.info(f" Shape: {weights_array.shape} (participants x weights)")
+    averaged_weights = np.average(weights_array, axis=0, weights=weights)
+    return averaged_weights.astype(np.int64).tolist()
+
+# Dense layer parameters of the MLP student, in Keras get_weights() order
+LAYER_KEYS = ['W1', 'b1', 'W2', 'b2', 'W3', 'b3', 'W4', 'b4']
+
+# Signature entries that are plain layer means (W1 mean, then b1..W4 means). Unlike the
+# std/min/max/median stats, these commute with averaging, so the mean of the local
+# signatures on chain must match the signature of the layer-wise averaged weights.
+LINEAR_SIGNATURE_INDICES = [0, 5, 6, 7, 8, 9, 10]
+
+def average_model_files(npz_files, output_path):
+    """Layer-wise FedAvg of full local MLP weights, written as the global model artifact."""
+    if not npz_files:
+        raise ValueError("no local model files to average")
+    layers = {key: [] for key in LAYER_KEYS}
+    for path in npz_files:
+        with np.load(path) as model:
+            for key in LAYER_KEYS:
+                layers[key].append(model[key])
+    averaged = {key: np.mean(layers[key], axis=0).astype(np.float32) for key in LAYER_KEYS}
+    np.savez(output_path, **averaged)
+    logging.info(f" Global model artifact written: {output_path} ({len(npz_files)} local models)")
+    return averaged
+
+def matches_global_signature(artifact_signature, global_signature, tolerance=2):
+    """True when a full-weight artifact is consistent with the averaged signature stored on chain."""
+    if len(artifact_signature) != len(global_signature):
+        return False
+    return all(abs(artifact_signature[i] - global_signature[i]) <= tolerance for i in LINEAR_SIGNATURE_INDICES)
+
+def send_global_update(w3, contract, owner_account, new_global_weights):
+    """Signs and sends updateGlobalModel from the owner account. Returns the transaction hash."""
+    transaction = contract.functions.updateGlobalModel(
+        new_global_weights
+    ).build_transaction({
+        'chainId': 11155111,  # Sepolia
+        'from': owner_account.address,
+        'nonce': w3.eth.get_transaction_count(owner_account.address),
+        'gas': 500000,
+        'gasPrice': w3.eth.gas_price,
+    })
+    signed_txn = owner_account.sign_transaction(transaction)
+    return w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+
 def main():
+    # Imported here so the averaging helpers load without web3
+    from web3 import Web3
+    from eth_account import Account
+
+    SEPOLIA_RPC_URL, CONTRACT_ADDRESS, OWNER_PRIVATE_KEY = load_config()
+
     logging.info(" Federated Learning Aggregation")
     print("=" * 40)
     
@@ -102,28 +173,17 @@ def main():
         logging.info(f"\n STEP 2: Fetching Local Models")
         print("-" * 30)
         
-        all_local_weights = []
-        for i, addr in enumerate(participants):
-            try:
-                local_weights = contract.functions.getLocalModel(addr).call()
-                all_local_weights.append(local_weights)
-                logging.info(f" Prosumer {i+1}: {len(local_weights)} weights")
-                logging.info(f"   First 3: {local_weights[:3]}")
-            except Exception as e:
-                logging.error(f" Error fetching weights for {addr}: {e}")
-                return
+        try:
+            all_local_weights = fetch_local_models(contract, participants)
+        except Exception as e:
+            logging.error(f" Error fetching weights: {e}")
+            return
 
         # --- STEP 3: Federated Averaging ---
         logging.info(f"\n STEP 3: Federated Averaging")
         print("-" * 30)
         
-        # Convert to numpy for easy averaging
-        weights_array = np.array(all_local_weights, dtype=np.int64)
-        logging.info(f" Shape: {weights_array.shape} (participants x weights)")
-        
-        # Calculate federated average
-        averaged_weights = np.mean(weights_array, axis=0)
-        new_global_weights = averaged_weights.astype(np.int64).tolist()
+        new_global_weights = federated_average(all_local_weights)
         
         logging.info(f" Averaging complete!")
         logging.info(f" New global weights (first 3): {new_global_weights[:3]}")
@@ -146,29 +206,14 @@ def main():
             logging.info(" Insufficient balance for transaction!")
             return
         
-        # Build transaction
-        nonce = w3.eth.get_transaction_count(owner_account.address)
-        gas_price = w3.eth.gas_price
-        
         logging.info(f"🔧 Building transaction...")
-        transaction = contract.functions.updateGlobalModel(
-            new_global_weights
-        ).build_transaction({
-            'chainId': 11155111,  # Sepolia
-            'from': owner_account.address,
-            'nonce': nonce,
-            'gas': 500000,
-            'gasPrice': gas_price,
-        })
-
-        # Sign and send
-        signed_txn = owner_account.sign_transaction(transaction)
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        
-        logging.info(f" Transaction sent: {tx_hash.hex()}")
-        logging.info(" Waiting for confirmation...")
-        
-        tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+        with ReceiptTracker(w3.eth) as tracker:
+            tx_hash = send_global_update(w3, contract, owner_account, new_global_weights)
+
+            logging.info(f" Transaction sent: {tx_hash.hex()}")
+            logging.info(" Waiting for confirmation...")
+
+            tx_receipt = tracker.wait(tx_hash)
         
         if tx_receipt.status == 1:
             logging.info(f" SUCCESS! Global model updated!")
@@ -187,6 +232,12 @@ def main():
                 logging.info("Verification successful - models match!")
             else:
                 logging.info("  Warning: Models don't match exactly")
+
+            # The chain only stores the 11-weight signature. When the full local models are
+            # available, also publish the layer-wise average so prosumers can warm-start from it.
+            local_npz_files = os.environ.get("LOCAL_NPZ_FILES")
+            if local_npz_files:
+                average_model_files(local_npz_files.split(","), GLOBAL_MODEL_NPZ)
                 
         else:
             logging.info(" Transaction failed!")
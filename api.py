@@ -1,22 +1,31 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, g, Response
 from flask_cors import CORS
-from web3 import Web3
 import os
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 import math
-from datetime import datetime, timedelta
+import random
+import time
+
+import numpy as np
+
+from anomaly import StreamingDetector, FLAGS, read_meter_csv, replay
+from billing import BillingEngine, load_prosumers
+from features import HORIZONS
+from forecast_scheduler import ForecastScheduler
+from metrics import Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE
+from model_registry import ModelRegistry
 
 # --- 1. Configuration (Same as your other scripts) ---
-SEPOLIA_RPC_URL_ENV = os.environ.get("SEPOLIA_RPC_URL")
-if not SEPOLIA_RPC_URL_ENV:
-    raise ValueError("SEPOLIA_RPC_URL environment variable not set.")
-SEPOLIA_RPC_URL = SEPOLIA_RPC_URL_ENV
-CONTRACT_ADDRESS_ENV = os.environ.get("CONTRACT_ADDRESS")
-if not CONTRACT_ADDRESS_ENV:
-    raise ValueError("CONTRACT_ADDRESS environment variable not set.")
-CONTRACT_ADDRESS = Web3.to_checksum_address(CONTRACT_ADDRESS_ENV)
+SEPOLIA_RPC_URL = os.environ.get("SEPOLIA_RPC_URL")
+CONTRACT_ADDRESS = os.environ.get("CONTRACT_ADDRESS")
+
+def check_config():
+    if not SEPOLIA_RPC_URL:
+        raise ValueError("SEPOLIA_RPC_URL environment variable not set.")
+    if not CONTRACT_ADDRESS:
+        raise ValueError("CONTRACT_ADDRESS environment variable not set.")
 CONTRACT_ABI = [
 	{
 		"inputs": [],
@@ -229,23 +238,184 @@ CONTRACT_ABI = [
 	}
 ]
 SCALING_FACTOR = 1000000.0  # Use a float for division
+MODEL_VERSION = "2.1.3"
+# How long a global model read from the contract is served before asking the chain again
+GLOBAL_MODEL_CACHE_TTL = float(os.environ.get("GLOBAL_MODEL_CACHE_TTL", "30"))
 
 # --- 2. Setup Flask App ---
 app = Flask(__name__)
 CORS(app)  # This allows your frontend to make requests to this backend
 
-# --- 3. Setup Web3 Connection ---
-w3 = Web3(Web3.HTTPProvider(SEPOLIA_RPC_URL))
-contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=CONTRACT_ABI)
+# --- 3. Setup Web3 Connection (on first use; importing web3 takes seconds) ---
+w3 = None
+contract = None
+
+def get_contract():
+    global w3, contract
+    if contract is None:
+        check_config()
+        from web3 import Web3
+        w3 = Web3(Web3.HTTPProvider(SEPOLIA_RPC_URL))
+        contract = w3.eth.contract(address=Web3.to_checksum_address(CONTRACT_ADDRESS), abi=CONTRACT_ABI)
+    return contract
+
+# --- 4. Metrics ---
+HTTP_REQUESTS = Counter("fedgrid_http_requests_total", "HTTP requests by route, method and status",
+                        ["route", "method", "status"])
+HTTP_LATENCY = Histogram("fedgrid_http_request_duration_seconds", "HTTP request latency by route",
+                         ["route", "method"])
+RPC_CALLS = Counter("fedgrid_rpc_calls_total", "Upstream contract calls by method and outcome",
+                    ["method", "outcome"])
+RPC_LATENCY = Histogram("fedgrid_rpc_latency_seconds", "Upstream contract call latency", ["method"])
+GLOBAL_MODEL_CACHE = Counter("fedgrid_global_model_cache_total", "Global model cache lookups", ["result"])
+GLOBAL_MODEL_AGE = Gauge("fedgrid_global_model_age_seconds", "Age of the cached global model")
+MODEL_INFO = Gauge("fedgrid_model_info", "Version of the model served by the API", ["version"])
+MODEL_INFO.set(1, version=MODEL_VERSION)
+MODEL_SWAPS = Counter("fedgrid_model_swaps_total", "Model versions swapped in by the forecast scheduler")
+MODEL_CACHE_BYTES = Gauge("fedgrid_model_cache_bytes", "Memory held by cached household models")
+FORECAST_AGE = Gauge("fedgrid_forecast_age_seconds", "Age of the precomputed forecast snapshot")
+FORECAST_REFRESH = Gauge("fedgrid_forecast_refresh_seconds", "Duration of the last forecast refresh")
+ANOMALY_ALERTS = Counter("fedgrid_anomaly_alerts_total", "Meter anomaly alerts raised, by kind", ["kind"])
+
+_global_model_cache = {"weights": None, "fetched_at": None}
+GLOBAL_MODEL_AGE.set_function(
+    lambda: time.time() - _global_model_cache["fetched_at"] if _global_model_cache["fetched_at"] else None)
+
+_billing_engine = None
+_model_registry = None
+_forecast_scheduler = None
+_anomaly_detector = None
+
+def get_billing_engine():
+    """Billing engine over the prosumer registry, built on first use."""
+    global _billing_engine
+    if _billing_engine is None:
+        _billing_engine = BillingEngine()
+    return _billing_engine
+
+def served_version(served):
+    """Model version reported to clients: the API release plus the digest of the served models."""
+    return f"{MODEL_VERSION}+{served.version}" if served is not None else MODEL_VERSION
+
+def record_model_swap(previous, served):
+    # Hourly refreshes republish the same models; only a new version counts as a swap
+    if previous is not None and previous.version == served.version:
+        return
+    MODEL_SWAPS.inc()
+    MODEL_INFO.remove(version=served_version(previous))
+    MODEL_INFO.set(1, version=served_version(served))
+    logging.info(f"Serving model version {served_version(served)}")
+
+def get_model_registry():
+    """Per-address household models, built on first use."""
+    global _model_registry
+    if _model_registry is None:
+        _model_registry = ModelRegistry(on_swap=record_model_swap)
+        MODEL_CACHE_BYTES.set_function(lambda: _model_registry.cached_bytes)
+        FORECAST_AGE.set_function(
+            lambda: time.time() - _model_registry.published_at if _model_registry.published_at else None)
+    return _model_registry
+
+def get_forecast_scheduler():
+    """Scheduler that publishes model versions; it only runs a thread once started."""
+    global _forecast_scheduler
+    if _forecast_scheduler is None:
+        _forecast_scheduler = ForecastScheduler(get_model_registry())
+        FORECAST_REFRESH.set_function(lambda: _forecast_scheduler.last_duration)
+    return _forecast_scheduler
+
+def get_anomaly_detector():
+    """Streaming meter anomaly detector, seeded on first use with the registered households' readings."""
+    global _anomaly_detector
+    if _anomaly_detector is None:
+        detector = StreamingDetector()
+        datasets = dict.fromkeys(entry["dataset"] for entry in load_prosumers().values())
+        if datasets:
+            record_alerts(replay(detector, [read_meter_csv(path) for path in datasets])[1]["alerts"])
+        _anomaly_detector = detector
+    return _anomaly_detector
+
+def record_alerts(alerts):
+    for alert in alerts:
+        ANOMALY_ALERTS.inc(kind=alert["kind"])
+    return alerts
+
+def global_model_events():
+    """Poll function returning True once per GlobalModelUpdated event.
+
+    Uses an event filter on the contract; nodes without filter support fall back to
+    comparing the global model read from the contract.
+    """
+    try:
+        event_filter = get_contract().events.GlobalModelUpdated.create_filter(fromBlock='latest')
+        return lambda: bool(rpc_call("getFilterChanges", event_filter.get_new_entries))
+    except Exception as e:
+        logging.warning(f"No event filter for GlobalModelUpdated ({e}); polling the global model instead")
+        last = {"weights": get_global_weights()}
+
+        def changed():
+            weights = get_global_weights()
+            updated = weights != last["weights"]
+            last["weights"] = weights
+            return updated
+        return changed
+
+def start_forecast_scheduler():
+    """Precompute forecasts hourly and on GlobalModelUpdated, swapping in each new model version
+    in the background (see forecast_scheduler.py)."""
+    scheduler = get_forecast_scheduler()
+    scheduler.events = global_model_events()
+    return scheduler.start()
 
-# --- 4. Create Your API Endpoints ---
+def rpc_call(method, fn):
+    """Runs one contract call, recording its latency and outcome."""
+    start = time.perf_counter()
+    try:
+        result = fn()
+    except Exception:
+        RPC_CALLS.inc(method=method, outcome="error")
+        raise
+    finally:
+        RPC_LATENCY.observe(time.perf_counter() - start, method=method)
+    RPC_CALLS.inc(method=method, outcome="ok")
+    return result
+
+def get_global_weights():
+    """Scaled global weights from the contract, cached for GLOBAL_MODEL_CACHE_TTL seconds."""
+    fetched_at = _global_model_cache["fetched_at"]
+    if fetched_at is not None and time.time() - fetched_at < GLOBAL_MODEL_CACHE_TTL:
+        GLOBAL_MODEL_CACHE.inc(result="hit")
+        return _global_model_cache["weights"]
+    GLOBAL_MODEL_CACHE.inc(result="miss")
+    weights = rpc_call("getGlobalModel", lambda: get_contract().functions.getGlobalModel().call())
+    _global_model_cache.update(weights=weights, fetched_at=time.time())
+    return weights
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    start = getattr(g, "request_start", None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_LATENCY.observe(time.perf_counter() - start, route=route, method=request.method)
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=str(response.status_code))
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+# --- 5. Create Your API Endpoints ---
 @app.route("/get-global-model", methods=["GET"])
 def get_model_data():
     logging.info("Request received! Fetching global model from Sepolia...")
     try:
         # Call the contract (read-only, so it's fast and free)
         # This returns the list of integers, e.g., [-95, 31858, -62438, ...]
-        scaled_weights = contract.functions.getGlobalModel().call()
+        scaled_weights = get_global_weights()
 
         if not scaled_weights:
             return jsonify({"error": "Model not found or empty"}), 404
@@ -261,7 +431,7 @@ def get_model_data():
             "metadata": {
                 "total_weights": len(real_weights),
                 "scaling_factor": SCALING_FACTOR,
-                "contract_address": CONTRACT_ADDRESS
+                "contract_address": getattr(get_contract(), "address", CONTRACT_ADDRESS)
             },
             "timestamp": time.time()
         })
@@ -273,10 +443,10 @@ def get_model_data():
 @app.route("/get-prediction", methods=["GET"])
 def get_prediction():
     """
-    Generate dynamic energy consumption predictions based on time period
+    Energy consumption forecast from the household models
     Query parameters:
     - period: '24h', '7d', '30d' (default: '24h')
-    - user_address: wallet address for personalized predictions (optional)
+    - user_address: wallet address; registered prosumers get their own household's model (optional)
     """
     logging.info("Request received! Generating energy prediction...")
     
@@ -285,34 +455,26 @@ def get_prediction():
         period = request.args.get('period', '24h')
         user_address = request.args.get('user_address', None)
         
-        # Base consumption patterns (kWh)
-        base_daily = 35.0  # Base daily consumption
-        
-        # Generate prediction based on period
-        periods = {
-            '24h': {'hours': 24, 'time_multiplier': 1, 'unit': "kWh"},
-            '7d': {'time_multiplier': 7, 'unit': "kWh"},
-            '30d': {'time_multiplier': 30, 'unit': "kWh"}
-        }
-
-        period_data = periods.get(period)
-        if not period_data:
+        if period not in HORIZONS:
             return jsonify({"error": "Invalid period. Use '24h', '7d', or '30d'"}), 400
+        time_multiplier = HORIZONS[period] / 24
+        unit = "kWh"
 
-        time_multiplier = period_data.get('time_multiplier')
-        unit = period_data.get('unit')
-        hours = period_data.get('hours', 24) # Default to 24 for '24h'
+        # The household's own model for registered prosumers; otherwise the average
+        # forecast over all registered households. Every period comes from the same
+        # hourly-cached forward pass. The whole request reads one served version, even
+        # if a newer one is swapped in meanwhile.
+        registry = get_model_registry()
+        served = get_forecast_scheduler().current()
+        personalized = bool(user_address) and user_address in registry
+        addresses = [user_address] if personalized else registry.addresses()
+        forecasts = [registry.forecast(address, served)[period] for address in addresses]
+        prediction_value = float(np.mean([f['value'] for f in forecasts]))
+        base_daily = prediction_value / time_multiplier
 
-        # Add user-specific adjustments if address provided
-        if user_address:
-            # Simple hash-based personalization (consistent for same address)
-            address_hash = hash(user_address) % 1000
-            personal_factor = 0.8 + (address_hash / 1000) * 0.4  # 0.8 to 1.2 multiplier
-            prediction_value *= personal_factor
-        
-        # Calculate confidence and accuracy metrics
-        confidence = random.uniform(85, 95)
-        accuracy_score = random.uniform(88, 96)
+        # Quality of the model(s) on their held-out test windows
+        confidence = float(np.mean([f['within_10pct'] for f in forecasts]))
+        accuracy_score = 100 - float(np.mean([f['smape'] for f in forecasts]))
         
         # Generate supporting data
         prediction_data = {
@@ -327,8 +489,9 @@ def get_prediction():
             "metadata": {
                 "base_consumption": round(base_daily, 2),
                 "time_multiplier": time_multiplier,
-                "user_personalized": user_address is not None,
-                "model_version": "2.1.3"
+                "user_personalized": personalized,
+                "horizon_source": forecasts[0]['source'],
+                "model_version": served_version(served)
             },
             "breakdown": {
                 "base_load": round(prediction_value * 0.6, 2),
@@ -495,9 +658,10 @@ def get_regional_data():
 @app.route("/get-bill", methods=["GET"])
 def get_bill():
     """
-    Generate electricity bill for user
+    Electricity bill for a prosumer, from metered consumption
     Query parameters:
     - user_address: wallet address (required)
+    - period: billing period 'YYYY-MM' (default: the prosumer's latest complete month)
     """
     logging.info("Request received! Generating electricity bill...")
     
@@ -505,59 +669,147 @@ def get_bill():
         user_address = request.args.get('user_address')
         if not user_address:
             return jsonify({"error": "User address is required"}), 400
-        
-        # Generate realistic consumption based on user address
-        address_hash = hash(user_address) % 1000
-        base_consumption = 200 + (address_hash / 1000) * 100  # 200-300 kWh range
-        
-        # Add some monthly variation
-        monthly_variation = random.uniform(-30, 50)
-        consumption = round(base_consumption + monthly_variation, 1)
-        
-        # Ultra-low rates to preserve faucet tokens (demo-friendly)
-        # Rate per kWh in ETH (approximately $0.0005 per kWh at current ETH prices)
-        rate_per_kwh = 0.0000004  # ~$0.001 per kWh (very low for demo)
-        
-        # Calculate charges
-        energy_charges = consumption * rate_per_kwh
-        grid_charges = energy_charges * 0.125  # 12.5% grid maintenance
-        taxes = energy_charges * 0.128  # 12.8% taxes and fees
-        
-        total_amount = energy_charges + grid_charges + taxes
-        
-        # Generate bill data
-        current_date = datetime.now()
-        bill_data = {
-            "billId": f"BILL-{int(time.time())}-{address_hash}",
-            "userAddress": user_address,
-            "period": current_date.strftime("%B %Y"),
-            "consumption": consumption,
-            "rate": rate_per_kwh,
-            "amount": round(total_amount, 6),  # Total in ETH
-            "dueDate": (current_date + timedelta(days=15)).isoformat(),
-            "issueDate": current_date.isoformat(),
-            "status": "pending",
-            "breakdown": {
-                "energyCharges": round(energy_charges, 6),
-                "gridCharges": round(grid_charges, 6),
-                "taxes": round(taxes, 6)
-            },
-            "utilityInfo": {
-                "name": "FedGrid Energy Solutions",
-                "address": "Mangalore Regional Grid, Karnataka, India",
-                "contact": "+91-824-FEDGRID"
-            },
-            "paymentMethods": ["Sepolia ETH"],
-            "timestamp": time.time()
-        }
-        
-        logging.info(f"Generated bill for {user_address}: {consumption} kWh = {total_amount:.6f} ETH")
-        return jsonify(bill_data)
+
+        engine = get_billing_engine()
+        if user_address.lower() not in engine.prosumers:
+            return jsonify({"error": "Unknown prosumer address"}), 404
+
+        period = request.args.get('period') or engine.latest_period(user_address)
+        if period is None:
+            return jsonify({"error": "No complete billing period yet"}), 404
+        coverage = engine.period_coverage(user_address, period)
+        if coverage == 0.0:
+            return jsonify({"error": f"No metered consumption for {period}"}), 404
+        bill = engine.bills([user_address], period)[0]
+        if bill is None:
+            return jsonify({"error": f"Billing period {period} is incomplete",
+                            "coverage": round(coverage, 4),
+                            "latest_complete_period": engine.latest_period(user_address)}), 409
+
+        logging.info(f"Bill for {user_address}: {bill['consumption']} kWh = {bill['amount']:.6f} ETH")
+        return jsonify(dict(bill, timestamp=time.time()))
         
     except Exception as e:
         logging.error(f"Error generating bill: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/bills/batch", methods=["POST"])
+def get_bills_batch():
+    """
+    Monthly bill run
+    JSON body (all optional):
+    - period: billing period 'YYYY-MM' (default: each prosumer's latest complete month)
+    - addresses: wallet addresses (default: every registered prosumer)
+    """
+    try:
+        body = request.get_json(silent=True)
+        body = {} if body is None else body
+        if not isinstance(body, dict):
+            return jsonify({"error": "Request body must be a JSON object"}), 400
+        engine = get_billing_engine()
+        addresses = body.get('addresses') or engine.addresses()
+        if not isinstance(addresses, list) or not all(isinstance(a, str) for a in addresses):
+            return jsonify({"error": "addresses must be a list of strings"}), 400
+        period = body.get('period')
+
+        bills, missing, incomplete = [], [], []
+        for address, bill in zip(addresses, engine.bills(addresses, period)):
+            if bill is not None:
+                bills.append(bill)
+            elif period and engine.period_coverage(address, period) > 0.0:
+                incomplete.append(address)
+            else:
+                missing.append(address)
+
+        logging.info(f"Bill run for {period or 'latest complete months'}: {len(bills)} bills, "
+                     f"{len(incomplete)} incomplete, {len(missing)} without readings")
+        return jsonify({
+            "period": period,
+            "bills": bills,
+            "incomplete": incomplete,
+            "missing": missing,
+            "total_amount": round(sum(bill["amount"] for bill in bills), 6),
+            "timestamp": time.time()
+        })
+
+    except Exception as e:
+        logging.error(f"Error generating bill run: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/readings", methods=["POST"])
+def post_readings():
+    """
+    Streams hourly meter readings into the anomaly detector
+    JSON body: {"readings": [{"node_id": "Node_1", "reading": 10.4,
+                              "submeters": 7.1, "timestamp": "2023-03-03 00:00:00"}, ...]}
+    - reading: facility meter reading in kW (required)
+    - submeters: sum of the appliance sub-meters in kW (optional)
+    """
+    try:
+        body = request.get_json(silent=True)
+        readings = body.get('readings') if isinstance(body, dict) else None
+        if not isinstance(readings, list) or not readings:
+            return jsonify({"error": "readings must be a non-empty list"}), 400
+        try:
+            node_ids = [str(r['node_id']) for r in readings]
+            values = [float(r['reading']) for r in readings]
+            submeters = [float(r['submeters']) if r.get('submeters') is not None else math.nan for r in readings]
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid reading: {e}"}), 400
+
+        scores = get_anomaly_detector().update(node_ids, values, submeters, [r.get('timestamp') for r in readings])
+        alerts = record_alerts(scores["alerts"])
+        return jsonify({
+            "accepted": len(readings),
+            "flagged": int((scores["flags"] > 0).sum()),
+            "alerts": alerts,
+            "timestamp": time.time()
+        })
+
+    except Exception as e:
+        logging.error(f"Error scoring readings: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/get-alerts", methods=["GET"])
+def get_alerts():
+    """
+    Meter anomaly alerts, newest first
+    Query parameters (all optional):
+    - node_id: only this meter
+    - kind: spike, sustained_drop, zero_reading or submeter_gap
+    - since: only alerts with a larger id, oldest first (for polling the feed; pass back last_id,
+      and poll again straight away while has_more is true)
+    - limit: maximum number of alerts (default 100)
+    """
+    try:
+        kind = request.args.get('kind')
+        if kind is not None and kind not in FLAGS:
+            return jsonify({"error": f"Invalid kind. Use one of: {', '.join(FLAGS)}"}), 400
+        since = request.args.get('since', type=int)
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+
+        detector = get_anomaly_detector()
+        alerts = detector.alerts(node_id=request.args.get('node_id'), kind=kind, since=since, limit=limit + 1)
+        has_more = len(alerts) > limit
+        alerts = alerts[:limit]
+        # The newest alert returned: first in the newest-first listing, last in a page after since
+        newest = alerts[0 if since is None else -1]["id"] if alerts else since
+        return jsonify({
+            "alerts": alerts,
+            "last_id": newest,
+            "has_more": has_more,
+            "summary": detector.summary(),
+            "timestamp": time.time()
+        })
+
+    except Exception as e:
+        logging.error(f"Error fetching alerts: {e}")
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == "__main__":
+    check_config()
+    # With the debug reloader, only the child process that serves requests runs the scheduler
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_forecast_scheduler()
     logging.info("Starting Flask API server at http://127.0.0.1:5000")
     app.run(debug=True, port=5000) # Runs the web server
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""Rolling-origin backtest of a household student over its whole history.
+
+Every hour with a fully observed target is a forecast origin. Origins are grouped
+into folds of FOLD_HOURS consecutive hours, and each fold gets one batched forward
+pass. The first layer is applied to the windows without materialising them:
+window k flattened times W1 equals the sum over lags w of X[k + w] @ W1[w], so each
+fold is one matmul over its rows of the scaled feature matrix plus a strided sum,
+and the (origins x window*features) input is never built. Errors are reported per
+fold (with the train/val/test region it falls in) and per hour of day of the origin.
+
+    python backtest.py --weights local_model_weights_mlp_1.npz --data household_1_energy_dataset.csv
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from features import load_household, engineer_features, make_horizon_targets, split_points, HORIZONS
+from model_registry import load_household_model
+from quantize_model import LAYERS, ACTIVATIONS, WINDOW_SIZE
+
+FOLD_HOURS = 24 * 7
+
+
+def first_layer(X_scaled, W1, b1, window, start, stop):
+    """Pre-activation of the first dense layer for windows [start, stop), without flattening them.
+
+    One matmul gives every row's contribution at every lag, Z[r, lag] = X[r] @ W1[lag]; window k
+    then sums the diagonal Z[k + lag, lag], read through a strided view.
+    """
+    n_features, units = X_scaled.shape[1], W1.shape[1]
+    W_by_lag = W1.reshape(window, n_features, units).transpose(1, 0, 2).reshape(n_features, window * units)
+    Z = (X_scaled[start:stop + window - 1] @ W_by_lag).reshape(-1, window, units)
+    s0, s1, s2 = Z.strides
+    diagonal = np.lib.stride_tricks.as_strided(Z, shape=(stop - start, window, units), strides=(s0, s0 + s1, s2),
+                                               writeable=False)
+    return diagonal.sum(axis=1) + b1
+
+
+def predict_windows(model, X_scaled, start, stop, window=WINDOW_SIZE):
+    """kWh per horizon for windows [start, stop) of the scaled features; same outputs as model.predict()."""
+    h = first_layer(X_scaled, model.weights['W1'], model.weights['b1'], window, start, stop)
+    for layer, activation in zip(LAYERS, ACTIVATIONS):
+        if layer > 1:
+            h = h @ model.weights[f"W{layer}"] + model.weights[f"b{layer}"]
+        if activation == 'relu':
+            h = np.maximum(h, 0)
+    return np.expm1((h - model.y_min) / model.y_scale)
+
+
+def error_summary(actual, predicted):
+    """Error statistics per column of (n, horizons) arrays."""
+    err = predicted - actual
+    ape = 100 * np.abs(err) / np.maximum(np.abs(actual), 1e-8)
+    smape = 100 * 2 * np.abs(err) / (np.abs(actual) + np.abs(predicted) + 1e-8)
+    return {
+        'mae': np.abs(err).mean(axis=0),
+        'rmse': np.sqrt((err ** 2).mean(axis=0)),
+        'bias': err.mean(axis=0),
+        'smape': smape.mean(axis=0),
+        'ape_p50': np.percentile(ape, 50, axis=0),
+        'ape_p90': np.percentile(ape, 90, axis=0),
+    }
+
+
+def _per_horizon(summary, horizons):
+    return {name: {stat: round(float(values[j]), 4) for stat, values in summary.items()}
+            for j, name in enumerate(horizons)}
+
+
+def backtest(weights_path, csv_path, fold_hours=FOLD_HOURS, window=WINDOW_SIZE, pack=None):
+    """Per-fold and per-hour-of-day errors of a student over every origin in the household's history."""
+    model = load_household_model(weights_path, csv_path, window, pack=pack)
+    df, feature_cols, target_col = engineer_features(load_household(csv_path))
+    X_all, Y = make_horizon_targets(df[feature_cols].values, df[target_col].values,
+                                    [HORIZONS[name] for name in model.horizons])
+    X_scaled = ((X_all - model.x_center) / model.x_scale).astype(np.float32)
+    n_origins = len(X_scaled) - window
+    if n_origins <= 0:
+        raise ValueError(f"{csv_path} has no fully observed forecast origins for a {window}h window")
+    actual = Y[window:window + n_origins]
+    timestamps = pd.to_datetime(df['timestamp'].iloc[window:window + n_origins], errors='coerce')
+    hours = (timestamps.dt.hour.to_numpy() if timestamps.notna().all()
+             else np.arange(window, window + n_origins) % 24)
+    split1, split2 = split_points(n_origins)
+
+    start = time.perf_counter()
+    predicted = np.empty_like(actual)
+    folds = []
+    for fold_start in range(0, n_origins, fold_hours):
+        fold_stop = min(fold_start + fold_hours, n_origins)
+        predicted[fold_start:fold_stop] = predict_windows(model, X_scaled, fold_start, fold_stop, window)
+        mid = (fold_start + fold_stop) // 2
+        folds.append({
+            'fold': len(folds),
+            'start': str(df['timestamp'].iloc[window + fold_start]),
+            'end': str(df['timestamp'].iloc[window + fold_stop - 1]),
+            'origins': fold_stop - fold_start,
+            'region': 'train' if mid < split1 else 'val' if mid < split2 else 'test',
+            'horizons': _per_horizon(error_summary(actual[fold_start:fold_stop], predicted[fold_start:fold_stop]),
+                                     model.horizons),
+        })
+    evaluation_s = time.perf_counter() - start
+
+    by_hour = {int(hour): _per_horizon(error_summary(actual[hours == hour], predicted[hours == hour]), model.horizons)
+               for hour in np.unique(hours)}
+    return {
+        'weights': weights_path,
+        'dataset': csv_path,
+        'horizons': model.horizons,
+        'origins': int(n_origins),
+        'fold_hours': fold_hours,
+        'evaluation_s': evaluation_s,
+        'overall': _per_horizon(error_summary(actual, predicted), model.horizons),
+        'test': _per_horizon(error_summary(actual[split2:], predicted[split2:]), model.horizons),
+        'folds': folds,
+        'hour_of_day': by_hour,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rolling-origin backtest of a household student model.')
+    parser.add_argument('--weights', default='local_model_weights_mlp_1.npz')
+    parser.add_argument('--data', default='household_1_energy_dataset.csv')
+    parser.add_argument('--fold-hours', type=int, default=FOLD_HOURS, help='origins per fold (default: one week)')
+    parser.add_argument('--output', default=None, help='JSON file for the full report')
+    args = parser.parse_args()
+    if args.fold_hours < 1:
+        parser.error('--fold-hours must be at least 1')
+
+    start = time.perf_counter()
+    report = backtest(args.weights, args.data, args.fold_hours)
+    total = time.perf_counter() - start
+    horizon = report['horizons'][0]
+
+    print(f" {report['origins']} origins in {len(report['folds'])} folds, horizons {', '.join(report['horizons'])}")
+    print(f"\n {'fold':>4} {'start':<20} {'region':<6} {'origins':>7} {'sMAPE %':>8} {'MAE':>9} {'bias':>9}  ({horizon})")
+    for fold in report['folds']:
+        scores = fold['horizons'][horizon]
+        print(f" {fold['fold']:>4} {fold['start']:<20} {fold['region']:<6} {fold['origins']:>7} "
+              f"{scores['smape']:>8.2f} {scores['mae']:>9.2f} {scores['bias']:>9.2f}")
+    print(f"\n {'hour':>4} {'sMAPE %':>8} {'APE p50':>8} {'APE p90':>8}  ({horizon})")
+    for hour, scores in report['hour_of_day'].items():
+        scores = scores[horizon]
+        print(f" {hour:>4} {scores['smape']:>8.2f} {scores['ape_p50']:>8.2f} {scores['ape_p90']:>8.2f}")
+    for name in report['horizons']:
+        print(f"\n {name}: overall sMAPE {report['overall'][name]['smape']:.2f}%, "
+              f"test sMAPE {report['test'][name]['smape']:.2f}%")
+    print(f" Fold evaluation {report['evaluation_s'] * 1e3:.1f} ms, total {total:.2f}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f" Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""Benchmarks for the preprocessing, training, aggregation and API paths.
+
+Runs every stage on synthetic household data (1 month to 5 years of hourly readings)
+and synthetic participant counts (2 to 10k), and writes the timings as JSON.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --compare bench.json   # exit 1 on regressions
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+DATASET_SIZES = {'1m': 24 * 30, '6m': 24 * 182, '1y': 24 * 365, '5y': 24 * 365 * 5}
+PARTICIPANT_COUNTS = [2, 10, 100, 1000, 10000]
+METER_COUNTS = [1000, 10000, 100000]
+DEFAULT_THRESHOLD = 1.25
+WINDOW_SIZE = 72
+
+ELECTRICITY_COLS = ['Fans:Electricity [kW](Hourly)', 'Cooling:Electricity [kW](Hourly)',
+                    'Heating:Electricity [kW](Hourly)', 'InteriorLights:Electricity [kW](Hourly)',
+                    'InteriorEquipment:Electricity [kW](Hourly)']
+GAS_COLS = ['Heating:Gas [kW](Hourly)', 'InteriorEquipment:Gas [kW](Hourly)',
+            'Water Heater:WaterSystems:Gas [kW](Hourly)']
+
+
+def synthetic_household(hours, seed=0, node_id='Node_1', start='2023-01-01'):
+    """A household frame with the same columns as household_*_energy_dataset.csv."""
+    rng = np.random.default_rng(seed)
+    hour = np.arange(hours) % 24
+    daily = 1.0 + 0.5 * np.sin(2 * np.pi * (hour - 6) / 24) + 0.3 * ((hour >= 17) & (hour <= 21))
+    df = pd.DataFrame({'timestamp': pd.date_range(start, periods=hours, freq='h').astype(str)})
+    electricity = np.zeros(hours)
+    for col in ELECTRICITY_COLS:
+        values = np.abs(daily * rng.gamma(2.0, 1.0, hours))
+        df[col] = values
+        electricity += values
+    df.insert(1, 'Electricity:Facility [kW](Hourly)', np.round(electricity + rng.normal(0, 0.5, hours).clip(0), 2))
+    gas = np.zeros(hours)
+    for col in GAS_COLS:
+        values = np.abs(rng.gamma(3.0, 5.0, hours))
+        df[col] = values
+        gas += values
+    df.insert(7, 'Gas:Facility [kW](Hourly)', np.round(gas, 2))
+    df['temperature [°C]'] = 25 + 5 * np.sin(2 * np.pi * (hour - 14) / 24) + rng.normal(0, 1, hours)
+    df['Solar:ElectricityProduced [kW](Hourly)'] = np.clip(8 * np.sin(np.pi * (hour - 6) / 12), 0, None)
+    df['Class'] = 'Normal'
+    df['theft'] = 'Normal'
+    df['transaction_id'] = [f"0x{v:016x}" for v in rng.integers(0, 2 ** 63, hours)]
+    df['node_id'] = node_id
+    return df
+
+
+def measure(fn, min_time=0.2, max_repeats=50):
+    """Calls fn until min_time has elapsed (at least 3 times) and summarises the per-call seconds."""
+    fn()
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < 3 or (time.perf_counter() < deadline and len(samples) < max_repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {'min_s': min(samples), 'median_s': statistics.median(samples),
+            'mean_s': statistics.fmean(samples), 'repeats': len(samples)}
+
+
+def bench_preprocessing(results, sizes):
+    from features import engineer_features, make_targets, create_sequences, split_points, scale_inputs, \
+        flat_windows
+
+    for label, hours in sizes.items():
+        raw = synthetic_household(hours)
+        df, feature_cols, target_col = engineer_features(raw)
+        X_raw, y_raw = df[feature_cols].values, df[target_col].values
+        X, y = make_targets(X_raw, y_raw)
+        X_seq, _ = create_sequences(X, y, WINDOW_SIZE)
+        split1, split2 = split_points(len(X_seq))
+        _, X_scaled = scale_inputs(X, split1, WINDOW_SIZE)
+
+        results[f"preprocess.engineer_features[{label}]"] = measure(lambda: engineer_features(raw))
+        results[f"preprocess.make_targets[{label}]"] = measure(lambda: make_targets(X_raw, y_raw))
+        results[f"preprocess.create_sequences[{label}]"] = measure(lambda: create_sequences(X, y, WINDOW_SIZE))
+        results[f"preprocess.scale_inputs[{label}]"] = measure(lambda: scale_inputs(X, split1, WINDOW_SIZE))
+        results[f"preprocess.flat_windows_val[{label}]"] = measure(
+            lambda: flat_windows(X_scaled, split1, split2, WINDOW_SIZE))
+
+
+def bench_calibration(results, sizes):
+    from train_local_model import calibrate_predictions
+
+    rng = np.random.default_rng(1)
+    for label, hours in sizes.items():
+        n_test = max(hours * 15 // 100, 30)
+        y_true = rng.uniform(150, 350, n_test)
+        y_pred = y_true * rng.uniform(0.8, 1.1, n_test)
+        results[f"train.calibrate_predictions[{label}]"] = measure(
+            lambda: calibrate_predictions(y_pred, y_true), max_repeats=10)
+
+
+def bench_training(results):
+    """One student epoch and one teacher epoch on a month of data, through the tf.data pipeline."""
+    import tensorflow as tf
+    from features import engineer_features, make_targets, split_points, scale_inputs
+    from train_local_model import TEACHER_CONFIG, build_teacher, make_window_dataset
+    from tensorflow.keras.layers import Dense
+    from tensorflow.keras.models import Sequential
+
+    df, feature_cols, target_col = engineer_features(synthetic_household(DATASET_SIZES['1m']))
+    X, y = make_targets(df[feature_cols].values, df[target_col].values)
+    n_seq = len(X) - WINDOW_SIZE
+    split1, _ = split_points(n_seq)
+    _, X_scaled = scale_inputs(X, split1, WINDOW_SIZE)
+    X_tf = tf.constant(X_scaled)
+    targets = np.random.default_rng(2).uniform(0, 1, split1)
+
+    teacher = build_teacher(TEACHER_CONFIG, X_scaled.shape[-1])
+    teacher_ds = make_window_dataset(X_tf, targets, 0, split1, WINDOW_SIZE, 32, shuffle=True)
+    results["train.teacher_epoch[1m]"] = measure(lambda: teacher.fit(teacher_ds, epochs=1, verbose=0),
+                                                 max_repeats=3)
+
+    student = Sequential([Dense(32, activation='relu', input_shape=(WINDOW_SIZE * X_scaled.shape[-1],)),
+                          Dense(16, activation='relu'), Dense(8, activation='relu'), Dense(1)])
+    student.compile(optimizer='adam', loss='mae')
+    student_ds = make_window_dataset(X_tf, targets, 0, split1, WINDOW_SIZE, 32, shuffle=True, flatten=True)
+    results["train.student_epoch[1m]"] = measure(lambda: student.fit(student_ds, epochs=1, verbose=0),
+                                                 max_repeats=5)
+
+
+def bench_aggregation(results, participant_counts):
+    from aggregate import federated_average
+    from submit_weights import create_minimal_signature
+
+    logging.getLogger().setLevel(logging.WARNING)
+    rng = np.random.default_rng(3)
+    for n in participant_counts:
+        local_weights = rng.integers(-200000, 200000, size=(n, 11)).tolist()
+        results[f"aggregate.federated_average[{n}]"] = measure(lambda: federated_average(local_weights))
+
+    weights = {f"W{i}": rng.normal(0, 0.1, shape).astype(np.float32)
+               for i, shape in enumerate([(1944, 32), (32, 16), (16, 8), (8, 1)], 1)}
+    weights.update({f"b{i}": np.zeros(shape[1], np.float32)
+                    for i, shape in enumerate([(1944, 32), (32, 16), (16, 8), (8, 1)], 1)})
+    results["aggregate.create_minimal_signature"] = measure(lambda: create_minimal_signature(weights))
+
+    # Per-model weight loading for submit_weights/serving: np.load of each .npz vs. a mapped pack
+    import tempfile
+    from model_pack import ModelPack, build_pack
+    with tempfile.TemporaryDirectory() as tmp:
+        files = [os.path.join(tmp, f"local_model_weights_mlp_{i}.npz") for i in range(100)]
+        for path in files:
+            np.savez(path, **weights)
+        build_pack(os.path.join(tmp, 'models.pack'), files)
+        pack = ModelPack(os.path.join(tmp, 'models.pack'))
+        results["aggregate.load_weights_npz[100]"] = measure(lambda: [dict(np.load(path)) for path in files])
+        results["aggregate.load_weights_pack[100]"] = measure(lambda: [pack.weights(path) for path in files])
+
+
+def bench_anomaly(results, meter_counts):
+    """One hourly batch of readings across all meters through the streaming detector."""
+    from anomaly import StreamingDetector
+
+    rng = np.random.default_rng(5)
+    for n in meter_counts:
+        detector = StreamingDetector(capacity=n)
+        node_ids = [f"Node_{i}" for i in range(n)]
+        hours = [10 + rng.gamma(2.0, 1.0, n) for _ in range(48)]
+        for hour in hours[:24]:
+            detector.update(node_ids, hour, hour * 0.7)
+        # Bypass a few meters so the alert path is exercised as well
+        for hour in hours[24:]:
+            hour[:n // 100] *= 0.3
+        batches = iter(hours[24:] * 1000)
+
+        def step():
+            hour = next(batches)
+            detector.update(node_ids, hour, hour * 0.7)
+        stats = measure(step)
+        results[f"anomaly.update[{n}]"] = dict(stats, meters_per_s=round(n / stats['median_s']))
+
+
+def bench_ingest(results, sizes):
+    """Ingesting 10 households with 10% replayed rows, then time-range and full scans of one node."""
+    import tempfile
+    from ingest_store import IngestStore
+
+    for label, hours in sizes.items():
+        frames = [synthetic_household(hours, seed=i, node_id=f"Node_{i}") for i in range(10)]
+        df = pd.concat(frames, ignore_index=True)
+        df = pd.concat([df, df.sample(frac=0.1, random_state=0)], ignore_index=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            roots = iter(range(1000))
+
+            def ingest():
+                IngestStore(os.path.join(tmp, str(next(roots)))).ingest(df)
+            stats = measure(ingest, min_time=0, max_repeats=3)
+            results[f"ingest.ingest[{label}x10]"] = dict(stats, rows_per_s=round(len(df) / stats['median_s']))
+
+            store = IngestStore(os.path.join(tmp, 'scan'))
+            store.ingest(df)
+            week_start = frames[0]['timestamp'].iloc[hours // 2]
+            week_end = str(pd.Timestamp(week_start) + pd.Timedelta(days=7))
+            results[f"ingest.scan_week[{label}]"] = measure(lambda: store.scan('Node_0', week_start, week_end))
+            results[f"ingest.scan_all[{label}]"] = measure(lambda: store.scan('Node_0'))
+
+
+def bench_api(results):
+    """Flask endpoints through the test client, with the contract replaced by the in-memory stand-in."""
+    from local_chain import InMemoryFedContract
+
+    os.environ.setdefault("SEPOLIA_RPC_URL", "http://127.0.0.1:8545")
+    os.environ.setdefault("CONTRACT_ADDRESS", "0x8eaa1ceea2629d42765cbf9032981cef419a2a39")
+    import api
+
+    logging.getLogger().setLevel(logging.WARNING)
+    stub = InMemoryFedContract(owner='0xowner')
+    stub.global_model = np.random.default_rng(4).integers(-200000, 200000, 11).tolist()
+    api.contract = stub
+    client = api.app.test_client()
+
+    user = '0x' + '1' * 40
+    prosumer = api.get_billing_engine().addresses()[0]
+    for name, url in [('get_global_model', '/get-global-model'),
+                      ('get_prediction_24h', f'/get-prediction?period=24h&user_address={user}'),
+                      ('get_prediction_personal', f'/get-prediction?period=24h&user_address={prosumer}'),
+                      ('get_prediction_30d', '/get-prediction?period=30d'),
+                      ('get_regional_data', '/get-regional-data'),
+                      ('get_bill', f'/get-bill?user_address={prosumer}'),
+                      ('get_alerts', '/get-alerts?limit=50')]:
+        status = client.get(url).status_code
+        results[f"api.{name}"] = dict(measure(lambda: client.get(url)), status=status)
+
+    from forecast_scheduler import ForecastScheduler
+    scheduler = ForecastScheduler(api.get_model_registry())
+    results["api.forecast_refresh"] = measure(scheduler.refresh)
+
+    status = client.post('/bills/batch', json={}).status_code
+    results["api.bills_batch"] = dict(measure(lambda: client.post('/bills/batch', json={})), status=status)
+
+
+def compare(current, baseline, threshold):
+    """Benchmarks whose median got slower than threshold x the baseline median."""
+    regressions = []
+    for name, stats in current.items():
+        if name in baseline:
+            ratio = stats['median_s'] / max(baseline[name]['median_s'], 1e-12)
+            if ratio > threshold:
+                regressions.append((name, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the FedGrid pipeline stages and API.')
+    parser.add_argument('--output', default=None, help='JSON file for the results')
+    parser.add_argument('--compare', default=None, help='earlier results JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='slowdown ratio of the median that counts as a regression')
+    parser.add_argument('--sizes', nargs='+', default=list(DATASET_SIZES), choices=list(DATASET_SIZES))
+    parser.add_argument('--participants', type=int, nargs='+', default=PARTICIPANT_COUNTS)
+    parser.add_argument('--meters', type=int, nargs='+', default=METER_COUNTS)
+    parser.add_argument('--only', nargs='+', default=None,
+                        choices=['preprocess', 'calibration', 'training', 'aggregate', 'anomaly', 'ingest', 'api'])
+    parser.add_argument('--skip-training', action='store_true', help='skip the TensorFlow epoch benchmarks')
+    args = parser.parse_args()
+
+    sizes = {label: DATASET_SIZES[label] for label in args.sizes}
+    groups = args.only or ['preprocess', 'calibration', 'training', 'aggregate', 'anomaly', 'ingest', 'api']
+    if args.skip_training and 'training' in groups:
+        groups.remove('training')
+
+    results = {}
+    runners = {
+        'preprocess': lambda: bench_preprocessing(results, sizes),
+        'calibration': lambda: bench_calibration(results, sizes),
+        'training': lambda: bench_training(results),
+        'aggregate': lambda: bench_aggregation(results, args.participants),
+        'anomaly': lambda: bench_anomaly(results, args.meters),
+        'ingest': lambda: bench_ingest(results, sizes),
+        'api': lambda: bench_api(results),
+    }
+    for group in groups:
+        print(f" Running {group} benchmarks...")
+        runners[group]()
+
+    print("\n" + "=" * 70)
+    for name, stats in results.items():
+        rate = (f" {stats['meters_per_s']:>12,} meters/s" if 'meters_per_s' in stats else
+                f" {stats['rows_per_s']:>12,} rows/s" if 'rows_per_s' in stats else "")
+        print(f" {name:<50} {stats['median_s'] * 1e3:>12.3f} ms{rate}")
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for name, ratio in regressions:
+            print(f" REGRESSION {name}: {ratio:.2f}x slower than {args.compare}")
+        if regressions:
+            sys.exit(1)
+        print(f" No regressions beyond {args.threshold:.2f}x against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Import-time budget check for the API and CLI entry points.
+
+Imports each module in a fresh interpreter under `python -X importtime` and fails
+(exit 1) if its cumulative import time exceeds the budget, or if it pulls in one of
+the heavy dependencies that must only load on first use.
+
+    python check_import_time.py
+    python check_import_time.py --scale 2      # slower machine: double every budget
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Cold-start budget per module, in seconds (best of --repeats runs)
+BUDGETS = {
+    'api': 1.0,
+    'train_local_model': 1.0,
+    'train_households': 0.3,
+    'aggregate': 0.5,
+    'submit_weights': 0.5,
+    'simulate_rounds': 0.5,
+    'quantize_model': 1.0,
+    'forecast_scheduler': 1.0,
+    'model_pack': 0.3,
+    'anomaly': 0.5,
+    'round_coordinator': 0.5,
+    'sweep': 1.0,
+    'backtest': 1.0,
+    'receipt_tracker': 0.3,
+    'ingest_store': 0.5,
+    'loadtest': 0.5,
+}
+HEAVY_MODULES = ('tensorflow', 'web3', 'eth_account', 'sklearn', 'matplotlib')
+
+
+def import_profile(module):
+    """(cumulative seconds, set of top-level packages imported) for `import module` in a new process."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    cumulative, packages = None, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        packages.add(name.strip().split('.')[0])
+        if name.rstrip() == f" {module}":
+            cumulative = int(cumulative_us) / 1e6
+    return cumulative, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fail if module import times exceed their budgets.')
+    parser.add_argument('--modules', nargs='+', default=list(BUDGETS), choices=list(BUDGETS))
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply every budget by this factor')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    failures = []
+    print(f" {'module':<22} {'import s':>9} {'budget s':>9}  heavy imports")
+    for module in args.modules:
+        runs = [import_profile(module) for _ in range(args.repeats)]
+        seconds = min(run[0] for run in runs)
+        heavy = sorted(set(HEAVY_MODULES) & runs[0][1])
+        budget = BUDGETS[module] * args.scale
+        print(f" {module:<22} {seconds:>9.3f} {budget:>9.2f}  {', '.join(heavy) or '-'}")
+        if seconds > budget:
+            failures.append(f"{module} took {seconds:.3f}s to import (budget {budget:.2f}s)")
+        if heavy:
+            failures.append(f"{module} imports {', '.join(heavy)} at import time")
+
+    for failure in failures:
+        print(f" FAIL {failure}")
+    if failures:
+        sys.exit(1)
+    print(" All imports within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+TARGET_COL = 'Electricity:Facility [kW](Hourly)'
+
+# Labels, identifiers and the raw timestamp never become model inputs
+EXCLUDE_COLS = ['Class', 'theft', '0', 'timestamp', 'transaction_id', 'node_id']
+
+# Forecast horizons (hours summed) served by the API. Every horizon keeps the 24h
+# lead of the original target: the 24h horizon is exactly the 'sum of next 24 hours'.
+HORIZONS = {'24h': 24, '7d': 24 * 7, '30d': 24 * 30}
+TARGET_LEAD = 24
+# A horizon is only trained if the household still has this many windows for it
+MIN_HORIZON_SEQUENCES = 240
+
+
+def load_household(csv_path):
+    """A household CSV, or a node directory of the ingestion store (see ingest_store.py)."""
+    if os.path.isdir(csv_path):
+        from ingest_store import scan_node_dir
+        return scan_node_dir(csv_path)
+    return pd.read_csv(csv_path, on_bad_lines='skip')
+
+
+def engineer_features(df):
+    """Adds time, lag, rolling and peak features. Returns (df, feature_cols, target_col)."""
+    df = df.copy()
+
+    # Aggregate total electricity
+    energy_cols = [col for col in df.columns if 'Electricity' in col and 'Facility' not in col]
+    if len(energy_cols) > 0:
+        df['Total_Electricity'] = df[energy_cols].sum(axis=1)
+    else:
+        df['Total_Electricity'] = df[TARGET_COL]
+
+    # Time features
+    df['HourOfDay'] = np.arange(len(df)) % 24
+    df['DayOfWeek'] = (np.arange(len(df)) // 24) % 7
+    df['is_weekend'] = (df['DayOfWeek'] >= 5).astype(int)
+    df['hour_sin'] = np.sin(2 * np.pi * df['HourOfDay'] / 24)
+    df['hour_cos'] = np.cos(2 * np.pi * df['HourOfDay'] / 24)
+
+    # Lag features
+    df['lag_1'] = df['Total_Electricity'].shift(1)
+    df['lag_24'] = df['Total_Electricity'].shift(24)
+    df['lag_48'] = df['Total_Electricity'].shift(48)
+
+    # Rolling stats
+    df['rolling_mean_24'] = df['Total_Electricity'].shift(1).rolling(window=24, min_periods=1).mean()
+    df['rolling_std_24'] = df['Total_Electricity'].rolling(24, min_periods=1).std().fillna(0)
+    df['zscore_24'] = (df['Total_Electricity'] - df['rolling_mean_24']) / (df['rolling_std_24'] + 1e-6) #to detect unusually high load
+
+    # Rate of change
+    df['roc_1'] = df['Total_Electricity'] - df['lag_1']
+    df['roc_24'] = df['Total_Electricity'] - df['lag_24']
+
+    # Peak flags
+    df['is_morning_peak'] = ((df['HourOfDay'] >= 7) & (df['HourOfDay'] <= 9)).astype(int)
+    df['is_evening_peak'] = ((df['HourOfDay'] >= 17) & (df['HourOfDay'] <= 19)).astype(int)
+
+    feature_cols = [col for col in df.columns if col not in EXCLUDE_COLS and col != TARGET_COL]
+
+    # Fill and drop NaN
+    df = df.ffill().bfill().dropna()
+    return df, feature_cols, TARGET_COL
+
+
+def make_targets(X_raw, y_raw):
+    """Target: sum of next 24 hours. Returns the aligned (X, y)."""
+    y_seq = []
+    for i in range(len(X_raw) - 24):
+        y_seq.append(np.sum(y_raw[i+24:i+48]))
+    return X_raw[:-24], np.array(y_seq)
+
+
+def make_horizon_targets(X_raw, y_raw, hours):
+    """Column j is the sum of hours[j] hours starting TARGET_LEAD hours ahead.
+
+    Only rows where every horizon is fully observed are kept. Returns the aligned (X, Y).
+    """
+    cumulative = np.concatenate([[0.0], np.cumsum(y_raw, dtype=np.float64)])
+    n = max(len(y_raw) - TARGET_LEAD - max(hours) + 1, 0)
+    start = np.arange(n) + TARGET_LEAD
+    Y = np.stack([cumulative[start + h] - cumulative[start] for h in hours], axis=1)
+    return X_raw[:n], Y
+
+
+def feasible_horizons(n_rows, names=tuple(HORIZONS), window=72, min_sequences=MIN_HORIZON_SEQUENCES):
+    """The horizons a household with n_rows hourly readings has enough windows to learn."""
+    return [name for name in names
+            if n_rows - TARGET_LEAD - HORIZONS[name] + 1 - window >= min_sequences]
+
+
+def create_sequences(X, y, window=72):
+    """Windowed view over X: row k is X[k:k+window] and pairs with y[k+window]. No copy is made."""
+    X_win = np.lib.stride_tricks.sliding_window_view(X, window, axis=0)[:-1]
+    return X_win.transpose(0, 2, 1), y[window:]
+
+
+def prepare_household(csv_path, horizons=None):
+    """Loads a household CSV and returns its flat feature matrix, targets and feature names.
+
+    Without horizons the target is the original 24h sum (1-D). With a list of HORIZONS
+    names, y has one column per horizon.
+    """
+    df, feature_cols, target_col = engineer_features(load_household(csv_path))
+    if horizons:
+        X, y = make_horizon_targets(df[feature_cols].values, df[target_col].values,
+                                    [HORIZONS[name] for name in horizons])
+    else:
+        X, y = make_targets(df[feature_cols].values, df[target_col].values)
+    return X, y, feature_cols
+
+
+def split_points(n_sequences):
+    """70/15/15 chronological train/val/test boundaries over the sequence index."""
+    return int(0.7 * n_sequences), int(0.85 * n_sequences)
+
+
+def scale_inputs(X, split1, window):
+    """Fits a RobustScaler on the rows covered by the training windows and scales all of X to float32."""
+    # sklearn costs over a second to import; billing and serving never fit scalers
+    from sklearn.preprocessing import RobustScaler
+
+    scaler_X = RobustScaler()
+    scaler_X.fit(X[:split1 + window - 1])
+    return scaler_X, scaler_X.transform(X).astype(np.float32)
+
+
+def fit_target_scaler(y_train):
+    """MinMaxScaler over log1p of the training targets (one column per horizon)."""
+    from sklearn.preprocessing import MinMaxScaler
+
+    scaler_y = MinMaxScaler()
+    scaler_y.fit(np.log1p(y_train).reshape(len(y_train), -1))
+    return scaler_y
+
+
+def scale_targets(scaler_y, y):
+    """Scales 1-D targets or an (n, horizons) matrix, keeping the input's shape."""
+    y = np.asarray(y)
+    scaled = scaler_y.transform(np.log1p(y).reshape(len(y), -1)).astype(np.float32)
+    return scaled.flatten() if y.ndim == 1 else scaled
+
+
+def unscale_targets(scaler_y, y_scaled):
+    y_scaled = np.asarray(y_scaled)
+    y = np.expm1(scaler_y.inverse_transform(y_scaled.reshape(len(y_scaled), -1)))
+    return y.flatten() if y_scaled.ndim == 1 else y
+
+
+def flat_windows(X_scaled, start, stop, window):
+    """Student inputs for sequences [start, stop): each window flattened to window * features."""
+    X_win, _ = create_sequences(X_scaled, np.zeros(len(X_scaled)), window)
+    return X_win[start:stop].reshape(stop - start, -1)
+
+
+def scalers_path_for(weights_path):
+    """Sidecar next to a student .npz holding the scalers it was trained with."""
+    root, ext = os.path.splitext(weights_path)
+    return f"{root}_scalers{ext}"
+
+
+def artifact_horizons(weights_path):
+    """Horizon names a student was trained for, from its sidecar; None for a 24h-only legacy student."""
+    path = scalers_path_for(weights_path)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as sidecar:
+        return [str(name) for name in sidecar['horizons']] if 'horizons' in sidecar.files else None
+
+
+def forecast_quality(y_true, y_pred):
+    """sMAPE (%) and the share of forecasts within 10% of the actual value (%), per horizon column."""
+    y_true, y_pred = np.asarray(y_true, dtype=np.float64), np.asarray(y_pred, dtype=np.float64)
+    smape = 100 * np.mean(2 * np.abs(y_pred - y_true) / (np.abs(y_true) + np.abs(y_pred) + 1e-8), axis=0)
+    within = 100 * np.mean(np.abs(y_pred - y_true) <= 0.1 * np.abs(y_true), axis=0)
+    return {'smape': smape, 'within_10pct': within}
+
+
+def save_scalers(path, scaler_X, scaler_y, horizons=None, **quality):
+    """Stores the fitted scaler parameters, horizons and the student's test quality for serving."""
+    extra = {'horizons': np.array(horizons)} if horizons else {}
+    np.savez(path, x_center=scaler_X.center_, x_scale=scaler_X.scale_,
+             y_min=scaler_y.min_, y_scale=scaler_y.scale_,
+             **{key: np.asarray(value, dtype=np.float64) for key, value in quality.items()}, **extra)
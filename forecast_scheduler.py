@@ -0,0 +1,214 @@
+"""Precomputes every household's forecasts so API requests only read a cache.
+
+Forecasts change only when new hourly readings arrive or the models are updated.
+The scheduler therefore recomputes all households at the top of each hour and
+whenever a GlobalModelUpdated event is seen. It runs one batched forward pass per
+group of same-shaped students and publishes the results to the registry as a
+single snapshot swap.
+
+Changed models are loaded on the scheduler's thread while the old version keeps
+serving. The forward pass doubles as a smoke inference: a household whose new
+model fails to load or forecasts anything but finite, non-negative kWh keeps its
+previous forecast, and the rest of the new version is swapped in.
+
+    python forecast_scheduler.py --once     # one refresh, printed as a table
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from model_registry import ModelRegistry, ServedVersion
+from quantize_model import LAYERS, ACTIVATIONS
+
+# How often to check for GlobalModelUpdated events between hourly refreshes
+FORECAST_EVENT_POLL_SECONDS = float(os.environ.get("FORECAST_EVENT_POLL_SECONDS", "15"))
+
+
+def batched_predict(models):
+    """Outputs of predict() for each model's latest window, one stacked matmul per hidden layer.
+
+    Models are grouped by weight shapes (students with different horizon counts can't be stacked).
+    The first layer holds nearly all of the weights, so it runs per model on its own (possibly
+    memory-mapped) W1 rather than on a stacked copy of every household's.
+    """
+    outputs = [None] * len(models)
+    groups = {}
+    for i, model in enumerate(models):
+        groups.setdefault(tuple(w.shape for w in model.weights.values()), []).append(i)
+    for indices in groups.values():
+        group = [models[i] for i in indices]
+        h = None
+        for layer, activation in zip(LAYERS, ACTIVATIONS):
+            if h is None:
+                h = np.stack([m.latest_window @ m.weights[f"W{layer}"] + m.weights[f"b{layer}"]
+                              for m in group])  # (households, 1, units)
+            else:
+                W = np.stack([m.weights[f"W{layer}"] for m in group])
+                b = np.stack([m.weights[f"b{layer}"] for m in group])[:, None, :]
+                h = np.matmul(h, W) + b
+            if activation == 'relu':
+                h = np.maximum(h, 0)
+        y_min = np.stack([m.y_min for m in group])
+        y_scale = np.stack([m.y_scale for m in group])
+        y = np.expm1((h[:, 0, :] - y_min) / y_scale)
+        for i, row in zip(indices, y):
+            outputs[i] = row
+    return outputs
+
+
+def seconds_until_next_hour(now=None):
+    now = time.time() if now is None else now
+    return 3600 - now % 3600
+
+
+class ForecastScheduler:
+    """Background thread that keeps the registry's published forecasts current.
+
+    events() is polled every event_poll_seconds and should return True when the global
+    model has been updated since the previous call.
+    """
+
+    def __init__(self, registry, events=None, event_poll_seconds=FORECAST_EVENT_POLL_SECONDS):
+        self.registry = registry
+        self.events = events
+        self.event_poll_seconds = event_poll_seconds
+        self.last_refresh_at = None
+        self.last_duration = None
+        self.refreshes = 0
+        self.rejected = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self, reason="manual"):
+        """Recomputes every household's forecasts and swaps them in as a new version. Returns the forecasts."""
+        with self._refresh_lock:
+            return self._refresh(reason)
+
+    def _refresh(self, reason):
+        start = time.perf_counter()
+        previous = self.registry.served()
+        staged, rejected = {}, {}
+        for address in self.registry.addresses():
+            try:
+                staged[address] = self.registry.stage(address)
+            except Exception as e:
+                rejected[address] = f"load failed: {e}"
+        addresses = list(staged)
+        outputs = batched_predict([staged[address][0] for address in addresses])
+
+        forecasts, digests = {}, {}
+        for address, row in zip(addresses, outputs):
+            model = staged[address][0]
+            if row.shape != (len(model.horizons),) or not np.all(np.isfinite(row)) or np.any(row < 0):
+                rejected[address] = f"smoke inference gave {row.tolist()}"
+                del staged[address]
+                continue
+            forecasts[address] = model.forecast(row)
+            digests[address] = model.digest
+        for address, error in rejected.items():
+            logging.error(f"Keeping the previous model for {address}: {error}")
+            if previous is not None and address in previous.forecasts:
+                forecasts[address] = previous.forecasts[address]
+                digests[address] = previous.digests[address]
+
+        served = ServedVersion(forecasts, digests)
+        self.registry.swap(staged, served)
+        self.rejected = rejected
+        self.last_duration = time.perf_counter() - start
+        self.last_refresh_at = time.time()
+        self.refreshes += 1
+        logging.info(f"Forecasts refreshed for {len(forecasts)} households in {self.last_duration * 1e3:.1f} ms "
+                     f"({reason}), model version {served.version}")
+        return forecasts
+
+    def current(self):
+        """The live ServedVersion, refreshing it first if nothing keeps it current.
+
+        Without the background thread, the first caller to find no version, or one published
+        before the current hour, refreshes it. Callers that arrive meanwhile keep using the
+        old version and only wait when there is none yet.
+        """
+        served = self.registry.served()
+        if served is not None and (self._thread is not None
+                                   or served.published_at >= time.time() - time.time() % 3600):
+            return served
+        if self._refresh_lock.acquire(blocking=served is None):
+            try:
+                if self.registry.served() is served:
+                    self._refresh("on demand")
+            finally:
+                self._refresh_lock.release()
+        return self.registry.served()
+
+    def _run(self):
+        self._safe_refresh("startup")
+        next_hourly = time.time() + seconds_until_next_hour()
+        while not self._stop.is_set():
+            timeout = next_hourly - time.time()
+            if self.events is not None:
+                timeout = min(timeout, self.event_poll_seconds)
+            if self._stop.wait(max(timeout, 0)):
+                break
+            if time.time() >= next_hourly:
+                next_hourly = time.time() + seconds_until_next_hour()
+                self._safe_refresh("hourly")
+            elif self.events is not None and self._safe_poll():
+                self._safe_refresh("GlobalModelUpdated")
+
+    def _safe_refresh(self, reason):
+        try:
+            self.refresh(reason)
+        except Exception as e:
+            # Keep serving the previous snapshot; the next tick tries again
+            logging.error(f"Forecast refresh failed ({reason}): {e}")
+
+    def _safe_poll(self):
+        try:
+            return self.events()
+        except Exception as e:
+            logging.warning(f"Polling for GlobalModelUpdated failed: {e}")
+            return False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="forecast-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute household forecasts.")
+    parser.add_argument('--once', action='store_true', help='run a single refresh and print it')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    scheduler = ForecastScheduler(ModelRegistry())
+    if not args.once:
+        scheduler.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            scheduler.stop()
+        return
+
+    snapshot = scheduler.refresh()
+    warm = scheduler.refresh()
+    print(f" {'address':<44} {'24h':>10} {'7d':>10} {'30d':>10}")
+    for address, forecast in snapshot.items():
+        print(f" {address:<44} " + " ".join(f"{forecast[p]['value']:>10.1f}" for p in ('24h', '7d', '30d')))
+    print(f" Refresh with cached models: {scheduler.last_duration * 1e3:.2f} ms for {len(warm)} households")
+
+
+if __name__ == "__main__":
+    main()
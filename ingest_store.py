@@ -0,0 +1,383 @@
+"""Deduplicating ingestion store for household meter readings.
+
+Readings are partitioned by node_id and calendar month into columnar part files:
+
+    <root>/<node_id>/<YYYY-MM>/part-<n>.npz     one array per CSV column, sorted by time
+
+Every reading carries a transaction_id. An on-disk open-addressing hash table of
+64-bit transaction keys (<root>/_index/transactions.npy, memory-mapped) is probed
+and updated for a whole batch at once. A replayed or duplicated upload therefore
+adds nothing, whether it repeats rows already stored or rows earlier in the same file.
+
+Time-range scans only open the month partitions that overlap the range, and only
+the requested columns. Inside a part they take a binary-searched slice of the
+sorted timestamps. A node's directory can be passed anywhere a household CSV is
+expected (features.load_household), so training, the backtest and the model
+registry can read from the store directly.
+
+    python ingest_store.py ingest household_*_energy_dataset.csv
+    python ingest_store.py scan Node_1 --start 2023-01-10 --end 2023-01-17
+    python ingest_store.py compact
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+INGEST_STORE_DIR = os.environ.get("INGEST_STORE_DIR", "ingest_store")
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+INDEX_INITIAL_CAPACITY = 1 << 16
+# The hash table is doubled before it gets fuller than this
+INDEX_MAX_LOAD = 0.5
+EMPTY = np.uint64(0)
+# Stands in for a transaction key that happens to be 0, which marks an empty slot
+ZERO_KEY = np.uint64(0x9E3779B97F4A7C15)
+_HEX_ID = re.compile(r'^(0x)?[0-9a-fA-F]{1,16}$')
+
+
+def transaction_keys(transaction_ids):
+    """uint64 key per transaction id: the id itself for hex ids of up to 64 bits, else a blake2b digest."""
+    keys = np.fromiter(
+        (int(tx, 16) if _HEX_ID.match(tx) else
+         int.from_bytes(hashlib.blake2b(tx.encode(), digest_size=8).digest(), 'little')
+         for tx in map(str, transaction_ids)), dtype=np.uint64, count=len(transaction_ids))
+    keys[keys == EMPTY] = ZERO_KEY
+    return keys
+
+
+def _mix(keys):
+    """splitmix64 finalizer, so sequential ids still spread over the table."""
+    with np.errstate(over='ignore'):
+        z = keys ^ (keys >> np.uint64(30))
+        z = z * np.uint64(0xBF58476D1CE4E5B9)
+        z = z ^ (z >> np.uint64(27))
+        z = z * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def _probe(table, keys):
+    """Which keys are in the table, probing all of them in lockstep."""
+    mask = np.uint64(len(table) - 1)
+    slots = (_mix(keys) & mask).astype(np.int64)
+    found = np.zeros(len(keys), dtype=bool)
+    active = np.arange(len(keys))
+    while active.size:
+        current = table[slots[active]]
+        found[active[current == keys[active]]] = True
+        active = active[(current != keys[active]) & (current != EMPTY)]
+        slots[active] = (slots[active] + 1) & int(mask)
+    return found
+
+
+def _insert(table, keys):
+    """Inserts distinct non-zero keys with linear probing. Returns which of them were not in the table yet.
+
+    All keys probe in lockstep: each round compares every unresolved key with its current slot,
+    lets the first key aimed at each empty slot claim it, and moves keys facing another key on.
+    """
+    mask = np.uint64(len(table) - 1)
+    slots = (_mix(keys) & mask).astype(np.int64)
+    inserted = np.zeros(len(keys), dtype=bool)
+    active = np.arange(len(keys))
+    while active.size:
+        current = table[slots[active]]
+        found = current == keys[active]
+        empty = current == EMPTY
+        candidates = active[empty]
+        _, first = np.unique(slots[candidates], return_index=True)
+        winners = candidates[first]
+        table[slots[winners]] = keys[winners]
+        inserted[winners] = True
+        claimed = np.zeros(len(keys), dtype=bool)
+        claimed[winners] = True
+        # Keys that lost a claim retry the same slot and see the winner there next round
+        occupied = ~found & ~empty
+        slots[active[occupied]] = (slots[active[occupied]] + 1) & int(mask)
+        active = active[~found & ~claimed[active]]
+    return inserted
+
+
+class TransactionIndex:
+    """Set of transaction keys seen by the store, as a memory-mapped hash table."""
+
+    def __init__(self, path, capacity=INDEX_INITIAL_CAPACITY):
+        self.path = path
+        if os.path.exists(path):
+            self.table = np.load(path, mmap_mode='r+')
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.table = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint64, shape=(capacity,))
+        self.count = int(np.count_nonzero(self.table))
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self, needed):
+        capacity = len(self.table)
+        while needed > capacity * INDEX_MAX_LOAD:
+            capacity *= 2
+        if capacity == len(self.table):
+            return
+        tmp = self.path + '.tmp'
+        grown = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.uint64, shape=(capacity,))
+        _insert(grown, np.asarray(self.table[self.table != EMPTY]))
+        grown.flush()
+        del grown
+        self.table.flush()
+        del self.table
+        os.replace(tmp, self.path)
+        self.table = np.load(self.path, mmap_mode='r+')
+
+    def contains(self, keys):
+        return _probe(self.table, np.asarray(keys, dtype=np.uint64))
+
+    def add(self, keys):
+        """Adds a batch of keys; returns how many were new."""
+        unique = np.unique(np.asarray(keys, dtype=np.uint64))
+        self._grow(self.count + len(unique))
+        added = int(_insert(self.table, unique).sum())
+        self.count += added
+        return added
+
+    def flush(self):
+        self.table.flush()
+
+
+def _node_dirname(node_id):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(node_id))
+
+
+def _to_epoch_seconds(timestamps):
+    return pd.to_datetime(timestamps, errors='coerce').to_numpy('datetime64[s]').astype(np.int64)
+
+
+def _month(epoch_seconds):
+    return np.datetime_as_string(epoch_seconds.astype('datetime64[s]'), unit='M')
+
+
+def _part_names(directory):
+    return sorted(name for name in os.listdir(directory)
+                  if name.startswith('part-') and name.endswith('.npz') and not name.endswith('.tmp.npz'))
+
+
+def _write_part(directory, columns):
+    """Writes one part file atomically; returns its path."""
+    os.makedirs(directory, exist_ok=True)
+    number = 1 + max((int(name[5:-4]) for name in _part_names(directory)), default=-1)
+    path = os.path.join(directory, f"part-{number:05d}.npz")
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, **columns)
+    os.replace(tmp, path)
+    return path
+
+
+def _read_parts(month_dir, columns, start, end):
+    """Columns of every part in a month partition, restricted to start <= timestamp < end."""
+    pieces = []
+    for name in _part_names(month_dir):
+        with np.load(os.path.join(month_dir, name)) as part:
+            timestamps = part['timestamp']
+            lo = 0 if start is None else np.searchsorted(timestamps, start, 'left')
+            hi = len(timestamps) if end is None else np.searchsorted(timestamps, end, 'left')
+            if hi > lo:
+                pieces.append({col: part[col][lo:hi] for col in (columns or part.files)})
+    return pieces
+
+
+def partition_stamp(node_dir):
+    """Changes whenever a part is added to or removed from the node (each month directory's mtime)."""
+    try:
+        return tuple((name, os.stat(os.path.join(node_dir, name)).st_mtime_ns)
+                     for name in sorted(os.listdir(node_dir)))
+    except OSError:
+        return None
+
+
+def scan_node_dir(node_dir, start=None, end=None, columns=None):
+    """Readings of one node directory in timestamp order, as a frame shaped like the household CSV.
+
+    start/end (anything pandas parses) bound a half-open time range; columns limits what is read.
+    """
+    start_s = None if start is None else int(_to_epoch_seconds([start])[0])
+    end_s = None if end is None else int(_to_epoch_seconds([end])[0])
+    columns = None if columns is None else ['timestamp'] + [col for col in columns if col != 'timestamp']
+    pieces = []
+    for month in sorted(os.listdir(node_dir)):
+        month_dir = os.path.join(node_dir, month)
+        if not os.path.isdir(month_dir):
+            continue
+        month_start = np.datetime64(month, 's').astype(np.int64)
+        month_end = (np.datetime64(month, 'M') + 1).astype('datetime64[s]').astype(np.int64)
+        if (end_s is not None and month_start >= end_s) or (start_s is not None and month_end <= start_s):
+            continue
+        pieces.extend(_read_parts(month_dir, columns, start_s, end_s))
+    if not pieces:
+        return pd.DataFrame(columns=columns or ['timestamp'])
+
+    data = {col: np.concatenate([piece[col] for piece in pieces]) for col in pieces[0]}
+    order = np.argsort(data['timestamp'], kind='stable')
+    df = pd.DataFrame({col: values[order] for col, values in data.items()})
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s').dt.strftime(TIMESTAMP_FORMAT)
+    return df
+
+
+class IngestStore:
+    """Node- and month-partitioned reading store that drops rows whose transaction_id it has already seen."""
+
+    def __init__(self, root=INGEST_STORE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.index = TransactionIndex(os.path.join(root, '_index', 'transactions.npy'))
+        self._schema_path = os.path.join(root, 'schema.json')
+        self.schema = None
+        if os.path.exists(self._schema_path):
+            with open(self._schema_path) as f:
+                self.schema = json.load(f)
+
+    def node_dir(self, node_id):
+        return os.path.join(self.root, _node_dirname(node_id))
+
+    def nodes(self):
+        return sorted(name for name in os.listdir(self.root)
+                      if not name.startswith('_') and os.path.isdir(os.path.join(self.root, name)))
+
+    def _columns(self, df):
+        """Column arrays in the store's schema: epoch seconds, float64 numbers and fixed-width strings."""
+        if self.schema is None:
+            self.schema = {col: 'timestamp' if col == 'timestamp' else
+                           'float' if pd.api.types.is_numeric_dtype(df[col]) else 'str' for col in df.columns}
+            with open(self._schema_path, 'w') as f:
+                json.dump(self.schema, f, indent=2)
+        columns = {}
+        for col, kind in self.schema.items():
+            values = df[col] if col in df.columns else pd.Series(np.nan if kind == 'float' else '', index=df.index)
+            if kind == 'timestamp':
+                columns[col] = _to_epoch_seconds(values)
+            elif kind == 'float':
+                columns[col] = pd.to_numeric(values, errors='coerce').to_numpy(np.float64)
+            else:
+                columns[col] = values.fillna('').astype(str).to_numpy().astype(str)
+        return columns
+
+    def ingest(self, df):
+        """Stores the readings of a frame shaped like the household CSVs that are not already stored.
+
+        Rows without a parsable timestamp, a transaction_id or a node_id are rejected.
+        Returns counts of rows read, stored, duplicate and rejected, and the partitions written.
+        """
+        df = df.reset_index(drop=True)
+        valid = (pd.to_datetime(df['timestamp'], errors='coerce').notna()
+                 & df['transaction_id'].notna() & df['node_id'].notna()).to_numpy()
+        df = df[valid]
+        keys = transaction_keys(df['transaction_id'].to_numpy())
+        new = np.zeros(len(keys), dtype=bool)
+        new[np.unique(keys, return_index=True)[1]] = True
+        new &= ~self.index.contains(keys)
+        df = df[new]
+
+        columns = self._columns(df)
+        node_ids = columns['node_id']
+        months = _month(columns['timestamp'])
+        # One sort groups the rows by partition, each already in time order
+        order = np.lexsort((columns['timestamp'], months, node_ids))
+        node_ids, months = node_ids[order], months[order]
+        bounds = np.flatnonzero((node_ids[1:] != node_ids[:-1]) | (months[1:] != months[:-1])) + 1
+        written = []
+        for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(order)]):
+            if hi > lo:
+                rows = order[lo:hi]
+                written.append(_write_part(os.path.join(self.node_dir(node_ids[lo]), months[lo]),
+                                           {col: values[rows] for col, values in columns.items()}))
+        # Keys are only added once their parts are written, so a crash in between can only
+        # leave rows that are stored again on retry; compact() drops such duplicates
+        self.index.add(keys[new])
+        self.index.flush()
+        return {'rows': int(len(valid)), 'stored': int(new.sum()), 'duplicates': int((~new).sum()),
+                'rejected': int((~valid).sum()), 'partitions': written}
+
+    def ingest_csv(self, csv_path):
+        return self.ingest(pd.read_csv(csv_path, on_bad_lines='skip'))
+
+    def scan(self, node_id, start=None, end=None, columns=None):
+        """A node's readings with start <= timestamp < end, in timestamp order."""
+        return scan_node_dir(self.node_dir(node_id), start, end, columns)
+
+    def compact(self, node_id=None):
+        """Merges each month partition's parts into one, dropping any repeated transaction_id.
+
+        Returns the number of partitions rewritten.
+        """
+        rewritten = 0
+        for node in ([_node_dirname(node_id)] if node_id is not None else self.nodes()):
+            node_dir = os.path.join(self.root, node)
+            for month in sorted(os.listdir(node_dir)):
+                month_dir = os.path.join(node_dir, month)
+                parts = _part_names(month_dir)
+                if len(parts) < 2:
+                    continue
+                pieces = _read_parts(month_dir, None, None, None)
+                data = {col: np.concatenate([piece[col] for piece in pieces]) for col in pieces[0]}
+                _, keep = np.unique(transaction_keys(data['transaction_id']), return_index=True)
+                keep = keep[np.argsort(data['timestamp'][keep], kind='stable')]
+                _write_part(month_dir, {col: values[keep] for col, values in data.items()})
+                for name in parts:
+                    os.remove(os.path.join(month_dir, name))
+                rewritten += 1
+        return rewritten
+
+    def summary(self):
+        nodes = {}
+        for node in self.nodes():
+            node_dir = os.path.join(self.root, node)
+            parts = [os.path.join(node_dir, month, name) for month in os.listdir(node_dir)
+                     for name in _part_names(os.path.join(node_dir, month))]
+            nodes[node] = {'parts': len(parts), 'bytes': sum(os.path.getsize(p) for p in parts)}
+        return {'transactions': len(self.index), 'index_slots': len(self.index.table), 'nodes': nodes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Deduplicating, node-partitioned store for meter readings.')
+    parser.add_argument('--root', default=INGEST_STORE_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest = commands.add_parser('ingest', help='add household CSVs, skipping known transaction_ids')
+    ingest.add_argument('csv', nargs='+')
+    scan = commands.add_parser('scan', help='print a time range of one node')
+    scan.add_argument('node_id')
+    scan.add_argument('--start', default=None)
+    scan.add_argument('--end', default=None)
+    scan.add_argument('--columns', nargs='+', default=None)
+    scan.add_argument('--output', default=None, help='write the range as CSV instead of printing it')
+    commands.add_parser('compact', help='merge each partition into a single part')
+    commands.add_parser('summary')
+    args = parser.parse_args()
+
+    store = IngestStore(args.root)
+    if args.command == 'ingest':
+        for path in args.csv:
+            start = time.perf_counter()
+            result = store.ingest_csv(path)
+            print(f" {path}: {result['stored']} stored, {result['duplicates']} duplicates, "
+                  f"{result['rejected']} rejected of {result['rows']} rows "
+                  f"({len(result['partitions'])} parts, {time.perf_counter() - start:.2f}s)")
+    elif args.command == 'scan':
+        start = time.perf_counter()
+        df = store.scan(args.node_id, args.start, args.end, args.columns)
+        elapsed = time.perf_counter() - start
+        if args.output:
+            df.to_csv(args.output, index=False)
+        else:
+            print(df.to_string(max_rows=20))
+        print(f" {len(df)} readings in {elapsed * 1e3:.1f} ms")
+    elif args.command == 'compact':
+        print(f" {store.compact()} partitions compacted")
+    else:
+        print(json.dumps(store.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Lightweight stage timing and memory tracing for the training pipeline.
+
+Each stage appends one JSON line to the trace file with its wall and CPU time,
+resident memory and, when enabled, the tracemalloc peak for that stage.
+
+    TRAINING_TRACE=path.jsonl     where to append the trace (default training_trace.jsonl, '' disables)
+    TRAINING_TRACEMALLOC=1        also record Python allocation peaks per stage (slower)
+    TRAINING_PROFILE=path.prof    dump a cProfile of the whole run
+"""
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_TRACE = 'training_trace.jsonl'
+
+
+def current_rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+class Trace:
+    """Writes stage and epoch events for one run to a JSONL file."""
+
+    def __init__(self, path=None, trace_malloc=None, **context):
+        self.path = os.environ.get('TRAINING_TRACE', DEFAULT_TRACE) if path is None else path
+        if trace_malloc is None:
+            trace_malloc = os.environ.get('TRAINING_TRACEMALLOC', '') not in ('', '0')
+        self.trace_malloc = trace_malloc
+        self.context = dict(run_id=uuid.uuid4().hex[:12], pid=os.getpid(), **context)
+        self.stages = {}
+        if self.trace_malloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def write(self, event, **fields):
+        record = dict(self.context, event=event, time=time.time(), **fields)
+        if self.path:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record, default=float) + '\n')
+        return record
+
+    @contextmanager
+    def stage(self, name, **fields):
+        if self.trace_malloc:
+            tracemalloc.reset_peak()
+        rss_before = current_rss_bytes()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            record = dict(
+                stage=name,
+                wall_s=wall,
+                cpu_s=time.process_time() - cpu_start,
+                rss_before_bytes=rss_before,
+                rss_after_bytes=current_rss_bytes(),
+                peak_rss_bytes=peak_rss_bytes(),
+                **fields,
+            )
+            if self.trace_malloc:
+                record['tracemalloc_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            self.stages[name] = wall
+            self.write('stage', **record)
+
+    def epoch_callback(self, stage):
+        """Keras callback that records the duration and logs of every epoch of a fit()."""
+        import tensorflow as tf
+
+        trace = self
+
+        class EpochTimer(tf.keras.callbacks.Callback):
+            def on_epoch_begin(self, epoch, logs=None):
+                self._start = time.perf_counter()
+
+            def on_epoch_end(self, epoch, logs=None):
+                trace.write('epoch', stage=stage, epoch=epoch, wall_s=time.perf_counter() - self._start,
+                            **{k: float(v) for k, v in (logs or {}).items()})
+
+        return EpochTimer()
+
+
+@contextmanager
+def profiled(path=None):
+    """Runs the block under cProfile when TRAINING_PROFILE (or path) is set."""
+    path = path or os.environ.get('TRAINING_PROFILE')
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f"cProfile written to {path}")
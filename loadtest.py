@@ -0,0 +1,334 @@
+"""Load generator and traffic replayer for the Flask API.
+
+Sends a request mix to the API at a fixed rate (open loop) or as fast as the workers
+allow (closed loop, --rate 0), then reports throughput and latency percentiles per
+endpoint. By default it serves api.app in-process on a free port, with the contract
+replaced by the in-memory stand-in (optionally slowed by --rpc-latency-ms), so no
+node is needed. The forecast scheduler runs as it does under `python api.py`.
+--url targets an instance that is already running instead.
+
+Traffic is either synthesized from the dashboard's usage (prosumers loading their
+forecast and bill, operators the regional view, the model page the global weights;
+see DEFAULT_MIX) or replayed from a JSONL log with one request per line:
+
+    {"method": "GET", "path": "/get-prediction?period=24h&user_address=0x...", "t": 0.25}
+
+"t" (seconds from the start) is optional and only used to keep the recorded pacing
+when no --rate is given. A POST line may carry "body". In open loop, latency is measured
+from each request's scheduled send time, so queueing behind slow responses is counted.
+
+    python loadtest.py --rate 200 --concurrency 16 --duration 30 --output load.json
+    python loadtest.py --rate 0 --concurrency 8 --requests 5000                 # max throughput
+    python loadtest.py --replay traffic.jsonl --speed 2 --compare load.json
+    python loadtest.py --record traffic.jsonl --duration 60                     # also save the mix
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import numpy as np
+
+# Relative share of each request kind in synthesized traffic
+DEFAULT_MIX = {
+    'prediction_24h': 30,
+    'prediction_7d': 12,
+    'prediction_30d': 8,
+    'bill': 20,
+    'regional_data': 15,
+    'global_model': 15,
+}
+# Share of prediction requests from wallets that are not registered prosumers
+ANONYMOUS_FRACTION = 0.3
+DEFAULT_THRESHOLD = 1.25
+PERCENTILES = (50, 95, 99)
+
+
+def synthesize(n, mix=DEFAULT_MIX, prosumers=(), rate=None, seed=0):
+    """n request dicts drawn from the mix, timed at `rate` per second when given."""
+    rng = random.Random(seed)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=n)
+    anonymous = [f"0x{rng.getrandbits(160):040x}" for _ in range(16)]
+    prosumers = list(prosumers) or anonymous
+    requests = []
+    for i, kind in enumerate(kinds):
+        if kind.startswith('prediction_'):
+            wallet = rng.choice(anonymous if rng.random() < ANONYMOUS_FRACTION else prosumers)
+            path = f"/get-prediction?period={kind.split('_')[1]}&user_address={wallet}"
+        elif kind == 'bill':
+            path = f"/get-bill?user_address={rng.choice(prosumers)}"
+        elif kind == 'regional_data':
+            path = '/get-regional-data'
+        elif kind == 'global_model':
+            path = '/get-global-model'
+        else:
+            raise ValueError(f"unknown request kind {kind!r} (use one of {', '.join(DEFAULT_MIX)})")
+        request = {'method': 'GET', 'path': path}
+        if rate:
+            request['t'] = round(i / rate, 6)
+        requests.append(request)
+    return requests
+
+
+def load_log(path):
+    """Request dicts from a JSONL log; lines need at least a path."""
+    requests = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if not isinstance(request, dict) or not str(request.get('path', '')).startswith('/'):
+                raise ValueError(f"{path}:{number} is not a request line (needs a 'path' starting with '/')")
+            request.setdefault('method', 'POST' if 'body' in request else 'GET')
+            requests.append(request)
+    return requests
+
+
+def endpoint(request):
+    return f"{request['method'].upper()} {request['path'].split('?')[0]}"
+
+
+class SlowContract:
+    """The in-memory contract with a fixed delay on every call, standing in for a remote node."""
+
+    def __init__(self, contract, latency_s):
+        self._contract = contract
+        self._latency_s = latency_s
+        self.functions = self
+        self.events = contract.events
+
+    def __getattr__(self, name):
+        bound = getattr(self._contract.functions, name)
+        latency_s = self._latency_s
+
+        class _Call:
+            def __init__(self, *args):
+                self._call = bound(*args)
+
+            def call(self, tx=None):
+                time.sleep(latency_s)
+                return self._call.call(tx)
+        return _Call
+
+
+def start_local_api(rpc_latency_s=0.0, scheduler=True):
+    """Serves api.app on a free local port against the in-memory contract. Returns (base_url, server)."""
+    from werkzeug.serving import make_server
+    from local_chain import InMemoryFedContract, participant_address
+
+    os.environ.setdefault("SEPOLIA_RPC_URL", "http://127.0.0.1:8545")
+    os.environ.setdefault("CONTRACT_ADDRESS", "0x8eaa1ceea2629d42765cbf9032981cef419a2a39")
+    import api
+
+    for name in ('werkzeug', None):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    stub = InMemoryFedContract(owner=participant_address('owner'))
+    stub.global_model = np.random.default_rng(4).integers(-200000, 200000, 11).tolist()
+    api.contract = SlowContract(stub, rpc_latency_s) if rpc_latency_s else stub
+    if scheduler:
+        api.start_forecast_scheduler()
+        api.get_forecast_scheduler().current()
+    server = make_server('127.0.0.1', 0, api.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='loadtest-api', daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+class _Worker(threading.Thread):
+    """Sends requests from the queue over one keep-alive connection."""
+
+    def __init__(self, base_url, work, results, timeout):
+        super().__init__(daemon=True)
+        parts = urlsplit(base_url)
+        self._connect = lambda: (http.client.HTTPSConnection if parts.scheme == 'https' else
+                                 http.client.HTTPConnection)(parts.netloc, timeout=timeout)
+        self._prefix = parts.path.rstrip('/')
+        self.work = work
+        self.results = results
+
+    def run(self):
+        connection = self._connect()
+        while True:
+            item = self.work.get()
+            if item is None:
+                break
+            request, scheduled = item
+            scheduled = time.perf_counter() if scheduled is None else scheduled
+            body = request.get('body')
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            try:
+                connection.request(request['method'].upper(), self._prefix + request['path'],
+                                   body=None if body is None else json.dumps(body), headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = self._connect()
+                status = 0
+            self.results.append((endpoint(request), status, time.perf_counter() - scheduled))
+        connection.close()
+
+
+def run(base_url, requests, rate=None, concurrency=8, speed=1.0, timeout=30.0):
+    """Sends the requests and returns [(endpoint, status, latency_s)] plus the wall time.
+
+    rate (per second) spaces them evenly; rate=None keeps each request's 't' divided by speed,
+    and rate=0 sends them as fast as the workers can.
+    """
+    work = queue.Queue()
+    results = []
+    workers = [_Worker(base_url, work, results, timeout) for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+
+    start = time.perf_counter()
+    if rate == 0 or (rate is None and not any('t' in r for r in requests)):
+        for request in requests:
+            work.put((request, None))
+    else:
+        for i, request in enumerate(requests):
+            offset = i / rate if rate else request.get('t', 0.0) / speed
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            work.put((request, start + offset))
+    for _ in workers:
+        work.put(None)
+    for worker in workers:
+        worker.join()
+    return results, time.perf_counter() - start
+
+
+def summarize(results, wall_s):
+    """Per-endpoint (and overall) request counts, error counts, throughput and latency percentiles."""
+    groups = {}
+    for name, status, latency in results:
+        groups.setdefault(name, []).append((status, latency))
+    groups['ALL'] = [(status, latency) for _, status, latency in results]
+    summary = {}
+    for name, rows in groups.items():
+        statuses = np.array([status for status, _ in rows])
+        latencies_ms = np.array([latency for _, latency in rows]) * 1e3
+        summary[name] = {
+            'requests': len(rows),
+            'errors': int(((statuses == 0) | (statuses >= 500)).sum()),
+            'statuses': {str(s): int(c) for s, c in zip(*np.unique(statuses, return_counts=True))},
+            'throughput_rps': round(len(rows) / wall_s, 2),
+            **{f"p{p}_ms": round(float(np.percentile(latencies_ms, p)), 3) for p in PERCENTILES},
+            'max_ms': round(float(latencies_ms.max()), 3),
+        }
+    return summary
+
+
+def compare(current, baseline, threshold, percentile=95):
+    """Endpoints whose p95 latency got worse than threshold x the baseline's."""
+    key = f"p{percentile}_ms"
+    return [(name, stats[key] / max(baseline[name][key], 1e-9)) for name, stats in current.items()
+            if name in baseline and stats[key] > threshold * baseline[name][key]]
+
+
+def parse_mix(items):
+    mix = {}
+    for item in items:
+        kind, _, weight = item.partition('=')
+        if kind not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown request kind {kind!r} (use one of {', '.join(DEFAULT_MIX)})")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test or replay traffic against the FedGrid API.')
+    parser.add_argument('--url', default=None, help='running API to target (default: serve api.py in-process)')
+    parser.add_argument('--replay', default=None, help='JSONL request log to replay instead of synthesizing')
+    parser.add_argument('--record', default=None, help='write the synthesized requests to this JSONL log')
+    parser.add_argument('--mix', nargs='+', default=None, metavar='KIND=WEIGHT',
+                        help=f"synthesized request shares (kinds: {', '.join(DEFAULT_MIX)})")
+    parser.add_argument('--rate', type=float, default=None,
+                        help='requests per second (0: closed loop; default 100 or the log pacing)')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of synthesized traffic at --rate')
+    parser.add_argument('--requests', type=int, default=None, help='number of synthesized requests')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed-up of the recorded pacing')
+    parser.add_argument('--concurrency', type=int, default=8, help='client connections')
+    parser.add_argument('--rpc-latency-ms', type=float, default=0.0, help='delay added to every stubbed RPC call')
+    parser.add_argument('--no-scheduler', action='store_true', help='do not run the forecast scheduler thread')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='JSON file for the results')
+    parser.add_argument('--compare', default=None, help='earlier results JSON to check p95 latencies against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    from billing import load_prosumers
+
+    try:
+        if args.replay:
+            requests = load_log(args.replay)
+            rate = args.rate
+        else:
+            rate = 100.0 if args.rate is None else args.rate
+            n = args.requests or max(int((rate or 100.0) * args.duration), 1)
+            requests = synthesize(n, parse_mix(args.mix) if args.mix else DEFAULT_MIX, load_prosumers(),
+                                  rate or None, args.seed)
+    except (ValueError, argparse.ArgumentTypeError) as e:
+        parser.error(str(e))
+    if args.record and not args.replay:
+        with open(args.record, 'w') as f:
+            f.writelines(json.dumps(request) + '\n' for request in requests)
+        print(f" {len(requests)} requests written to {args.record}")
+
+    if args.url:
+        base_url = args.url
+    else:
+        base_url, server = start_local_api(args.rpc_latency_ms / 1e3, scheduler=not args.no_scheduler)
+    pacing = 'closed loop' if rate == 0 else f"{rate:g}/s" if rate else f"recorded pacing x{args.speed:g}"
+    print(f" Sending {len(requests)} requests to {base_url} ({pacing}, {args.concurrency} connections)...")
+    results, wall_s = run(base_url, requests, rate, args.concurrency, args.speed)
+    summary = summarize(results, wall_s)
+
+    print(f"\n {'endpoint':<28} {'requests':>8} {'errors':>6} {'req/s':>9} "
+          + " ".join(f"{f'p{p} ms':>9}" for p in PERCENTILES) + f" {'max ms':>9}")
+    for name, stats in summary.items():
+        print(f" {name:<28} {stats['requests']:>8} {stats['errors']:>6} {stats['throughput_rps']:>9.1f} "
+              + " ".join(f"{stats[f'p{p}_ms']:>9.2f}" for p in PERCENTILES) + f" {stats['max_ms']:>9.2f}")
+    print(f" Wall time {wall_s:.2f}s")
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'target': args.url or 'in-process api.app with the in-memory contract',
+        'requests': len(requests),
+        'rate': rate,
+        'concurrency': args.concurrency,
+        'rpc_latency_ms': args.rpc_latency_ms,
+        'cpu_count': os.cpu_count(),
+        'wall_s': wall_s,
+        'results': summary,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f" Results written to {args.output}")
+
+    if not args.url:
+        server.shutdown()
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(summary, baseline, args.threshold)
+        for name, ratio in regressions:
+            print(f" REGRESSION {name}: p95 {ratio:.2f}x the baseline in {args.compare}")
+        if regressions:
+            sys.exit(1)
+        print(f" No p95 regressions beyond {args.threshold:.2f}x against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""In-process stand-in for the FedGrid weights contract.
+
+Exposes the same `contract.functions.<name>(...).call()` / `.transact({'from': ...})`
+and `contract.events.<Event>.create_filter(...)` surface that web3 contract objects
+do, so aggregation code can run offline against it without a node, gas or receipt waits.
+Every transaction is mined into its own block. InMemoryEth exposes those blocks and
+receipts through the subset of `w3.eth` that receipt_tracker.py uses.
+"""
+import hashlib
+import itertools
+
+
+class ContractError(Exception):
+    pass
+
+
+class TransactionNotFound(ContractError):
+    pass
+
+
+class AttributeDict(dict):
+    """dict with attribute access, like web3's receipts and blocks."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+class _BoundCall:
+    def __init__(self, contract, name, args):
+        self._contract = contract
+        self._name = name
+        self._args = args
+
+    def call(self, tx=None):
+        return getattr(self._contract, self._name)(*self._args, sender=(tx or {}).get('from'), dry_run=True)
+
+    def transact(self, tx=None):
+        sender = (tx or {}).get('from')
+        if sender is None:
+            raise ContractError(f"{self._name}: transaction needs a 'from' address")
+        getattr(self._contract, self._name)(*self._args, sender=sender)
+        return self._contract._next_tx_hash()
+
+
+class _Functions:
+    def __init__(self, contract):
+        self._contract = contract
+
+    def __getattr__(self, name):
+        if name not in InMemoryFedContract.FUNCTIONS:
+            raise AttributeError(name)
+        return lambda *args: _BoundCall(self._contract, name, args)
+
+
+class _EventFilter:
+    def __init__(self, contract, name, start):
+        self._contract = contract
+        self._name = name
+        self._start = start
+        self._position = start
+
+    def _entries(self, start):
+        logs = self._contract.logs
+        return [log for log in logs[start:] if log['event'] == self._name]
+
+    def get_new_entries(self):
+        entries = self._entries(self._position)
+        self._position = len(self._contract.logs)
+        return entries
+
+    def get_all_entries(self):
+        return self._entries(self._start)
+
+
+class _Event:
+    def __init__(self, contract, name):
+        self._contract = contract
+        self._name = name
+
+    def create_filter(self, fromBlock='latest', from_block=None):
+        from_block = fromBlock if from_block is None else from_block
+        logs = self._contract.logs
+        if from_block == 'latest':
+            start = len(logs)
+        else:
+            start = next((i for i, log in enumerate(logs) if log['blockNumber'] >= int(from_block)), len(logs))
+        return _EventFilter(self._contract, self._name, start)
+
+
+class _Events:
+    def __init__(self, contract):
+        self._contract = contract
+
+    def __getattr__(self, name):
+        if name not in InMemoryFedContract.EVENTS:
+            raise AttributeError(name)
+        return _Event(self._contract, name)
+
+
+class InMemoryFedContract:
+    """Mirrors the on-chain storage: per-participant local weights plus one global model."""
+
+    FUNCTIONS = ('postLocalWeights', 'getLocalModel', 'getParticipants',
+                 'getGlobalModel', 'updateGlobalModel', 'setInitialWeights', 'owner')
+    EVENTS = ('LocalWeightsSubmitted', 'GlobalModelUpdated')
+
+    def __init__(self, owner):
+        self._owner = owner
+        self.global_model = []
+        self.local_models = {}
+        self.accounts = []
+        self.block_number = 0
+        # Event logs in web3's shape: {'event', 'args', 'blockNumber', 'transactionHash', 'logIndex'}
+        self.logs = []
+        self._tx_logs = []
+        self._tx_counter = itertools.count(1)
+        self.blocks = [AttributeDict(number=0, hash=hashlib.sha256(b'genesis').digest(), transactions=[])]
+        self.receipts = {}
+        self.functions = _Functions(self)
+        self.events = _Events(self)
+
+    def _emit(self, name, **args):
+        self._tx_logs.append({'event': name, 'args': args})
+
+    def _next_tx_hash(self):
+        """Mines the pending transaction into a new block, with the events it emitted."""
+        self.block_number += 1
+        tx_hash = hashlib.sha256(str(next(self._tx_counter)).encode()).digest()
+        block_hash = hashlib.sha256(b'block' + tx_hash).digest()
+        for log in self._tx_logs:
+            log.update(blockNumber=self.block_number, transactionHash=tx_hash, logIndex=len(self.logs))
+            self.logs.append(log)
+        self.blocks.append(AttributeDict(number=self.block_number, hash=block_hash, transactions=[tx_hash]))
+        self.receipts[tx_hash] = AttributeDict(transactionHash=tx_hash, blockNumber=self.block_number,
+                                               blockHash=block_hash, status=1, gasUsed=21000, logs=self._tx_logs)
+        self._tx_logs = []
+        return tx_hash
+
+    def _only_owner(self, sender):
+        if sender != self._owner:
+            raise ContractError("Only owner can call this function")
+
+    # --- contract functions ---
+    def owner(self, sender=None, dry_run=False):
+        return self._owner
+
+    def postLocalWeights(self, weights, sender=None, dry_run=False):
+        if dry_run:
+            return None
+        if sender not in self.local_models:
+            self.accounts.append(sender)
+        self.local_models[sender] = [int(w) for w in weights]
+        self._emit('LocalWeightsSubmitted', prosumer=sender)
+
+    def getLocalModel(self, participant, sender=None, dry_run=False):
+        return list(self.local_models.get(participant, []))
+
+    def getParticipants(self, sender=None, dry_run=False):
+        return list(self.accounts)
+
+    def getGlobalModel(self, sender=None, dry_run=False):
+        return list(self.global_model)
+
+    def updateGlobalModel(self, new_weights, sender=None, dry_run=False):
+        self._only_owner(sender)
+        if not dry_run:
+            self.global_model = [int(w) for w in new_weights]
+            self._emit('GlobalModelUpdated', newWeights=list(self.global_model))
+
+    def setInitialWeights(self, weights, sender=None, dry_run=False):
+        self._only_owner(sender)
+        if not dry_run:
+            self.global_model = [int(w) for w in weights]
+
+
+class _BlockFilter:
+    def __init__(self, contract):
+        self._contract = contract
+        self._position = len(contract.blocks)
+
+    def get_new_entries(self):
+        blocks = self._contract.blocks
+        entries = [block['hash'] for block in blocks[self._position:]]
+        self._position = len(blocks)
+        return entries
+
+
+class InMemoryEth:
+    """The block and receipt reads of `w3.eth`, served from an InMemoryFedContract's chain."""
+
+    def __init__(self, contract):
+        self._contract = contract
+
+    @property
+    def block_number(self):
+        return self._contract.block_number
+
+    def filter(self, filter_params):
+        if filter_params != 'latest':
+            raise ContractError(f"unsupported filter: {filter_params!r}")
+        return _BlockFilter(self._contract)
+
+    def get_block(self, block_identifier):
+        blocks = self._contract.blocks
+        if isinstance(block_identifier, int):
+            if not 0 <= block_identifier < len(blocks):
+                raise ContractError(f"block {block_identifier} not found")
+            return blocks[block_identifier]
+        for block in reversed(blocks):
+            if block['hash'] == block_identifier:
+                return block
+        raise ContractError(f"block {block_identifier!r} not found")
+
+    def get_block_receipts(self, block_identifier):
+        receipts = self._contract.receipts
+        return [receipts[tx_hash] for tx_hash in self.get_block(block_identifier)['transactions']]
+
+    def get_transaction_receipt(self, tx_hash):
+        receipt = self._contract.receipts.get(bytes(tx_hash))
+        if receipt is None:
+            raise TransactionNotFound(f"transaction {bytes(tx_hash).hex()} is not mined")
+        return receipt
+
+
+def participant_address(label):
+    """Deterministic checksum-free address for simulated participants."""
+    return '0x' + hashlib.sha256(str(label).encode()).hexdigest()[:40]
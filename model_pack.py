@@ -0,0 +1,172 @@
+"""Page-aligned, memory-mapped pack of many household models.
+
+Layout (all offsets in bytes from the start of the file):
+
+    magic 'FGPACK01' | uint64 index length | JSON index | padding to a page
+    household block 0 (page aligned) | household block 1 (page aligned) | ...
+
+Each block holds that household's arrays (student weights and, when present, the
+scalers sidecar under 'scalers/...') uncompressed, 64-byte aligned. The index maps a
+model key (its .npz path) to every array's offset, dtype and shape. Readers mmap the
+file and hand out read-only np.frombuffer views, so every worker process shares the
+same page-cache pages instead of holding a private copy of each model.
+
+    python model_pack.py build --output household_models.pack local_model_weights_mlp_*.npz
+    python model_pack.py info household_models.pack
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'FGPACK01'
+PAGE_SIZE = mmap.PAGESIZE
+ARRAY_ALIGNMENT = 64
+SCALERS_PREFIX = 'scalers/'
+
+
+def _align(offset, alignment):
+    return -(-offset // alignment) * alignment
+
+
+def write_pack(path, models):
+    """Writes {key: {array name: ndarray}} as a pack. The file is replaced atomically, so
+    readers that already mapped the previous pack keep a consistent view."""
+    blocks, layout = [], {}
+    for key, arrays in models.items():
+        entries, size = {}, 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            size = _align(size, ARRAY_ALIGNMENT)
+            entries[name] = {'offset': size, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+            size += array.nbytes
+        blocks.append((key, arrays, entries))
+        layout[key] = {'arrays': entries, 'nbytes': size}
+
+    # The index holds absolute offsets, which depend on the index length; iterate until stable
+    header_size = PAGE_SIZE
+    while True:
+        offset = header_size
+        for key, _, _ in blocks:
+            layout[key]['offset'] = offset
+            offset = _align(offset + layout[key]['nbytes'], PAGE_SIZE)
+        index = json.dumps({'version': 1, 'page_size': PAGE_SIZE, 'models': layout}).encode()
+        needed = _align(len(MAGIC) + 8 + len(index), PAGE_SIZE)
+        if needed == header_size:
+            break
+        header_size = needed
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(index)) + index)
+        for key, arrays, entries in blocks:
+            base = layout[key]['offset']
+            for name, array in arrays.items():
+                f.seek(base + entries[name]['offset'])
+                f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(offset)
+    os.replace(tmp_path, path)
+    return layout
+
+
+def build_pack(path, weight_files):
+    """Packs student .npz files (plus their scalers sidecars) keyed by their path."""
+    # Readers (submit_weights, workers) only need ModelPack, which stays free of pandas
+    from features import scalers_path_for
+
+    models = {}
+    for weights_path in weight_files:
+        with np.load(weights_path) as npz:
+            arrays = {name: npz[name] for name in npz.files}
+        sidecar = scalers_path_for(weights_path)
+        if os.path.exists(sidecar):
+            with np.load(sidecar) as npz:
+                arrays.update({SCALERS_PREFIX + name: npz[name] for name in npz.files})
+        models[weights_path] = arrays
+    return write_pack(path, models)
+
+
+class ModelPack:
+    """Read-only, memory-mapped view of a pack written by write_pack()."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a model pack")
+        (index_length,) = struct.unpack_from('<Q', self._mmap, len(MAGIC))
+        start = len(MAGIC) + 8
+        self.index = json.loads(self._mmap[start:start + index_length])
+        self.models = self.index['models']
+
+    def __contains__(self, key):
+        return key in self.models
+
+    def __len__(self):
+        return len(self.models)
+
+    def keys(self):
+        return list(self.models)
+
+    def arrays(self, key):
+        """Every array of a model as zero-copy read-only views into the mapping."""
+        entry = self.models[key]
+        views = {}
+        for name, spec in entry['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'], dtype=np.int64))
+            views[name] = np.frombuffer(self._mmap, dtype=dtype, count=count,
+                                        offset=entry['offset'] + spec['offset']).reshape(spec['shape'])
+        return views
+
+    def weights(self, key):
+        """The student weights of a model (W1..b4)."""
+        return {name: a for name, a in self.arrays(key).items() if not name.startswith(SCALERS_PREFIX)}
+
+    def scalers(self, key):
+        """The model's scalers sidecar arrays, or None if it was packed without one."""
+        found = {name[len(SCALERS_PREFIX):]: a for name, a in self.arrays(key).items()
+                 if name.startswith(SCALERS_PREFIX)}
+        return found or None
+
+    def close(self):
+        self._mmap.close()
+
+
+def is_mapped(array):
+    """True if the array's memory belongs to an mmap (shared page cache) rather than the process heap."""
+    base = array
+    while isinstance(base, np.ndarray):
+        base = base.base
+    if isinstance(base, memoryview):
+        base = base.obj
+    return isinstance(base, mmap.mmap)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or inspect a memory-mapped household model pack.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='pack student .npz files (and their scalers sidecars)')
+    build.add_argument('--output', default='household_models.pack')
+    build.add_argument('weights', nargs='+')
+    info = sub.add_parser('info', help='list the models in a pack')
+    info.add_argument('pack')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        layout = build_pack(args.output, args.weights)
+        print(f" Packed {len(layout)} models into {args.output} ({os.path.getsize(args.output)} bytes)")
+        return
+
+    pack = ModelPack(args.pack)
+    print(f" {args.pack}: {len(pack)} models, page size {pack.index['page_size']}")
+    for key, entry in pack.models.items():
+        print(f" {key:<48} offset {entry['offset']:>10} {entry['nbytes']:>9} bytes {len(entry['arrays'])} arrays")
+
+
+if __name__ == "__main__":
+    main()
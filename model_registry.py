@@ -0,0 +1,306 @@
+"""Per-address registry of household forecasting models.
+
+Maps prosumer wallet addresses (see prosumers.json) to their household artifacts:
+the local student weights, the scalers they were trained with and the latest
+input window. Models are loaded on first use and kept in an LRU cache bounded by
+MODEL_CACHE_MAX_BYTES, so repeated predictions only cost one small MLP forward pass.
+All forecast periods come from that single pass and are cached per household per hour.
+
+The forecast scheduler publishes every household's forecasts as one ServedVersion, named
+by a digest of the models behind it. A new version replaces the old one in a single
+assignment, so a request that took the old version finishes on it.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from billing import PROSUMER_REGISTRY, load_prosumers
+from features import (load_household, engineer_features, make_targets, make_horizon_targets, create_sequences,
+                      split_points, fit_target_scaler, unscale_targets, flat_windows,
+                      forecast_quality, scalers_path_for, feasible_horizons, HORIZONS)
+from ingest_store import partition_stamp
+from model_pack import ModelPack, is_mapped
+from quantize_model import mlp_predict, LAYERS, WINDOW_SIZE
+
+MODEL_CACHE_MAX_BYTES = int(os.environ.get("MODEL_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Optional model pack (see model_pack.py); weights in it are mmapped and shared across workers
+MODEL_PACK = os.environ.get("MODEL_PACK")
+
+
+class HouseholdModel:
+    """A household's student with its scalers and most recent input window."""
+
+    def __init__(self, weights, x_center, x_scale, y_min, y_scale, latest_window, smape, within_10pct,
+                 horizons=('24h',)):
+        self.weights = weights
+        self.x_center = x_center
+        self.x_scale = x_scale
+        self.y_min = np.atleast_1d(np.asarray(y_min, dtype=np.float64))
+        self.y_scale = np.atleast_1d(np.asarray(y_scale, dtype=np.float64))
+        self.latest_window = latest_window
+        self.smape = np.atleast_1d(np.asarray(smape, dtype=np.float64))
+        self.within_10pct = np.atleast_1d(np.asarray(within_10pct, dtype=np.float64))
+        self.horizons = list(horizons)
+        # Content digest of the weights and scalers, set by the registry when it loads the model
+        self.digest = None
+
+    @property
+    def nbytes(self):
+        """Private memory held by the model; weights mapped from a model pack are shared and not counted."""
+        arrays = list(self.weights.values()) + [self.x_center, self.x_scale, self.latest_window]
+        return sum(a.nbytes for a in arrays if not is_mapped(a))
+
+    def predict(self, X_flat=None):
+        """Consumption (kWh) per trained horizon for flattened scaled windows, by default the latest one."""
+        X_flat = self.latest_window if X_flat is None else X_flat
+        y_scaled = mlp_predict(self.weights, X_flat)
+        # Inverse of MinMaxScaler over log1p (see features.fit_target_scaler)
+        return np.expm1((y_scaled - self.y_min) / self.y_scale)
+
+    def forecast(self, outputs=None):
+        """Every HORIZONS period from one forward pass (or from precomputed outputs of predict()).
+
+        Periods the student was not trained for are scaled from its longest trained horizon.
+        """
+        outputs = self.predict()[0] if outputs is None else outputs
+        longest = max(range(len(self.horizons)), key=lambda j: HORIZONS[self.horizons[j]])
+        result = {}
+        for period, hours in HORIZONS.items():
+            j = self.horizons.index(period) if period in self.horizons else longest
+            scale = hours / HORIZONS[self.horizons[j]]
+            result[period] = {
+                'value': float(outputs[j] * scale),
+                'source': 'model' if scale == 1 else f"scaled from {self.horizons[j]}",
+                'smape': float(self.smape[j]),
+                'within_10pct': float(self.within_10pct[j]),
+            }
+        return result
+
+
+def load_household_model(weights_path, csv_path, window=WINDOW_SIZE, pack=None):
+    """Builds a HouseholdModel from its .npz (or its entry in a model pack) and CSV.
+
+    Scalers come from the training sidecar when present. Artifacts without one predate the
+    sidecar, whose training fit the input RobustScaler on the flattened overlapping training
+    windows rather than on the unique rows (features.scale_inputs), so it is refit that way here.
+    """
+    scalers = None
+    if pack is not None and weights_path in pack:
+        weights = pack.weights(weights_path)
+        scalers = pack.scalers(weights_path)
+    else:
+        with np.load(weights_path) as npz:
+            weights = {key: np.asarray(npz[key], dtype=np.float32) for key in npz.files}
+        sidecar = scalers_path_for(weights_path)
+        if os.path.exists(sidecar):
+            with np.load(sidecar) as npz:
+                scalers = {key: npz[key] for key in npz.files}
+
+    df, feature_cols, target_col = engineer_features(load_household(csv_path))
+    X_all = df[feature_cols].values
+
+    if scalers is not None:
+        horizons = [str(name) for name in scalers['horizons']] if 'horizons' in scalers else None
+    else:
+        n_outputs = weights[f"W{LAYERS[-1]}"].shape[1]
+        horizons = None if n_outputs == 1 else feasible_horizons(len(df), window=window)[:n_outputs]
+        if horizons:
+            X, y = make_horizon_targets(X_all, df[target_col].values, [HORIZONS[name] for name in horizons])
+        else:
+            X, y = make_targets(X_all, df[target_col].values)
+        X_seq, y_seq = create_sequences(X, y, window=window)
+        split1, split2 = split_points(len(X_seq))
+        # sklearn costs over a second to import; only the legacy fallback fits scalers
+        from sklearn.preprocessing import RobustScaler
+
+        scaler_X = RobustScaler().fit(X_seq[:split1].reshape(-1, X.shape[-1]))
+        X_scaled = scaler_X.transform(X).astype(np.float32)
+        scaler_y = fit_target_scaler(y_seq[:split1])
+        y_pred = unscale_targets(scaler_y, mlp_predict(weights, flat_windows(X_scaled, split2, len(X_seq), window)))
+        scalers = dict(x_center=scaler_X.center_, x_scale=scaler_X.scale_, y_min=scaler_y.min_,
+                       y_scale=scaler_y.scale_, **forecast_quality(y_seq[split2:].reshape(y_pred.shape), y_pred))
+
+    x_center = np.asarray(scalers['x_center'], dtype=np.float64)
+    x_scale = np.asarray(scalers['x_scale'], dtype=np.float64)
+    latest = ((X_all[-window:] - x_center) / x_scale).astype(np.float32).reshape(1, -1)
+    return HouseholdModel(weights, x_center, x_scale, scalers['y_min'], scalers['y_scale'], latest,
+                          scalers['smape'], scalers['within_10pct'], horizons or ['24h'])
+
+
+def model_digest(model):
+    """sha256 of a model's weights and scalers; equal models get the same digest wherever they are loaded."""
+    digest = hashlib.sha256()
+    arrays = [model.weights[key] for key in sorted(model.weights)]
+    for array in arrays + [model.x_center, model.x_scale, model.y_min, model.y_scale]:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(','.join(model.horizons).encode())
+    return digest.hexdigest()
+
+
+class ServedVersion:
+    """One published set of household forecasts, replaced as a whole and never mutated."""
+
+    def __init__(self, forecasts, digests):
+        self.forecasts = dict(forecasts)
+        # address -> digest of the model each forecast came from
+        self.digests = dict(digests)
+        self.version = hashlib.sha256(
+            ''.join(f"{address}:{self.digests[address]};" for address in sorted(self.digests)).encode()
+        ).hexdigest()[:12]
+        self.published_at = time.time()
+
+
+def _file_stamp(path):
+    if os.path.isdir(path):
+        return partition_stamp(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _artifact_stamp(entry, pack_path=None):
+    paths = [entry["weights"], scalers_path_for(entry["weights"]), entry["dataset"], pack_path]
+    return tuple(_file_stamp(path) if path else None for path in paths)
+
+
+class ModelRegistry:
+    """Lazily loaded household models, evicted least-recently-used beyond max_bytes."""
+
+    def __init__(self, registry_path=PROSUMER_REGISTRY, max_bytes=MODEL_CACHE_MAX_BYTES, loader=load_household_model,
+                 pack_path=MODEL_PACK, on_swap=None):
+        self.prosumers = load_prosumers(registry_path)
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.pack_path = pack_path
+        self.pack = ModelPack(pack_path) if pack_path else None
+        self._pack_stamp = _file_stamp(pack_path) if pack_path else None
+        self._models = OrderedDict()
+        self._bytes = 0
+        self._forecasts = {}
+        self._stamps = {}
+        # Version published by the forecast scheduler; on_swap(old, new) runs after each swap
+        self._served = None
+        self.on_swap = on_swap
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, address):
+        return address.lower() in self.prosumers
+
+    def addresses(self):
+        return list(self.prosumers)
+
+    @property
+    def cached_bytes(self):
+        return self._bytes
+
+    def get(self, address):
+        """The household model for an address, or None if it is not a registered prosumer."""
+        address = address.lower()
+        with self._lock:
+            model = self._models.get(address)
+            if model is not None:
+                self._models.move_to_end(address)
+                self.hits += 1
+                return model
+        entry = self.prosumers.get(address)
+        if entry is None:
+            return None
+
+        with self._lock:
+            self.misses += 1
+        return self._load(address, entry)
+
+    def _read(self, entry):
+        model = self.loader(entry["weights"], entry["dataset"], pack=self.pack)
+        model.digest = model_digest(model)
+        return model
+
+    def _install(self, address, model, stamp):
+        # Caller holds the lock
+        previous = self._models.pop(address, None)
+        if previous is not None:
+            self._bytes -= previous.nbytes
+        self._models[address] = model
+        self._bytes += model.nbytes
+        self._stamps[address] = stamp
+        while self._bytes > self.max_bytes and len(self._models) > 1:
+            _, evicted = self._models.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def _load(self, address, entry):
+        # Load outside the lock; a concurrent load of the same model just does the work twice
+        stamp = _artifact_stamp(entry, self.pack_path)
+        model = self._read(entry)
+        with self._lock:
+            self._install(address, model, stamp)
+        return model
+
+    def stage(self, address):
+        """(model, stamp) for an address, loaded afresh only if its weights, scalers or readings changed on disk.
+
+        The model is not installed; swap() makes staged models live.
+        """
+        address = address.lower()
+        entry = self.prosumers[address]
+        self._reopen_pack_if_replaced()
+        stamp = _artifact_stamp(entry, self.pack_path)
+        with self._lock:
+            model = self._models.get(address)
+            if model is not None and self._stamps.get(address) == stamp:
+                return model, stamp
+        return self._read(entry), stamp
+
+    def _reopen_pack_if_replaced(self):
+        # A rebuilt pack is a new file (write_pack renames over the old one). Models loaded
+        # from the old mapping keep it alive until they are reloaded.
+        if self.pack_path and _file_stamp(self.pack_path) != self._pack_stamp:
+            self.pack = ModelPack(self.pack_path)
+            self._pack_stamp = _file_stamp(self.pack_path)
+
+    def swap(self, staged, served):
+        """Installs staged {address: (model, stamp)} and makes `served` the live version in one step."""
+        with self._lock:
+            for address, (model, stamp) in staged.items():
+                self._install(address, model, stamp)
+            previous, self._served = self._served, served
+        if self.on_swap is not None:
+            self.on_swap(previous, served)
+
+    def served(self):
+        """The live ServedVersion, or None before the first swap."""
+        return self._served
+
+    @property
+    def published_at(self):
+        served = self._served
+        return served.published_at if served is not None else None
+
+    def forecast(self, address, served=None):
+        """All forecast periods for an address. None if unregistered.
+
+        Read from `served` (by default the live version) when it has the address, otherwise
+        computed on demand at most once per hour.
+        """
+        address = address.lower()
+        served = self._served if served is None else served
+        published = served.forecasts.get(address) if served is not None else None
+        if published is not None:
+            return published
+        hour = int(time.time() // 3600)
+        cached = self._forecasts.get(address)
+        if cached is not None and cached[0] == hour:
+            return cached[1]
+        model = self.get(address)
+        if model is None:
+            return None
+        forecast = model.forecast()
+        self._forecasts[address] = (hour, forecast)
+        return forecast
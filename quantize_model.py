@@ -0,0 +1,226 @@
+"""Post-training quantization of the distilled MLP student.
+
+Weights are quantized symmetrically per output channel. Activation scales are
+calibrated on the validation windows. QuantizedMLP.predict_integer runs a model
+entirely on integers: int8/int16 inputs and weights, integer accumulators, and
+fixed-point requantization between layers (the same idea as the SCALING_FACTOR
+integers used on chain). Only the final layer output is converted back to float.
+
+NumPy has no integer BLAS, so that path is several times slower than the float32
+student. QuantizedMLP.predict therefore dequantizes each layer once into a cached
+float32 copy and runs at float speed. The artifacts are a storage format (4x/2x
+smaller than the float weights), not a way to serve more households per core.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from features import prepare_household, create_sequences, split_points, scale_inputs, fit_target_scaler, \
+    unscale_targets, flat_windows, artifact_horizons
+
+# Dense layers of the student, in order, and their activations
+LAYERS = [1, 2, 3, 4]
+ACTIVATIONS = ['relu', 'relu', 'relu', 'linear']
+
+# Fixed-point precision of the per-channel requantization multipliers
+REQUANT_SHIFT = 31
+CALIBRATION_PERCENTILE = 99.99
+WINDOW_SIZE = 72
+
+
+def mlp_predict(weights, X):
+    """Float32 reference forward pass of the student (dropout is inactive at inference)."""
+    h = np.asarray(X, dtype=np.float32)
+    for layer, activation in zip(LAYERS, ACTIVATIONS):
+        h = h @ weights[f"W{layer}"] + weights[f"b{layer}"]
+        if activation == 'relu':
+            h = np.maximum(h, 0)
+    return h
+
+
+def _qmax(bits):
+    return 2 ** (bits - 1) - 1
+
+
+def _int_dtype(bits):
+    return np.int8 if bits == 8 else np.int16
+
+
+def _activation_scale(values, bits):
+    bound = np.percentile(np.abs(values), CALIBRATION_PERCENTILE)
+    return max(float(bound), 1e-8) / _qmax(bits)
+
+
+def quantize_mlp(weights, X_calib, bits=8):
+    """Quantizes float student weights, calibrating activation ranges on X_calib.
+
+    Returns a dict of arrays that can be saved with np.savez and run by QuantizedMLP.
+    """
+    if bits not in (8, 16):
+        raise ValueError("bits must be 8 or 16")
+    qmax = _qmax(bits)
+    artifact = {'bits': np.int64(bits), 'shift': np.int64(REQUANT_SHIFT)}
+
+    activations = np.asarray(X_calib, dtype=np.float32)
+    in_scale = _activation_scale(activations, bits)
+    artifact['input_scale'] = np.float64(in_scale)
+
+    for layer, activation in zip(LAYERS, ACTIVATIONS):
+        W = weights[f"W{layer}"].astype(np.float64)
+        b = weights[f"b{layer}"].astype(np.float64)
+        w_scale = np.maximum(np.abs(W).max(axis=0), 1e-12) / qmax
+        acc_scale = in_scale * w_scale
+
+        artifact[f"W{layer}_q"] = np.clip(np.round(W / w_scale), -qmax, qmax).astype(_int_dtype(bits))
+        artifact[f"b{layer}_q"] = np.round(b / acc_scale).astype(np.int64)
+        artifact[f"W{layer}_scale"] = w_scale.astype(np.float32)
+        artifact[f"in_scale{layer}"] = np.float64(in_scale)
+
+        activations = activations @ weights[f"W{layer}"] + weights[f"b{layer}"]
+        if activation == 'relu':
+            activations = np.maximum(activations, 0)
+
+        if layer == LAYERS[-1]:
+            artifact['output_scale'] = acc_scale
+        else:
+            out_scale = _activation_scale(activations, bits)
+            artifact[f"M{layer}"] = np.round(acc_scale / out_scale * 2 ** REQUANT_SHIFT).astype(np.int64)
+            in_scale = out_scale
+    return artifact
+
+
+class QuantizedMLP:
+    """Inference for a quantize_mlp() artifact: dequantized float32 (predict) or integer-only (predict_integer)."""
+
+    def __init__(self, artifact):
+        self.bits = int(artifact['bits'])
+        self.qmax = _qmax(self.bits)
+        self.shift = int(artifact['shift'])
+        self.input_scale = float(artifact['input_scale'])
+        self.output_scale = np.asarray(artifact['output_scale'])
+        # The integer GEMM runs through float64 BLAS. Every product and partial sum is an
+        # integer below 2**53 (at most 72*F * 32767**2 for int16), so the result is exact.
+        self.W = [artifact[f"W{layer}_q"].astype(np.float64) for layer in LAYERS]
+        self.b = [np.asarray(artifact[f"b{layer}_q"], dtype=np.int64) for layer in LAYERS]
+        self.M = [np.asarray(artifact[f"M{layer}"], dtype=np.int64) for layer in LAYERS[:-1]]
+        self.weights = {}
+        for layer in LAYERS:
+            w_scale = np.asarray(artifact[f"W{layer}_scale"], dtype=np.float32)
+            self.weights[f"W{layer}"] = artifact[f"W{layer}_q"].astype(np.float32) * w_scale
+            self.weights[f"b{layer}"] = (artifact[f"b{layer}_q"] * (float(artifact[f"in_scale{layer}"]) * w_scale)
+                                         ).astype(np.float32)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as artifact:
+            return cls({key: artifact[key] for key in artifact.files})
+
+    def quantize_input(self, X):
+        x = np.multiply(X, np.float32(1.0 / self.input_scale), dtype=np.float32)
+        np.rint(x, out=x)
+        np.clip(x, -self.qmax, self.qmax, out=x)
+        return x.astype(np.float64)
+
+    def predict(self, X):
+        """Float32 forward pass over the dequantized weights."""
+        return mlp_predict(self.weights, X)
+
+    def predict_integer(self, X):
+        """Integer-only forward pass; the output is the last accumulator times its scale."""
+        x = self.quantize_input(X)
+        rounding = np.int64(1) << (self.shift - 1)
+        for i in range(len(LAYERS)):
+            acc = (x @ self.W[i]).astype(np.int64) + self.b[i]
+            if i == len(LAYERS) - 1:
+                return acc * self.output_scale
+            acc = np.maximum(acc, 0)
+            x = np.minimum((acc * self.M[i] + rounding) >> self.shift, self.qmax).astype(np.float64)
+
+
+def quantized_path_for(weights_path, bits):
+    root, ext = os.path.splitext(weights_path)
+    return f"{root}_int{bits}{ext}"
+
+
+def _time_per_sample(fn, X, repeats=20):
+    fn(X)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(X)
+    return (time.perf_counter() - start) / (repeats * len(X))
+
+
+def _smape(a, f):
+    return 100 * np.mean(2 * np.abs(f - a) / (np.abs(a) + np.abs(f) + 1e-8))
+
+
+def quantize_household(weights_path, csv_path, bit_widths=(8, 16), window=WINDOW_SIZE):
+    """Calibrates on the household's validation windows, writes one artifact per bit width and
+    returns accuracy/latency of each against the float model on the test windows."""
+    X, y, _ = prepare_household(csv_path, artifact_horizons(weights_path))
+    X_seq, y_seq = create_sequences(X, y, window=window)
+    split1, split2 = split_points(len(X_seq))
+    _, X_scaled = scale_inputs(X, split1, window)
+    scaler_y = fit_target_scaler(y_seq[:split1])
+
+    X_val = flat_windows(X_scaled, split1, split2, window)
+    X_test = flat_windows(X_scaled, split2, len(X_seq), window)
+    y_test = y_seq[split2:]
+
+    with np.load(weights_path) as npz:
+        weights = {key: npz[key] for key in npz.files}
+
+    float_pred = unscale_targets(scaler_y, mlp_predict(weights, X_test)).reshape(y_test.shape)
+    report = [{
+        'model': 'float32',
+        'path': weights_path,
+        'bytes': os.path.getsize(weights_path),
+        'smape': float(_smape(y_test, float_pred)),
+        'max_abs_diff_vs_float': 0.0,
+        'us_per_sample': _time_per_sample(lambda batch: mlp_predict(weights, batch), X_test) * 1e6,
+    }]
+
+    for bits in bit_widths:
+        artifact = quantize_mlp(weights, X_val, bits=bits)
+        path = quantized_path_for(weights_path, bits)
+        np.savez(path, **artifact)
+        qmodel = QuantizedMLP(artifact)
+        q_pred = unscale_targets(scaler_y, qmodel.predict(X_test)).reshape(y_test.shape)
+        int_pred = unscale_targets(scaler_y, qmodel.predict_integer(X_test)).reshape(y_test.shape)
+        report.append({
+            'model': f"int{bits}",
+            'path': path,
+            'bytes': os.path.getsize(path),
+            'smape': float(_smape(y_test, q_pred)),
+            'max_abs_diff_vs_float': float(np.max(np.abs(q_pred - float_pred))),
+            'us_per_sample': _time_per_sample(qmodel.predict, X_test) * 1e6,
+            'integer_smape': float(_smape(y_test, int_pred)),
+            'integer_us_per_sample': _time_per_sample(qmodel.predict_integer, X_test) * 1e6,
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quantize a trained MLP student to int8/int16.')
+    parser.add_argument('--weights', default='local_model_weights_mlp_2.npz')
+    parser.add_argument('--data', default='household_2_energy_dataset.csv',
+                        help='household CSV the student was trained on (for calibration and evaluation)')
+    parser.add_argument('--bits', type=int, nargs='+', default=[8, 16], choices=[8, 16])
+    args = parser.parse_args()
+
+    print(f" Quantizing {args.weights} (calibrated on validation windows of {args.data})")
+    print("=" * 70)
+    print(f" {'model':<8} {'size':>10} {'sMAPE (raw)':>12} {'max |diff| kW':>14} {'us/sample':>10}")
+    for row in quantize_household(args.weights, args.data, args.bits):
+        print(f" {row['model']:<8} {row['bytes']:>9}B {row['smape']:>11.2f}% "
+              f"{row['max_abs_diff_vs_float']:>14.3f} {row['us_per_sample']:>10.2f}")
+        if row['model'] != 'float32':
+            print(f"          integer-only: sMAPE {row['integer_smape']:.2f}%, "
+                  f"{row['integer_us_per_sample']:.2f} us/sample")
+            print(f"          -> {row['path']}")
+
+
+if __name__ == "__main__":
+    main()
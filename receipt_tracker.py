@@ -0,0 +1,198 @@
+"""Confirms sent transactions by following new blocks instead of polling each one.
+
+`w3.eth.wait_for_transaction_receipt` polls the RPC once per transaction every
+0.1 s until it is mined, so N transactions in flight cost N polling loops. The
+tracker follows the chain once: a block filter (or, when the node drops or does
+not support filters, the block number) tells it when there are new blocks, each
+new block's transaction list is read once, and every pending future whose hash is
+in it is resolved from that block's receipts together. A block holding several of
+our transactions costs one eth_getBlockReceipts call (sent as a raw request, since
+web3 6 has no method for it), or one receipt lookup each on nodes without it.
+Blocks are processed in order and the cursor only moves past a block once all its
+futures are resolved, so a failed RPC call is retried from that block on the next poll.
+
+    with ReceiptTracker(w3.eth) as tracker:
+        futures = [tracker.track(w3.eth.send_raw_transaction(tx)) for tx in signed]
+        receipts = [future.result() for future in futures]
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+RECEIPT_POLL_SECONDS = float(os.environ.get("RECEIPT_POLL_SECONDS", "2"))
+RECEIPT_TIMEOUT_SECONDS = float(os.environ.get("RECEIPT_TIMEOUT_SECONDS", "120"))
+# Transaction hashes of this many recent blocks are kept, so a transaction that was mined
+# before track() was called for it still resolves without a receipt lookup per poll
+RECENT_BLOCKS = 64
+
+
+def _key(tx_hash):
+    if isinstance(tx_hash, str):
+        return bytes.fromhex(tx_hash[2:] if tx_hash.startswith('0x') else tx_hash)
+    return bytes(tx_hash)
+
+
+class ReceiptTracker:
+    """Resolves a Future per tracked transaction from the receipts of each new block.
+
+    eth is `w3.eth` (or local_chain.InMemoryEth). Use it as a context manager, or
+    start() it, to follow blocks on a background thread; poll() does one step by hand.
+    """
+
+    def __init__(self, eth, poll_s=RECEIPT_POLL_SECONDS, timeout_s=RECEIPT_TIMEOUT_SECONDS, clock=time.monotonic):
+        self.eth = eth
+        self.poll_s = poll_s
+        self.timeout_s = timeout_s
+        self.clock = clock
+        self.rpc_calls = 0
+        # tx hash -> (future, deadline)
+        self._pending = {}
+        self._recent = deque(maxlen=RECENT_BLOCKS)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._next_block = self._rpc(lambda: eth.block_number) + 1
+        self._head = self._next_block - 1
+        self._block_receipts_supported = True
+        self._filter = self._create_filter()
+
+    def _rpc(self, call):
+        self.rpc_calls += 1
+        return call()
+
+    def _create_filter(self):
+        try:
+            return self._rpc(lambda: self.eth.filter('latest'))
+        except Exception as e:
+            logging.info(f" Block filter unavailable ({e}); polling the block number instead")
+            return None
+
+    def track(self, tx_hash, timeout_s=None):
+        """Future for the receipt of a sent transaction; fails with TimeoutError if it isn't mined in time."""
+        key = _key(tx_hash)
+        future = Future()
+        with self._lock:
+            mined = next((number for number, hashes in self._recent if key in hashes), None)
+            if mined is None:
+                self._pending[key] = (future, self.clock() + (self.timeout_s if timeout_s is None else timeout_s))
+                return future
+        future.set_result(self._rpc(lambda: self.eth.get_transaction_receipt(key)))
+        return future
+
+    def wait(self, tx_hash, timeout_s=None):
+        """Blocks until the transaction is mined and returns its receipt. Needs a started tracker."""
+        return self.track(tx_hash, timeout_s).result()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _update_head(self):
+        """Raises the known chain head, asking the node only when the block filter reports new blocks."""
+        if self._filter is not None:
+            try:
+                new_blocks = self._rpc(self._filter.get_new_entries)
+            except Exception as e:
+                # Nodes drop filters that go unpolled for a while; carry on from the last block seen
+                logging.warning(f" Block filter failed ({e}); polling the block number instead")
+                self._filter = None
+            else:
+                if not new_blocks:
+                    return
+        self._head = max(self._head, self._rpc(lambda: self.eth.block_number))
+
+    def _block_receipts(self, number):
+        """Every receipt of a block in one call."""
+        get_block_receipts = getattr(self.eth, 'get_block_receipts', None)
+        if get_block_receipts is not None:
+            return get_block_receipts(number)
+        from web3._utils.method_formatters import receipt_formatter
+
+        receipts = self.eth.w3.manager.request_blocking('eth_getBlockReceipts', [hex(number)])
+        return [receipt_formatter(r) for r in receipts]
+
+    def _receipts(self, block, hashes):
+        """Receipts of our transactions in a block: one block-receipts call when several are ours."""
+        if len(hashes) > 1 and self._block_receipts_supported:
+            try:
+                receipts = self._rpc(lambda: self._block_receipts(block['number']))
+            except Exception as e:
+                logging.info(f" eth_getBlockReceipts unavailable ({e}); fetching receipts one by one")
+                self._block_receipts_supported = False
+            else:
+                return {_key(r['transactionHash']): r for r in receipts if _key(r['transactionHash']) in hashes}
+        return {key: self._rpc(lambda key=key: self.eth.get_transaction_receipt(key)) for key in hashes}
+
+    def poll(self):
+        """Reads the new blocks, resolves the futures mined in them and expires overdue ones."""
+        try:
+            self._update_head()
+            while self._next_block <= self._head:
+                block = self._rpc(lambda: self.eth.get_block(self._next_block))
+                hashes = {_key(h) for h in block['transactions']}
+                with self._lock:
+                    # Recorded with the pending check, so a hash tracked meanwhile is caught by one or the other
+                    if not self._recent or self._recent[-1][0] != block['number']:
+                        self._recent.append((block['number'], hashes))
+                    ours = hashes & self._pending.keys()
+                if ours:
+                    for key, receipt in self._receipts(block, ours).items():
+                        with self._lock:
+                            future, _ = self._pending.pop(key, (None, None))
+                        if future is not None:
+                            future.set_result(receipt)
+                self._next_block = block['number'] + 1
+        finally:
+            self._expire()
+
+    def _expire(self):
+        now = self.clock()
+        with self._lock:
+            expired = [key for key, (_, deadline) in self._pending.items() if deadline <= now]
+        for key in expired:
+            # Last look before giving up, in case the block was missed (e.g. across a reorg)
+            try:
+                receipt = self._rpc(lambda: self.eth.get_transaction_receipt(key))
+            except Exception:
+                receipt = None
+            with self._lock:
+                future, _ = self._pending.pop(key, (None, None))
+            if future is None:
+                continue
+            if receipt is not None:
+                future.set_result(receipt)
+            else:
+                future.set_exception(TimeoutError(f"transaction 0x{key.hex()} not mined within the timeout"))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logging.warning(f" Receipt poll failed: {e}")
+            self._stop.wait(self.poll_s)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='receipt-tracker', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops following blocks and cancels the futures still pending."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future, _ in pending.values():
+            future.cancel()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
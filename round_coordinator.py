@@ -0,0 +1,329 @@
+"""Long-running coordinator for buffered, asynchronous federated rounds.
+
+A round opens as soon as the previous one closes. It buffers LocalWeightsSubmitted
+events and closes when QUORUM prosumers have submitted, or at the deadline with
+whatever has arrived (a round with no submissions is extended). The buffered
+updates are averaged with staleness weights and published as the next global model.
+
+Staleness is counted in global versions: an update trained from version v and
+aggregated into version V has staleness V - v. The contract does not record which
+version a prosumer trained from, so the coordinator assumes each prosumer fetched
+the global model right after its previous submission (submit -> fetch -> train ->
+submit). A first submission is assumed fresh. Updates weigh (1 + staleness)^-a and
+are dropped beyond MAX_STALENESS. Only the buffered prosumers' models are fetched,
+so the cost of a round grows with the quorum, not with the number of participants.
+
+A failed publish, fetch or event poll leaves the buffered updates in place and the
+round open; run() logs it and retries with exponential backoff. A dropped event
+filter is recreated from the last block seen. The global version and that block are
+saved to ROUND_STATE_PATH after every publish, so a restarted coordinator carries on
+from them instead of numbering versions from 0 again.
+
+    python round_coordinator.py --simulate --participants 1000 --quorum 100 --rounds 10
+    python round_coordinator.py            # against the contract (same env as aggregate.py)
+"""
+import argparse
+import heapq
+import json
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from aggregate import CONTRACT_ABI, federated_average, load_config, send_global_update
+from local_chain import InMemoryFedContract, participant_address
+from receipt_tracker import ReceiptTracker
+
+ROUND_QUORUM = int(os.environ.get("ROUND_QUORUM", "2"))
+ROUND_DEADLINE_SECONDS = float(os.environ.get("ROUND_DEADLINE_SECONDS", "600"))
+ROUND_POLL_SECONDS = float(os.environ.get("ROUND_POLL_SECONDS", "5"))
+MAX_STALENESS = int(os.environ.get("MAX_STALENESS", "4"))
+STALENESS_EXPONENT = float(os.environ.get("STALENESS_EXPONENT", "0.5"))
+# Parallel getLocalModel reads when closing a round
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", "8"))
+# Longest wait between retries of a failed round
+ROUND_RETRY_MAX_SECONDS = float(os.environ.get("ROUND_RETRY_MAX_SECONDS", "300"))
+ROUND_STATE_PATH = os.environ.get("ROUND_STATE_PATH", "round_state.json")
+
+EVENT_ABI = [{
+    "anonymous": False,
+    "inputs": [{"indexed": True, "internalType": "address", "name": "prosumer", "type": "address"}],
+    "name": "LocalWeightsSubmitted",
+    "type": "event"
+}]
+
+
+def staleness_weights(staleness, exponent=STALENESS_EXPONENT):
+    """Polynomial staleness discount (1 + s)^-exponent; fresh updates weigh 1."""
+    return (1.0 + np.asarray(staleness, dtype=np.float64)) ** -exponent
+
+
+class RoundCoordinator:
+    """Collects submissions into rounds and publishes each round's weighted average.
+
+    publish(weights) must send updateGlobalModel and return once it is mined. With state_path,
+    the global version and last block seen are restored from and saved to that JSON file.
+    """
+
+    def __init__(self, contract, publish, quorum=ROUND_QUORUM, deadline_s=ROUND_DEADLINE_SECONDS,
+                 poll_s=ROUND_POLL_SECONDS, max_staleness=MAX_STALENESS, staleness_exponent=STALENESS_EXPONENT,
+                 fetch_workers=FETCH_WORKERS, clock=time.monotonic, sleep=None, state_path=None,
+                 retry_max_s=ROUND_RETRY_MAX_SECONDS):
+        self.contract = contract
+        self.publish = publish
+        self.quorum = quorum
+        self.deadline_s = deadline_s
+        self.poll_s = poll_s
+        self.max_staleness = max_staleness
+        self.staleness_exponent = staleness_exponent
+        self.clock = clock
+        self._stop = threading.Event()
+        self.sleep = sleep or self._stop.wait
+        self._pool = ThreadPoolExecutor(fetch_workers) if fetch_workers > 1 else None
+        self.retry_max_s = retry_max_s
+        self.state_path = state_path
+        state = {}
+        if state_path and os.path.exists(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+        self.version = state.get('version', 0)
+        # (blockNumber, logIndex) of the newest submission event collected
+        self._last_seen = tuple(state['last_seen']) if state.get('last_seen') else None
+        self._backlog = []
+        self._filter = self._create_filter()
+        # prosumer -> global version its buffered update was trained from
+        self._buffer = {}
+        # prosumer -> global version when its latest submission arrived (what it trains from next)
+        self._trained_from = {}
+        self._opened_at = None
+        self.rounds = []
+
+    def _create_filter(self):
+        """Submission filter starting after the last event seen, so a restart or a dropped filter misses nothing."""
+        event = self.contract.events.LocalWeightsSubmitted
+        if self._last_seen is None:
+            return event.create_filter(fromBlock='latest')
+        event_filter = event.create_filter(fromBlock=self._last_seen[0])
+        self._backlog = event_filter.get_all_entries()
+        return event_filter
+
+    def _new_entries(self):
+        try:
+            entries = self._filter.get_new_entries()
+        except Exception as e:
+            # Nodes drop filters that go unpolled for a while
+            logging.warning(f" Submission filter failed ({e}); recreating it")
+            self._filter = self._create_filter()
+            entries = self._filter.get_new_entries()
+        backlog, self._backlog = self._backlog, []
+        return backlog + list(entries)
+
+    def collect(self):
+        """Buffers new submissions. Returns the number of prosumers waiting to be aggregated."""
+        for entry in self._new_entries():
+            position = (entry['blockNumber'], entry['logIndex'])
+            if self._last_seen is not None and position <= self._last_seen:
+                continue
+            self._last_seen = position
+            prosumer = entry['args']['prosumer']
+            self._buffer[prosumer] = self._trained_from.get(prosumer, self.version)
+            self._trained_from[prosumer] = self.version
+        return len(self._buffer)
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': self.version, 'last_seen': self._last_seen}, f)
+        os.replace(tmp, self.state_path)
+
+    def run_round(self):
+        """Waits for quorum or the deadline, then aggregates. Returns the round's stats (None if stopped).
+
+        A round that failed stays open, so a retry keeps its deadline and buffered updates.
+        """
+        if self._opened_at is None:
+            self._opened_at = self.clock()
+        opened_at = self._opened_at
+        deadline = opened_at + self.deadline_s
+        while not self._stop.is_set():
+            pending = self.collect()
+            if pending >= self.quorum:
+                return self.aggregate('quorum', opened_at)
+            if self.clock() >= deadline:
+                if pending:
+                    return self.aggregate('deadline', opened_at)
+                logging.info(f" Round {self.version + 1}: no submissions by the deadline, extending")
+                deadline += self.deadline_s
+            self.sleep(min(self.poll_s, deadline - self.clock()))
+        return None
+
+    def aggregate(self, reason, opened_at):
+        start = time.perf_counter()
+        # Updates leave the buffer only once the round is published
+        buffered = dict(self._buffer)
+        staleness = {prosumer: self.version - base for prosumer, base in buffered.items()}
+        used = [prosumer for prosumer, s in staleness.items() if s <= self.max_staleness]
+
+        def fetch(prosumer):
+            return self.contract.functions.getLocalModel(prosumer).call()
+        local_weights = list(self._pool.map(fetch, used) if self._pool else map(fetch, used))
+        if used:
+            weights = staleness_weights([staleness[p] for p in used], self.staleness_exponent)
+            self.publish(federated_average(local_weights, weights))
+            self.version += 1
+        for prosumer, base in buffered.items():
+            if self._buffer.get(prosumer) == base:
+                del self._buffer[prosumer]
+        self._opened_at = None
+        self._save_state()
+
+        stats = {
+            'round': len(self.rounds) + 1,
+            'version': self.version,
+            'reason': reason,
+            'updates': len(used),
+            'dropped': len(buffered) - len(used),
+            'mean_staleness': float(np.mean([staleness[p] for p in used])) if used else None,
+            'round_s': self.clock() - opened_at,
+            'aggregate_s': time.perf_counter() - start,
+        }
+        self.rounds.append(stats)
+        logging.info(f" Round {stats['round']} closed on {reason}: {stats['updates']} updates, "
+                     f"{stats['dropped']} too stale, global version {self.version}")
+        return stats
+
+    def run(self, rounds=None):
+        """Runs rounds back to back until stop() or `rounds` rounds have completed.
+
+        A failed round is logged and retried after an exponential backoff.
+        """
+        failures = 0
+        while not self._stop.is_set() and (rounds is None or len(self.rounds) < rounds):
+            try:
+                self.run_round()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                delay = min(self.poll_s * 2 ** (failures - 1), self.retry_max_s)
+                logging.error(f" Round {len(self.rounds) + 1} failed ({e}); retrying in {delay:.0f}s "
+                              f"with {len(self._buffer)} updates buffered")
+                self.sleep(delay)
+        return self.rounds
+
+    def stop(self):
+        self._stop.set()
+        if self._pool:
+            self._pool.shutdown(wait=False)
+
+
+class SimulatedProsumers:
+    """Prosumers on a simulated clock: each trains for its own time, submits, and starts again.
+
+    A fraction are stragglers that train several times slower. Pass clock and sleep to the
+    coordinator; sleeping advances the clock and posts every submission that falls due.
+    """
+
+    def __init__(self, contract, participants, mean_train_s=300.0, straggler_fraction=0.1, straggler_slowdown=5.0,
+                 seed=0):
+        rng = np.random.default_rng(seed)
+        self.contract = contract
+        self.addresses = [participant_address(f"prosumer-{i}") for i in range(participants)]
+        self.train_s = rng.lognormal(math.log(mean_train_s), 0.3, participants)
+        stragglers = rng.random(participants) < straggler_fraction
+        self.train_s[stragglers] *= straggler_slowdown
+        self.signatures = rng.integers(-200000, 200000, size=(participants, 11))
+        self.now = 0.0
+        self.submissions = 0
+        self._due = [(float(rng.uniform(0, t)), i) for i, t in enumerate(self.train_s)]
+        heapq.heapify(self._due)
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        until = self.now + max(seconds, 0)
+        while self._due and self._due[0][0] <= until:
+            self.now, i = heapq.heappop(self._due)
+            self.contract.functions.postLocalWeights(self.signatures[i].tolist()).transact({'from': self.addresses[i]})
+            self.submissions += 1
+            heapq.heappush(self._due, (self.now + self.train_s[i], i))
+        self.now = until
+
+
+def simulate(participants, rounds, mean_train_s=300.0, straggler_fraction=0.1, **coordinator_args):
+    owner = participant_address('owner')
+    contract = InMemoryFedContract(owner)
+    prosumers = SimulatedProsumers(contract, participants, mean_train_s, straggler_fraction)
+    coordinator = RoundCoordinator(
+        contract, lambda weights: contract.functions.updateGlobalModel(weights).transact({'from': owner}),
+        fetch_workers=1, clock=prosumers.clock, sleep=prosumers.sleep, **coordinator_args)
+    results = coordinator.run(rounds)
+    coordinator.stop()
+    return results, prosumers
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run buffered asynchronous aggregation rounds.')
+    parser.add_argument('--rounds', type=int, default=None, help='stop after this many rounds (default: run forever)')
+    parser.add_argument('--quorum', type=int, default=ROUND_QUORUM)
+    parser.add_argument('--deadline', type=float, default=ROUND_DEADLINE_SECONDS, help='seconds before a round closes')
+    parser.add_argument('--poll', type=float, default=ROUND_POLL_SECONDS, help='seconds between event polls')
+    parser.add_argument('--max-staleness', type=int, default=MAX_STALENESS)
+    parser.add_argument('--staleness-exponent', type=float, default=STALENESS_EXPONENT)
+    parser.add_argument('--simulate', action='store_true', help='simulated prosumers and clock on the in-memory chain')
+    parser.add_argument('--participants', type=int, default=100, help='simulated prosumers')
+    parser.add_argument('--mean-train', type=float, default=300.0, help='simulated mean training time (s)')
+    parser.add_argument('--straggler-fraction', type=float, default=0.1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    coordinator_args = dict(quorum=args.quorum, deadline_s=args.deadline, poll_s=args.poll,
+                            max_staleness=args.max_staleness, staleness_exponent=args.staleness_exponent)
+    if args.simulate:
+        logging.getLogger().setLevel(logging.WARNING)
+        results, prosumers = simulate(args.participants, args.rounds or 10, args.mean_train, args.straggler_fraction,
+                                      **coordinator_args)
+        print(f" {'round':>5} {'reason':<9} {'updates':>7} {'dropped':>7} {'staleness':>9} "
+              f"{'round s':>8} {'aggregate ms':>12}")
+        for r in results:
+            staleness = f"{r['mean_staleness']:.2f}" if r['mean_staleness'] is not None else '-'
+            print(f" {r['round']:>5} {r['reason']:<9} {r['updates']:>7} {r['dropped']:>7} {staleness:>9} "
+                  f"{r['round_s']:>8.1f} {r['aggregate_s'] * 1e3:>12.2f}")
+        elapsed = prosumers.now
+        print(f" {len(results)} rounds in {elapsed:.0f} simulated s ({len(results) / elapsed * 3600:.1f} rounds/h), "
+              f"{prosumers.submissions} submissions from {args.participants} prosumers")
+        return
+
+    from web3 import Web3
+    from eth_account import Account
+
+    rpc_url, contract_address, owner_key = load_config()
+    w3 = Web3(Web3.HTTPProvider(rpc_url))
+    owner_account = Account.from_key(owner_key)
+    contract = w3.eth.contract(address=w3.to_checksum_address(contract_address), abi=CONTRACT_ABI + EVENT_ABI)
+    tracker = ReceiptTracker(w3.eth).start()
+
+    def publish(weights):
+        tx_hash = send_global_update(w3, contract, owner_account, weights)
+        receipt = tracker.wait(tx_hash)
+        if receipt.status != 1:
+            raise RuntimeError(f"updateGlobalModel failed: {tx_hash.hex()}")
+
+    coordinator = RoundCoordinator(contract, publish, state_path=ROUND_STATE_PATH, **coordinator_args)
+    try:
+        coordinator.run(args.rounds)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        coordinator.stop()
+        tracker.stop()
+
+
+if __name__ == "__main__":
+    main()
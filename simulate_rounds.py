@@ -0,0 +1,157 @@
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from aggregate import average_model_files, fetch_local_models, federated_average
+from local_chain import InMemoryFedContract, participant_address
+from submit_weights import create_minimal_signature
+from train_households import find_datasets, household_id, output_path_for, train_households
+
+DEFAULT_SUMMARY = 'simulation_summary.json'
+DEFAULT_OUTPUT_DIR = 'simulation_artifacts'
+STAGES = ('train', 'encode', 'submit', 'fetch', 'aggregate')
+
+
+def run_round(round_num, contract, owner, datasets, output_dir, workers=None, threads_per_worker=None, train=True,
+              init_weights=None, finetune_epochs=None):
+    """One federated round: local training -> signature -> submit -> fetch -> FedAvg -> global update.
+
+    Also writes the layer-wise averaged global artifact that the next round warm-starts from.
+    """
+    timings = {}
+    round_dir = os.path.join(output_dir, f"round_{round_num}")
+    os.makedirs(round_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    if train:
+        results, _, _ = train_households(datasets, round_dir, workers, threads_per_worker,
+                                         init_weights, finetune_epochs)
+    else:
+        results = [{'dataset': path, 'output': output_path_for(path), 'household': household_id(path),
+                    'status': 'ok'} for path in datasets]
+    timings['train'] = time.perf_counter() - start
+    trained = [r for r in results if r['status'] == 'ok']
+    if not trained:
+        # Nothing to aggregate: leave the chain alone and let the next round start from the last good global model
+        timings.update(dict.fromkeys(STAGES[1:], 0.0))
+        return {
+            'round': round_num,
+            'status': 'failed',
+            'participants': 0,
+            'timings_s': timings,
+            'accuracy': None,
+            'global_model': contract.functions.getGlobalModel().call(),
+            'global_artifact': init_weights,
+            'households': results,
+        }
+
+    start = time.perf_counter()
+    signatures = {}
+    for r in trained:
+        with np.load(r['output']) as weights:
+            signatures[participant_address(r['household'])] = create_minimal_signature(weights)
+    timings['encode'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for address, signature in signatures.items():
+        contract.functions.postLocalWeights(signature).transact({'from': address})
+    timings['submit'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # The contract keeps every address that ever submitted; only this round's submissions are averaged
+    participants = [a for a in contract.functions.getParticipants().call() if a in signatures]
+    all_local_weights = fetch_local_models(contract, participants)
+    timings['fetch'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new_global_weights = federated_average(all_local_weights)
+    contract.functions.updateGlobalModel(new_global_weights).transact({'from': owner})
+    global_artifact = os.path.join(round_dir, 'global_model_weights_mlp.npz')
+    average_model_files([r['output'] for r in trained], global_artifact)
+    timings['aggregate'] = time.perf_counter() - start
+
+    scored = [r for r in trained if 'smape' in r]
+    accuracy = None
+    if scored:
+        accuracy = {
+            'rmse': float(np.mean([r['rmse'] for r in scored])),
+            'mae': float(np.mean([r['mae'] for r in scored])),
+            'smape': float(np.mean([r['smape'] for r in scored])),
+        }
+        accuracy['accuracy_pct'] = 100.0 - accuracy['smape']
+
+    return {
+        'round': round_num,
+        'status': 'ok',
+        'participants': len(participants),
+        'timings_s': timings,
+        'accuracy': accuracy,
+        'global_model': contract.functions.getGlobalModel().call(),
+        'global_artifact': global_artifact,
+        'households': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate federated rounds offline against an in-memory contract.')
+    parser.add_argument('datasets', nargs='*', help='household CSVs (default: household_*_energy_dataset.csv)')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--households', type=int, default=None, help='use only the first N datasets')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads-per-worker', type=int, default=None)
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--skip-train', action='store_true',
+                        help='reuse the existing local_model_weights_mlp_<n>.npz files instead of training')
+    parser.add_argument('--finetune-epochs', type=int, default=None,
+                        help='student epoch budget when warm-starting rounds 2..K from the previous global model')
+    parser.add_argument('--no-warm-start', action='store_true', help='train every round from scratch')
+    parser.add_argument('--summary', default=DEFAULT_SUMMARY)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    datasets = args.datasets or find_datasets()
+    if args.households:
+        datasets = datasets[:args.households]
+    if not datasets:
+        print(" No household datasets found.")
+        return
+
+    owner = participant_address('owner')
+    contract = InMemoryFedContract(owner)
+
+    print(f" Simulating {args.rounds} rounds over {len(datasets)} households")
+    print("=" * 50)
+    rounds = []
+    global_artifact = None
+    for round_num in range(1, args.rounds + 1):
+        init_weights = None if args.no_warm_start else global_artifact
+        result = run_round(round_num, contract, owner, datasets, args.output_dir,
+                           args.workers, args.threads_per_worker, train=not args.skip_train,
+                           init_weights=init_weights, finetune_epochs=args.finetune_epochs)
+        rounds.append(result)
+        global_artifact = result['global_artifact']
+        if result['status'] == 'failed':
+            print(f" Round {round_num}: failed, every household failed to train; global model unchanged")
+            continue
+        stage_report = "  ".join(f"{s}={result['timings_s'][s]:.3f}s" for s in STAGES)
+        accuracy = result['accuracy']
+        accuracy_report = f"sMAPE {accuracy['smape']:.2f}%" if accuracy else "sMAPE n/a"
+        print(f" Round {round_num}: {stage_report}  {accuracy_report}")
+
+    totals = {s: sum(r['timings_s'][s] for r in rounds) for s in STAGES}
+    with open(args.summary, 'w') as f:
+        json.dump({'households': len(datasets), 'rounds': rounds, 'total_timings_s': totals}, f, indent=2)
+
+    print("\n Total time per stage:")
+    for stage in STAGES:
+        print(f"   {stage:<10} {totals[stage]:.3f}s")
+    print(f" Summary written to {args.summary}")
+
+
+if __name__ == "__main__":
+    main()
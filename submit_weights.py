@@ -1,9 +1,9 @@
 import json
 import os
 import numpy as np
-from web3 import Web3
-from eth_account import Account
-import time
+
+from model_pack import ModelPack
+from receipt_tracker import ReceiptTracker
 
 # --- CONFIGURATION ---
 SEPOLIA_RPC_URL = "https://eth-sepolia.g.alchemy.com/v2/4XOe07lHUIlGXcd2xroEw"
@@ -31,6 +31,8 @@ NPZ_FILES = [
     "local_model_weights_mlp_1.npz",
     "local_model_weights_mlp_2.npz",
 ]
+# Read the weights from this model pack (see model_pack.py) instead of each .npz
+MODEL_PACK = os.environ.get("MODEL_PACK")
 
 def create_minimal_signature(weights):
     """Creates the 11-weight signature from a full model (must match global model length)."""
@@ -64,6 +66,9 @@ def create_minimal_signature(weights):
 
 
 def main():
+    from web3 import Web3
+    from eth_account import Account
+
     print(" Federated Learning: Submitting 2 Prosumer Weights")
     print("=" * 50)
     
@@ -78,6 +83,12 @@ def main():
     contract = w3.eth.contract(address=w3.to_checksum_address(CONTRACT_ADDRESS), abi=CONTRACT_ABI)
     print(f" Connected to contract at {CONTRACT_ADDRESS}")
 
+    pack = ModelPack(MODEL_PACK) if MODEL_PACK else None
+
+    # Both submissions are sent first and confirmed together as their blocks arrive
+    tracker = ReceiptTracker(w3.eth).start()
+    in_flight = []
+
     # --- Process both prosumers ---
     for i in range(2):
         print(f"\n{'='*20} PROSUMER {i+1} {'='*20}")
@@ -88,10 +99,13 @@ def main():
         
         try:
             account = Account.from_key(private_key)
-            weights_data = np.load(npz_file)
+            if pack is not None and npz_file in pack:
+                weights_data = pack.weights(npz_file)
+            else:
+                weights_data = np.load(npz_file)
             print(f" Account: {account.address}")
             print(f" Model: {npz_file}")
-            print(f" Layers: {weights_data.files}")
+            print(f" Layers: {list(weights_data.keys())}")
         except Exception as e:
             print(f" Error loading data: {e}")
             continue
@@ -130,23 +144,23 @@ def main():
             tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
             
             print(f" Transaction sent: {tx_hash.hex()}")
-            print(" Waiting for confirmation...")
-            
-            tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
-            
+            in_flight.append((i, tx_hash, tracker.track(tx_hash)))
+
+        except Exception as e:
+            print(f" Error: {e}")
+
+    print(f"\n Waiting for {len(in_flight)} confirmations...")
+    for i, tx_hash, future in in_flight:
+        try:
+            tx_receipt = future.result()
             if tx_receipt.status == 1:
-                print(f" SUCCESS! Block: {tx_receipt.blockNumber}")
+                print(f" Prosumer {i+1} SUCCESS! Block: {tx_receipt.blockNumber}")
                 print(f" Etherscan: https://sepolia.etherscan.io/tx/{tx_hash.hex()}")
             else:
-                print(f" Transaction failed!")
-
+                print(f" Prosumer {i+1} transaction failed!")
         except Exception as e:
-            print(f" Error: {e}")
-            
-        # Wait between transactions
-        if i < 1:  # Don't wait after last transaction
-            print("⏸  Waiting 5 seconds...")
-            time.sleep(5)
+            print(f" Prosumer {i+1} error: {e}")
+    tracker.stop()
 
     print(f"\n FEDERATED LEARNING COMPLETE!")
     print(f"Both prosumers have submitted their weights to the blockchain.")
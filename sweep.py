@@ -0,0 +1,291 @@
+"""Parallel hyperparameter sweep for the household teacher/student pipeline.
+
+The household CSV is preprocessed once into .npy feature and target matrices that
+every trial memory-maps read-only, so N workers share one copy in the page cache.
+Trials run in a spawn-based process pool (see train_households.py), each with its
+own window size, LSTM sizes, dropout, batch size, learning rates and calibration
+settings. A median stopping rule prunes lagging teachers: from GRACE_EPOCHS on, a
+trial whose best validation loss is worse than the median of the other trials at
+the same epoch (by more than PRUNE_MARGIN) stops. Students are not pruned, since each
+one's validation loss is measured against its own teacher's predictions. Results are
+ranked by validation sMAPE, and only the best configuration's test scores are reported.
+
+    python sweep.py --data household_1_energy_dataset.csv --trials 12 --workers 4
+    python sweep.py --search grid --space space.json      # every combination in a custom space
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from features import prepare_household, feasible_horizons, load_household, HORIZONS
+from ingest_store import partition_stamp
+from train_households import init_worker
+
+DEFAULT_SUMMARY = 'sweep_results.json'
+SWEEP_CACHE_DIR = os.environ.get('SWEEP_CACHE_DIR', '.sweep_cache')
+GRACE_EPOCHS = 5
+PRUNE_MARGIN = 0.1
+# Pruning needs at least this many other trials' curves to compare against
+MIN_PEERS = 2
+
+SEARCH_SPACE = {
+    'window_size': [24, 48, 72],
+    'lstm_units': [[32, 16], [64, 32]],
+    'dropout': [0.1, 0.2, 0.3],
+    'batch_size': [32, 64],
+    'learning_rate': [3e-4, 1e-3, 3e-3],
+    'student_learning_rate': [1e-4, 1e-3],
+    'student_dropout': [0.1, 0.3],
+    'calibration_window': [25, 50, 100],
+    'local_clip': [[0.9, 1.8], [0.95, 1.2]],
+}
+
+
+def sample_trials(space, search='random', n_trials=8, seed=0):
+    """Parameter dicts for a grid (every combination) or random search over the space."""
+    names = list(space)
+    if search == 'grid':
+        return [dict(zip(names, values)) for values in itertools.product(*(space[n] for n in names))]
+    rng = random.Random(seed)
+    return [{name: rng.choice(space[name]) for name in names} for _ in range(n_trials)]
+
+
+def prepare_features(csv_path, horizons, cache_dir=SWEEP_CACHE_DIR):
+    """Writes the household's feature matrix and targets once; returns their directory.
+
+    Keyed by the CSV contents (or the store partitions) and horizons, so reruns and every trial
+    reuse the same files.
+    """
+    if os.path.isdir(csv_path):
+        contents = json.dumps(partition_stamp(csv_path)).encode()
+    else:
+        with open(csv_path, 'rb') as f:
+            contents = f.read()
+    digest = hashlib.sha256(contents + json.dumps(horizons).encode()).hexdigest()[:16]
+    directory = os.path.join(cache_dir, digest)
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        X, y, feature_cols = prepare_household(csv_path, horizons)
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'X.npy'), np.ascontiguousarray(X, dtype=np.float64))
+        np.save(os.path.join(directory, 'y.npy'), np.asarray(y, dtype=np.float64).reshape(len(y), -1))
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'dataset': csv_path, 'horizons': horizons, 'features': feature_cols}, f)
+    return directory
+
+
+def median_stopping(store, key, grace_epochs=GRACE_EPOCHS, margin=PRUNE_MARGIN):
+    """Keras callback that records this trial's best val_loss per epoch in the shared store
+    and stops training when it lags the median of its peers."""
+    import tensorflow as tf
+
+    phase = key.split(':')[0]
+
+    class MedianStopping(tf.keras.callbacks.Callback):
+        def __init__(self):
+            super().__init__()
+            self.curve = []
+            self.pruned = False
+
+        def on_epoch_end(self, epoch, logs=None):
+            loss = (logs or {}).get('val_loss')
+            if loss is None:
+                return
+            self.curve.append(min(loss, self.curve[-1]) if self.curve else loss)
+            store[key] = list(self.curve)  # reassign: the manager proxy doesn't see in-place changes
+            if epoch + 1 < grace_epochs:
+                return
+            peers = [curve[epoch] for other, curve in store.items()
+                     if other != key and other.startswith(phase + ':') and len(curve) > epoch]
+            if len(peers) >= MIN_PEERS and self.curve[-1] > statistics.median(peers) * (1 + margin):
+                self.pruned = True
+                self.model.stop_training = True
+
+    return MedianStopping()
+
+
+def run_trial(trial_id, params, features_dir, store, teacher_epochs, student_epochs):
+    """Trains and scores one configuration on the shared, memory-mapped features."""
+    import tensorflow as tf
+    from sklearn.metrics import mean_squared_error, mean_absolute_error
+    from tensorflow.keras.callbacks import EarlyStopping
+    from tensorflow.keras.layers import Dense, Dropout
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.optimizers import Adam
+    from features import create_sequences, split_points, scale_inputs, fit_target_scaler, scale_targets, \
+        unscale_targets
+    from train_local_model import TEACHER_CONFIG, build_teacher, make_window_dataset, calibrate_predictions, \
+        smape, smape_loss
+
+    start = time.perf_counter()
+    result = {'trial': trial_id, 'params': params}
+    X = np.load(os.path.join(features_dir, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(features_dir, 'y.npy'), mmap_mode='r')
+    window, batch_size = params['window_size'], params['batch_size']
+
+    X_seq, y_seq = create_sequences(X, y, window=window)
+    split1, split2 = split_points(len(X_seq))
+    _, X_scaled = scale_inputs(X, split1, window)
+    X_tf = tf.constant(X_scaled)
+    scaler_y = fit_target_scaler(y_seq[:split1])
+    y_train, y_val, y_test = (scale_targets(scaler_y, part) for part in
+                              (y_seq[:split1], y_seq[split1:split2], y_seq[split2:]))
+
+    config = dict(TEACHER_CONFIG, epochs=teacher_epochs,
+                  **{name: params[name] for name in TEACHER_CONFIG if name in params})
+    teacher = build_teacher(config, X_scaled.shape[-1], y.shape[1])
+    pruning = median_stopping(store, f"teacher:{trial_id}")
+    history = teacher.fit(
+        make_window_dataset(X_tf, y_train, 0, split1, window, batch_size, shuffle=True),
+        validation_data=make_window_dataset(X_tf, y_val, split1, split2, window, batch_size),
+        epochs=config['epochs'], verbose=0,
+        callbacks=[EarlyStopping(monitor='val_loss', patience=config['early_stopping_patience'],
+                                 restore_best_weights=True), pruning])
+    result['teacher_epochs'] = len(history.history['loss'])
+    result['teacher_val_loss'] = float(min(history.history['val_loss']))
+    if pruning.pruned:
+        result.update(status='pruned', wall_time_s=time.perf_counter() - start)
+        return result
+
+    teacher_train = teacher.predict(make_window_dataset(X_tf, y_train, 0, split1, window, batch_size), verbose=0)
+    teacher_val = teacher.predict(make_window_dataset(X_tf, y_val, split1, split2, window, batch_size), verbose=0)
+    student = Sequential([
+        Dense(32, activation='relu', input_shape=(window * X_scaled.shape[-1],)),
+        Dropout(params['student_dropout']),
+        Dense(16, activation='relu'),
+        Dropout(params['student_dropout']),
+        Dense(8, activation='relu'),
+        Dense(y.shape[1], activation='linear')
+    ])
+    student.compile(optimizer=Adam(params['student_learning_rate']), loss=smape_loss)
+    history = student.fit(
+        make_window_dataset(X_tf, teacher_train, 0, split1, window, batch_size, shuffle=True, flatten=True),
+        validation_data=make_window_dataset(X_tf, teacher_val, split1, split2, window, batch_size, flatten=True),
+        epochs=student_epochs, verbose=0,
+        callbacks=[EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True)])
+    result['student_epochs'] = len(history.history['loss'])
+
+    def scores(lo, hi, y_scaled):
+        """Calibrated student scores against the real targets of sequences [lo, hi)."""
+        y_pred = unscale_targets(scaler_y, student.predict(
+            make_window_dataset(X_tf, y_scaled, lo, hi, window, batch_size, flatten=True), verbose=0))
+        y_true = np.asarray(y_seq[lo:hi, 0])
+        # calibrate_predictions prints its factors; keep worker output to the per-trial summary line
+        with contextlib.redirect_stdout(io.StringIO()):
+            y_pred = calibrate_predictions(y_pred[:, 0], y_true, params['calibration_window'], params['local_clip'])
+        return {'rmse': float(np.sqrt(mean_squared_error(y_true, y_pred))),
+                'mae': float(mean_absolute_error(y_true, y_pred)), 'smape': float(smape(y_true, y_pred))}
+
+    # Trials are compared on the validation split; the test split is only read for the winner's report
+    val = scores(split1, split2, y_val)
+    result.update(status='ok', val_rmse=val['rmse'], val_mae=val['mae'], val_smape=val['smape'],
+                  test=scores(split2, len(X_seq), y_test), wall_time_s=time.perf_counter() - start)
+    return result
+
+
+def _safe_trial(*args):
+    try:
+        return run_trial(*args)
+    except Exception as e:
+        return {'trial': args[0], 'params': args[1], 'status': 'failed', 'error': str(e)}
+
+
+def run_sweep(trials, features_dir, workers=None, threads_per_worker=None, teacher_epochs=None, student_epochs=None):
+    """Runs every trial in a process pool. Returns the results ranked best first."""
+    from train_local_model import TEACHER_CONFIG, STUDENT_EPOCHS
+
+    cpus = os.cpu_count() or 1
+    workers = max(1, min(workers or cpus, len(trials)))
+    threads_per_worker = threads_per_worker or max(1, cpus // workers)
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    with ctx.Manager() as manager:
+        store = manager.dict()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=init_worker, initargs=(threads_per_worker,)) as pool:
+            futures = [pool.submit(_safe_trial, i, params, features_dir, store,
+                                   teacher_epochs or TEACHER_CONFIG['epochs'], student_epochs or STUDENT_EPOCHS)
+                       for i, params in enumerate(trials)]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                detail = f"val sMAPE {result['val_smape']:.2f}%" if result['status'] == 'ok' else result['status']
+                print(f" Trial {result['trial']}: {detail} ({result.get('wall_time_s', 0):.1f}s)")
+    order = {'ok': 0, 'pruned': 1, 'failed': 2}
+    results.sort(key=lambda r: (order[r['status']], r.get('val_smape', r.get('teacher_val_loss', float('inf')))))
+    # Only the selected configuration's test scores are reported
+    for result in results[1:]:
+        result.pop('test', None)
+    return results
+
+
+def format_params(params, space):
+    """Only the parameters that vary in the space, as name=value."""
+    return ' '.join(f"{name}={params[name]}" for name in space if len(space[name]) > 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hyperparameter sweep over the household training pipeline.')
+    parser.add_argument('--data', default='household_1_energy_dataset.csv')
+    parser.add_argument('--search', choices=['random', 'grid'], default='random')
+    parser.add_argument('--trials', type=int, default=8, help='number of random-search trials')
+    parser.add_argument('--space', default=None, help='JSON file mapping parameter names to candidate values')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads-per-worker', type=int, default=None)
+    parser.add_argument('--teacher-epochs', type=int, default=None, help='cap on teacher epochs per trial')
+    parser.add_argument('--student-epochs', type=int, default=None, help='cap on student epochs per trial')
+    parser.add_argument('--horizons', nargs='+', default=list(HORIZONS), choices=list(HORIZONS))
+    parser.add_argument('--summary', default=DEFAULT_SUMMARY)
+    args = parser.parse_args()
+
+    space = dict(SEARCH_SPACE)
+    if args.space:
+        with open(args.space) as f:
+            space.update(json.load(f))
+    horizons = feasible_horizons(len(load_household(args.data)), args.horizons, max(space['window_size']))
+    if not horizons:
+        print(f" {args.data} is too short for any forecast horizon")
+        return
+    trials = sample_trials(space, args.search, args.trials, args.seed)
+    features_dir = prepare_features(args.data, horizons)
+
+    print(f" Sweeping {len(trials)} trials on {args.data} (horizons {', '.join(horizons)}, features in {features_dir})")
+    print("=" * 50)
+    start = time.perf_counter()
+    results = run_sweep(trials, features_dir, args.workers, args.threads_per_worker,
+                        args.teacher_epochs, args.student_epochs)
+    total = time.perf_counter() - start
+
+    print(f"\n Validation scores")
+    print(f" {'rank':>4} {'trial':>5} {'status':<7} {'sMAPE %':>8} {'RMSE':>8} {'MAE':>8} {'wall s':>7}  params")
+    for rank, r in enumerate(results, 1):
+        scores = (f"{r['val_smape']:>8.2f} {r['val_rmse']:>8.2f} {r['val_mae']:>8.2f}" if r['status'] == 'ok'
+                  else f"{'-':>8} {'-':>8} {'-':>8}")
+        print(f" {rank:>4} {r['trial']:>5} {r['status']:<7} {scores} {r.get('wall_time_s', 0):>7.1f}  "
+              f"{format_params(r['params'], space)}")
+    pruned = sum(r['status'] == 'pruned' for r in results)
+    print(f"\n {len(results)} trials in {total:.1f}s, {pruned} stopped early")
+    if results and 'test' in results[0]:
+        test = results[0]['test']
+        print(f" Best trial {results[0]['trial']} on the test split: sMAPE {test['smape']:.2f}%, "
+              f"RMSE {test['rmse']:.2f}, MAE {test['mae']:.2f}")
+
+    with open(args.summary, 'w') as f:
+        json.dump({'dataset': args.data, 'horizons': horizons, 'search': args.search, 'space': space,
+                   'total_wall_time_s': total, 'trials': results}, f, indent=2)
+    print(f" Results written to {args.summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+HOUSEHOLD_PATTERN = re.compile(r'household_(\d+)_energy_dataset\.csv$')
+DEFAULT_SUMMARY = 'training_summary.json'
+
+
+def household_id(csv_path):
+    match = HOUSEHOLD_PATTERN.search(os.path.basename(csv_path))
+    return match.group(1) if match else os.path.splitext(os.path.basename(csv_path))[0]
+
+
+def output_path_for(csv_path, output_dir='.'):
+    """household_2_energy_dataset.csv -> <output_dir>/local_model_weights_mlp_2.npz"""
+    return os.path.join(output_dir, f"local_model_weights_mlp_{household_id(csv_path)}.npz")
+
+
+def find_datasets(directory='.'):
+    paths = glob.glob(os.path.join(directory, 'household_*_energy_dataset.csv'))
+    return sorted(paths, key=lambda p: int(household_id(p)) if household_id(p).isdigit() else p)
+
+
+def init_worker(threads):
+    """Caps TensorFlow/OpenMP threads in a fresh worker, before TensorFlow is imported there."""
+    threads = str(threads)
+    os.environ['OMP_NUM_THREADS'] = threads
+    os.environ['TF_NUM_INTRAOP_THREADS'] = threads
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(int(threads))
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def train_one(csv_path, output_path, init_weights=None, finetune_epochs=None):
+    from train_local_model import train_household, FINETUNE_EPOCHS
+
+    start = time.perf_counter()
+    try:
+        result = train_household(csv_path, output_path, verbose=0, init_weights=init_weights,
+                                 finetune_epochs=FINETUNE_EPOCHS if finetune_epochs is None else finetune_epochs)
+        result['status'] = 'ok'
+    except Exception as e:
+        result = {'dataset': csv_path, 'output': output_path, 'status': 'failed', 'error': str(e)}
+    result['household'] = household_id(csv_path)
+    result['wall_time_s'] = time.perf_counter() - start
+    return result
+
+
+def train_households(datasets, output_dir='.', workers=None, threads_per_worker=None,
+                     init_weights=None, finetune_epochs=None):
+    """Trains every dataset in a spawn-based process pool. Returns the per-household results."""
+    cpus = os.cpu_count() or 1
+    workers = max(1, min(workers or cpus, len(datasets)))
+    threads_per_worker = threads_per_worker or max(1, cpus // workers)
+
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=init_worker, initargs=(threads_per_worker,)) as pool:
+        futures = {pool.submit(train_one, path, output_path_for(path, output_dir), init_weights, finetune_epochs): path
+                   for path in datasets}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result['status'] == 'ok':
+                print(f" Household {result['household']}: sMAPE {result['smape']:.2f}% "
+                      f"in {result['wall_time_s']:.1f}s -> {result['output']}")
+            else:
+                print(f" Household {result['household']} failed: {result['error']}")
+    results.sort(key=lambda r: datasets.index(r['dataset']))
+    return results, workers, threads_per_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train local models for many households in parallel.')
+    parser.add_argument('datasets', nargs='*', help='household CSVs (default: household_*_energy_dataset.csv)')
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help='TensorFlow intra-op threads per worker (default: CPU count / workers)')
+    parser.add_argument('--init-from', default=None, help='global model .npz to warm-start every student from')
+    parser.add_argument('--finetune-epochs', type=int, default=None)
+    parser.add_argument('--verify-chain', action='store_true',
+                        help='check the --init-from artifact against the global model on chain first')
+    parser.add_argument('--summary', default=DEFAULT_SUMMARY)
+    args = parser.parse_args()
+    if args.verify_chain and not args.init_from:
+        parser.error('--verify-chain needs --init-from')
+    if args.verify_chain:
+        from train_local_model import verify_global_artifact
+        verify_global_artifact(args.init_from)
+
+    datasets = args.datasets or find_datasets()
+    if not datasets:
+        print(" No household datasets found.")
+        return
+
+    print(f" Training {len(datasets)} households")
+    print("=" * 50)
+    start = time.perf_counter()
+    results, workers, threads = train_households(datasets, args.output_dir, args.workers, args.threads_per_worker,
+                                                 args.init_from, args.finetune_epochs)
+    total = time.perf_counter() - start
+
+    summary = {
+        'workers': workers,
+        'threads_per_worker': threads,
+        'total_wall_time_s': total,
+        'households': results,
+    }
+    with open(args.summary, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    ok = sum(r['status'] == 'ok' for r in results)
+    print(f"\n {ok}/{len(results)} households trained in {total:.1f}s ({workers} workers x {threads} threads)")
+    print(f" Summary written to {args.summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,294 +1,176 @@
 import numpy as np
-import pandas as pd
-from sklearn.preprocessing import RobustScaler, MinMaxScaler
-from sklearn.metrics import mean_squared_error, mean_absolute_error
-import tensorflow as tf
-from tensorflow.keras.models import Sequential, Model
-from tensorflow.keras.layers import Dense, LSTM, Dropout, Input, Attention, GlobalAveragePooling1D
-from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
-import matplotlib.pyplot as plt
 import os
 import random
+import hashlib
+import json
+import argparse
+import time
 
+from features import (prepare_household, create_sequences, split_points, scale_inputs,
+                      fit_target_scaler, scale_targets, unscale_targets, forecast_quality, save_scalers,
+                      scalers_path_for, feasible_horizons, load_household, HORIZONS)
+from instrumentation import Trace, profiled
 
+
+# TensorFlow is imported inside the functions that need it, so this is set before it loads
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 
-print("Loading dataset...")
-df = pd.read_csv('household_2_energy_dataset.csv', on_bad_lines='skip')
-
-# === STEP 1: Feature Engineering ===
-print("Adding time-based and lag features...")
-
-# Aggregate total electricity
-energy_cols = [col for col in df.columns if 'Electricity' in col and 'Facility' not in col]
-if len(energy_cols) > 0:
-    df['Total_Electricity'] = df[energy_cols].sum(axis=1)
-else:
-    df['Total_Electricity'] = df['Electricity:Facility [kW](Hourly)']
-
-# Time features
-df['HourOfDay'] = np.arange(len(df)) % 24
-df['DayOfWeek'] = (np.arange(len(df)) // 24) % 7
-df['is_weekend'] = (df['DayOfWeek'] >= 5).astype(int)
-df['hour_sin'] = np.sin(2 * np.pi * df['HourOfDay'] / 24)
-df['hour_cos'] = np.cos(2 * np.pi * df['HourOfDay'] / 24)
-
-# Lag features
-df['lag_1'] = df['Total_Electricity'].shift(1)
-df['lag_24'] = df['Total_Electricity'].shift(24)
-df['lag_48'] = df['Total_Electricity'].shift(48)
-
-# Rolling stats
-df['rolling_mean_24'] = df['Total_Electricity'].shift(1).rolling(window=24, min_periods=1).mean()
-df['rolling_std_24'] = df['Total_Electricity'].rolling(24, min_periods=1).std().fillna(0)
-df['zscore_24'] = (df['Total_Electricity'] - df['rolling_mean_24']) / (df['rolling_std_24'] + 1e-6) #to detect unusually high load
-
-# Rate of change
-df['roc_1'] = df['Total_Electricity'] - df['lag_1']
-df['roc_24'] = df['Total_Electricity'] - df['lag_24']
-
-# Peak flags
-df['is_morning_peak'] = ((df['HourOfDay'] >= 7) & (df['HourOfDay'] <= 9)).astype(int)
-df['is_evening_peak'] = ((df['HourOfDay'] >= 17) & (df['HourOfDay'] <= 19)).astype(int)
-
-# Drop index and unused columns including timestamp
-exclude_cols = ['Class', 'theft', '0', 'timestamp', 'transaction_id', 'node_id']
-feature_cols = [col for col in df.columns if col not in exclude_cols and col != 'Electricity:Facility [kW](Hourly)']
-target_col = 'Electricity:Facility [kW](Hourly)'
-
-# Fill and drop NaN
-df = df.ffill().bfill().dropna()
-
-print(f"Data shape after preprocessing: {df.shape}")
-print(f"Number of features: {len(feature_cols)}")
-
-# === STEP 2: Target Creation ===
-X_raw = df[feature_cols].values
-y_raw = df[target_col].values
-
-# Target: sum of next 24 hours
-y_seq = []
-for i in range(len(X_raw) - 24):
-    y_seq.append(np.sum(y_raw[i+24:i+48]))
-y_seq = np.array(y_seq)
-X = X_raw[:-24]
-
-print(f"Creating target: sum of next 24 hours...")
-print(f"X shape: {X.shape}, y shape: {y_seq.shape}")
-
-# === STEP 3: Sequence Creation ===
-def create_sequences(X, y, window=72):
-    X_out, y_out = [], []
-    for i in range(window, len(X)):
-        X_out.append(X[i-window:i])
-        y_out.append(y[i])
-    return np.array(X_out), np.array(y_out)
+DEFAULT_DATASET = 'household_2_energy_dataset.csv'
+DEFAULT_OUTPUT = 'local_model_weights_mlp_2.npz'
 
 window_size = 72
-X_seq, y_seq = create_sequences(X, y_seq, window=window_size)
-print(f"Sequence shapes - Train: {X_seq.shape}, Val: {X_seq.shape}, Test: {X_seq.shape}")
-
-# === STEP 4: Train/Val/Test Split ===
-split1 = int(0.7 * len(X_seq))
-split2 = int(0.85 * len(X_seq))
-X_train, X_val, X_test = X_seq[:split1], X_seq[split1:split2], X_seq[split2:]
-y_train, y_val, y_test = y_seq[:split1], y_seq[split1:split2], y_seq[split2:]
-
-# === STEP 5: Scaling ===
-print("Scaling input features with RobustScaler...")
-scaler_X = RobustScaler()
-X_train_flat = X_train.reshape(-1, X_train.shape[-1])
-X_val_flat = X_val.reshape(-1, X_val.shape[-1])
-X_test_flat = X_test.reshape(-1, X_test.shape[-1])
-
-X_train_scaled = scaler_X.fit_transform(X_train_flat).reshape(X_train.shape)
-X_val_scaled = scaler_X.transform(X_val_flat).reshape(X_val.shape)
-X_test_scaled = scaler_X.transform(X_test_flat).reshape(X_test.shape)
-
-print("Scaling target with log1p and MinMaxScaler...")
-scaler_y = MinMaxScaler()
-y_train_log = np.log1p(y_train).reshape(-1, 1)
-y_val_log = np.log1p(y_val).reshape(-1, 1)
-y_test_log = np.log1p(y_test).reshape(-1, 1)
-
-scaler_y.fit(y_train_log)
-y_train_scaled = scaler_y.transform(y_train_log).flatten()
-y_val_scaled = scaler_y.transform(y_val_log).flatten()
-y_test_scaled = scaler_y.transform(y_test_log).flatten()
-
-# === STEP 6: Teacher Model (LSTM) ===
-print("Training DNN Teacher model...")
-input_layer = Input(shape=(window_size, X_train.shape[-1]))
-
-# First LSTM layer with return_sequences=True for attention
-lstm_out = LSTM(64, return_sequences=True)(input_layer)
-lstm_out = Dropout(0.2)(lstm_out)
-
-# Second LSTM layer 
-lstm_final = LSTM(32, return_sequences=True)(lstm_out)
-lstm_final = Dropout(0.2)(lstm_final)
-
-# Apply attention mechanism - use self-attention on the sequence
-attention_out = Attention()([lstm_final, lstm_final])
-
-# Global average pooling to reduce sequence dimension
-pooled = GlobalAveragePooling1D()(attention_out)
-
-# Dense layers
-x = Dense(32, activation='relu')(pooled)
-x = Dropout(0.2)(x)
-output_layer = Dense(1, activation='linear')(x)
-
-teacher_model = Model(inputs=input_layer, outputs=output_layer)
-
-teacher_model.compile(
-    optimizer=Adam(1e-3),
-    loss='huber',
-    metrics=['mae', tf.keras.metrics.MeanAbsolutePercentageError()] # Add MAPE here
-)
-
-callbacks = [
-    EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True),
-    ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=5, min_lr=1e-6)
-]
-
-teacher_model.fit(
-    X_train_scaled, y_train_scaled,
-    validation_data=(X_val_scaled, y_val_scaled),
-    epochs=100,
-    batch_size=32,
-    callbacks=callbacks,
-    verbose=1
-)
-
-# === STEP 7: Student Model (Small MLP) ===
-print("Training MLP Student via Knowledge Distillation...")
-teacher_pred_train = teacher_model.predict(X_train_scaled, verbose=0).flatten()
-teacher_pred_val = teacher_model.predict(X_val_scaled, verbose=0).flatten()
-
-X_train_flat_mlp = X_train_scaled.reshape(X_train_scaled.shape[0], -1)
-X_val_flat_mlp = X_val_scaled.reshape(X_val_scaled.shape[0], -1)
-X_test_flat_mlp = X_test_scaled.reshape(X_test_scaled.shape[0], -1)
-
-# Keep small MLP (32 → 16 → 8 → 1) for blockchain compatibility
-mlp_student = Sequential([
-    Dense(32, activation='relu', input_shape=(X_train_flat_mlp.shape[1],)),
-    Dropout(0.3),
-    Dense(16, activation='relu'),
-    Dropout(0.3),
-    Dense(8, activation='relu'),
-    Dense(1, activation='linear')
-])
+batch_size = 32
+STUDENT_EPOCHS = 150
+# Epoch budget when the student is warm-started from the aggregated global model
+FINETUNE_EPOCHS = 20
+# Horizons the student predicts in one forward pass (those the data is too short for are dropped)
+DEFAULT_HORIZONS = tuple(HORIZONS)
+
+# Everything that determines the teacher's outputs besides the data. Changing any
+# of these invalidates the teacher cache.
+TEACHER_CONFIG = {
+    'window_size': window_size,
+    'lstm_units': [64, 32],
+    'dropout': 0.2,
+    'dense_units': 32,
+    'learning_rate': 1e-3,
+    'loss': 'huber',
+    'epochs': 100,
+    'batch_size': batch_size,
+    'early_stopping_patience': 10,
+    # ReduceLROnPlateau; part of the config so the teacher cache key covers it
+    'lr_reduce_factor': 0.5,
+    'lr_reduce_patience': 5,
+    'min_learning_rate': 1e-6,
+}
+TEACHER_CACHE_DIR = os.environ.get('TEACHER_CACHE_DIR', '.teacher_cache')
+
+
+def make_window_dataset(X_tf, y, start, stop, window, batch_size=32, shuffle=False, flatten=False):
+    """tf.data pipeline over sequences [start, stop), cutting windows out of the flat X_tf on the fly."""
+    import tensorflow as tf
+
+    offsets = tf.range(window, dtype=tf.int64)
+    y_tf = tf.constant(np.asarray(y, dtype=np.float32))
+    n_features = X_tf.shape[-1]
+
+    def gather_batch(idx):
+        windows = tf.gather(X_tf, idx[:, None] + offsets)
+        if flatten:
+            windows = tf.reshape(windows, (-1, window * n_features))
+        return windows, tf.gather(y_tf, idx - start)
+
+    ds = tf.data.Dataset.range(start, stop)
+    if shuffle:
+        ds = ds.shuffle(stop - start, reshuffle_each_iteration=True)
+    return ds.batch(batch_size).map(gather_batch, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def build_teacher(config, n_features, n_outputs=1):
+    import tensorflow as tf
+    from tensorflow.keras.layers import Dense, LSTM, Dropout, Input, Attention, GlobalAveragePooling1D
+    from tensorflow.keras.models import Model
+    from tensorflow.keras.optimizers import Adam
+
+    input_layer = Input(shape=(config['window_size'], n_features))
+
+    # First LSTM layer with return_sequences=True for attention
+    lstm_out = LSTM(config['lstm_units'][0], return_sequences=True)(input_layer)
+    lstm_out = Dropout(config['dropout'])(lstm_out)
+
+    # Second LSTM layer
+    lstm_final = LSTM(config['lstm_units'][1], return_sequences=True)(lstm_out)
+    lstm_final = Dropout(config['dropout'])(lstm_final)
+
+    # Apply attention mechanism - use self-attention on the sequence
+    attention_out = Attention()([lstm_final, lstm_final])
+
+    # Global average pooling to reduce sequence dimension
+    pooled = GlobalAveragePooling1D()(attention_out)
+
+    # Dense layers
+    x = Dense(config['dense_units'], activation='relu')(pooled)
+    x = Dropout(config['dropout'])(x)
+    output_layer = Dense(n_outputs, activation='linear')(x)
+
+    model = Model(inputs=input_layer, outputs=output_layer)
+    model.compile(
+        optimizer=Adam(config['learning_rate']),
+        loss=config['loss'],
+        metrics=['mae', tf.keras.metrics.MeanAbsolutePercentageError()] # Add MAPE here
+    )
+    return model
+
+
+def teacher_cache_key(config, X_scaled, y_train_scaled, y_val_scaled, split1, split2):
+    """Hash of the teacher config plus the exact scaled data it is trained and validated on."""
+    h = hashlib.sha256()
+    h.update(json.dumps(config, sort_keys=True).encode())
+    h.update(np.array([split1, split2], dtype=np.int64).tobytes())
+    for arr in (X_scaled, y_train_scaled, y_val_scaled):
+        h.update(np.ascontiguousarray(arr).tobytes())
+    return h.hexdigest()[:16]
+
 
 #  Use PEAK-WEIGHTED LOSS
 def peak_weighted_loss(y_true, y_pred):
+    import tensorflow as tf
     diff = tf.abs(y_true - y_pred)
     weights = 1.0 + tf.square(y_true) / (tf.reduce_max(tf.square(y_true)) + 1e-6)
     return tf.reduce_mean(diff * weights)
 
 def smape_loss(y_true, y_pred):
+    import tensorflow as tf
     epsilon = 0.1 # A small value to prevent division by zero
     numerator = tf.abs(y_pred - y_true)
     denominator = tf.keras.backend.maximum(tf.abs(y_true) + tf.abs(y_pred), epsilon)
     return tf.reduce_mean(2.0 * numerator / denominator)
 
-# Then compile your student model with it
-mlp_student.compile(optimizer=Adam(1e-4), loss=smape_loss, metrics=['mae'])
-
-callbacks_mlp = [
-    ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=5, min_lr=1e-6),
-    EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True)
-]
-
-mlp_student.fit(
-    X_train_flat_mlp, teacher_pred_train,
-    validation_data=(X_val_flat_mlp, teacher_pred_val),
-    epochs=150,
-    batch_size=32,
-    callbacks=callbacks_mlp,
-    verbose=1
-)
-
-# === STEP 8: Evaluation with STRONG Calibration ===
-print("Evaluating MLP Student...")
-y_pred_scaled = mlp_student.predict(X_test_flat_mlp, verbose=0).flatten()
-
-# Inverse transform
-y_test_log_restored = scaler_y.inverse_transform(y_test_scaled.reshape(-1, 1)).flatten()
-y_pred_log_restored = scaler_y.inverse_transform(y_pred_scaled.reshape(-1, 1)).flatten()
-
-y_test_original = np.expm1(y_test_log_restored)
-y_pred_original = np.expm1(y_pred_log_restored)
-y_test_true = y_test
-
-#  1. Rolling Median Calibration (Stronger)
-y_pred_calibrated = []
-calibration_window = 50
-for i in range(len(y_pred_original)):
-    pred = y_pred_original[i]
-    start = max(0, i - calibration_window)
-    recent_true = y_test_true[start:i+1]
-    recent_pred = y_pred_original[start:i+1]
-    
-    if len(recent_true) > 20:
-        local_factor = np.median(recent_true) / (np.median(recent_pred) + 1e-6)
-        local_factor = np.clip(local_factor, 0.90, 1.80)  # Allow 40% boost
-        pred = pred * local_factor
-    y_pred_calibrated.append(pred)
-
-y_pred_calibrated = np.array(y_pred_calibrated)
-
-#  2. Global Boost (Force Recovery)
-# --- 2. Fallback Global Recovery (Critical Fix) ---
-# If the model is systematically underpredicting, force a boost
-median_true = np.median(y_test_true)
-median_pred = np.median(y_pred_calibrated)
-
-if median_pred < 0.9 * median_true:
-    fallback_factor = median_true / (median_pred + 1e-6)
-    # Increase the upper limit of the clip here
-    fallback_factor = np.clip(fallback_factor, 1.0, 2.0) # Changed from 1.8 to 2.5
-    print(f" Applying fallback calibration: {fallback_factor:.3f}")
-    y_pred_final = y_pred_calibrated * fallback_factor
-else:
-    # You can also slightly increase the normal global factor
-    global_factor = np.median(y_test_true) / (np.median(y_pred_calibrated) + 1e-6)
-    global_factor = np.clip(global_factor, 1.0, 1.5) # Changed from 1.5 to 2.0
-    print(f" Applying global calibration factor: {global_factor:.3f}")
-    y_pred_final = y_pred_calibrated * global_factor
-
-# 3. Final Clip
-y_pred_final = np.clip(y_pred_final, 0, y_test_true.max() * 1.5)
-
-# === STEP 9: Metrics & Output ===
-rmse = np.sqrt(mean_squared_error(y_test_true, y_pred_final))
-mae = mean_absolute_error(y_test_true, y_pred_final)
 def smape(a, f): return 100 * np.mean(2 * np.abs(f - a) / (np.abs(a) + np.abs(f) + 1e-8))
-smape_score = smape(y_test_true, y_pred_final)
-
-print(f"\nFinal Results (Daily Total):")
-print(f"RMSE: {rmse:.2f} kW")
-print(f"MAE: {mae:.2f} kW")
-print(f"sMAPE: {smape_score:.2f}%")
-
-# Output predictions
-print("\n============================================================")
-print("         FINAL PREDICTION OUTPUT")
-print("============================================================")
-num_predictions = min(10, len(y_test_true))
-for i in range(num_predictions):
-    actual = y_test_true[i]
-    pred = y_pred_final[i]
-    error = abs(pred - actual) / actual * 100 if actual != 0 else 0
-    status = "✅ Success" if error < 5 else "⚠️  Warning"
-    print(f"Prediction {i+1}:")
-    print(f"  Actual: {actual:.2f} kW")
-    print(f"  Predicted: {pred:.2f} kW")
-    print(f"  Error: {error:.1f}% → {status}")
-    print()
-
-# === STEP 10: Save Weights ===
+
+
+def calibrate_predictions(y_pred_original, y_test_true, calibration_window=50, local_clip=(0.90, 1.80),
+                          global_clip=(1.0, 1.5), fallback_clip=(1.0, 2.0)):
+    """Rolling median calibration followed by a clipped global boost."""
+    #  1. Rolling Median Calibration (Stronger)
+    y_pred_calibrated = []
+    for i in range(len(y_pred_original)):
+        pred = y_pred_original[i]
+        start = max(0, i - calibration_window)
+        recent_true = y_test_true[start:i+1]
+        recent_pred = y_pred_original[start:i+1]
+
+        if len(recent_true) > 20:
+            local_factor = np.median(recent_true) / (np.median(recent_pred) + 1e-6)
+            local_factor = np.clip(local_factor, *local_clip)  # Allow 40% boost
+            pred = pred * local_factor
+        y_pred_calibrated.append(pred)
+
+    y_pred_calibrated = np.array(y_pred_calibrated)
+
+    #  2. Global Boost (Force Recovery)
+    # --- 2. Fallback Global Recovery (Critical Fix) ---
+    # If the model is systematically underpredicting, force a boost
+    median_true = np.median(y_test_true)
+    median_pred = np.median(y_pred_calibrated)
+
+    if median_pred < 0.9 * median_true:
+        fallback_factor = median_true / (median_pred + 1e-6)
+        # Increase the upper limit of the clip here
+        fallback_factor = np.clip(fallback_factor, *fallback_clip) # Changed from 1.8 to 2.5
+        print(f" Applying fallback calibration: {fallback_factor:.3f}")
+        y_pred_final = y_pred_calibrated * fallback_factor
+    else:
+        # You can also slightly increase the normal global factor
+        global_factor = np.median(y_test_true) / (np.median(y_pred_calibrated) + 1e-6)
+        global_factor = np.clip(global_factor, *global_clip) # Changed from 1.5 to 2.0
+        print(f" Applying global calibration factor: {global_factor:.3f}")
+        y_pred_final = y_pred_calibrated * global_factor
+
+    # 3. Final Clip
+    return np.clip(y_pred_final, 0, y_test_true.max() * 1.5)
+
+
 def save_mlp_weights(model, filename):
     weights = model.get_weights()
     np.savez(filename,
@@ -299,4 +181,275 @@ def save_mlp_weights(model, filename):
     print(f"Saving MLP weights: {filename}")
     print(f"MLP weights saved ({os.path.getsize(filename)} bytes)")
 
-save_mlp_weights(mlp_student, 'local_model_weights_mlp_2.npz')
+
+def load_mlp_weights(filename):
+    """Inverse of save_mlp_weights: the student's weights in Keras get_weights() order."""
+    with np.load(filename) as weights:
+        return [weights[f"{kind}{layer}"] for layer in range(1, 5) for kind in ('W', 'b')]
+
+
+def verify_global_artifact(filename):
+    """Checks a global model artifact against the signature published on chain.
+
+    The contract only stores the 11-weight signature, so the full weights come from the
+    artifact written by aggregate.py and the chain is used to confirm they are the
+    weights that were actually aggregated.
+    """
+    from web3 import Web3
+    from aggregate import CONTRACT_ABI, matches_global_signature
+    from submit_weights import create_minimal_signature
+
+    rpc_url = os.environ.get("SEPOLIA_RPC_URL")
+    contract_address = os.environ.get("CONTRACT_ADDRESS")
+    if not rpc_url or not contract_address:
+        raise ValueError("SEPOLIA_RPC_URL and CONTRACT_ADDRESS must be set to verify against the chain.")
+
+    w3 = Web3(Web3.HTTPProvider(rpc_url))
+    contract = w3.eth.contract(address=w3.to_checksum_address(contract_address), abi=CONTRACT_ABI)
+    global_signature = contract.functions.getGlobalModel().call()
+    with np.load(filename) as weights:
+        artifact_signature = create_minimal_signature(weights)
+    if not matches_global_signature(artifact_signature, global_signature):
+        raise ValueError(f"{filename} does not match the global model on chain.")
+    print(f"Verified {filename} against the on-chain global model")
+
+
+def train_household(csv_path=DEFAULT_DATASET, output_path=DEFAULT_OUTPUT, verbose=1,
+                    init_weights=None, finetune_epochs=FINETUNE_EPOCHS, horizons=DEFAULT_HORIZONS):
+    """Runs the full local pipeline for one household and writes its student weights.
+
+    The student has one output per forecast horizon (see features.HORIZONS); horizons the
+    household has too little history for are dropped. With init_weights (a global model
+    .npz), the student starts from those weights and is fine-tuned for finetune_epochs
+    instead of trained from scratch.
+    Returns the test-set metrics of the calibrated student (headline numbers are for the
+    first horizon). Per-stage timings and memory go to the JSONL trace (see instrumentation.py).
+    """
+    import tensorflow as tf
+    from sklearn.metrics import mean_squared_error, mean_absolute_error
+    from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
+    from tensorflow.keras.layers import Dense, Dropout
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.optimizers import Adam
+
+    print(f"Loading dataset {csv_path}...")
+    trace = Trace(dataset=csv_path, output=output_path)
+    run_start = time.perf_counter()
+
+    # === STEP 1-2: Feature Engineering and Target Creation ===
+    with trace.stage('features'):
+        horizons = feasible_horizons(len(load_household(csv_path)), horizons, window_size)
+        if not horizons:
+            raise ValueError(f"{csv_path} is too short for any forecast horizon")
+        print("Adding time-based and lag features...")
+        X, y_seq, feature_cols = prepare_household(csv_path, horizons)
+        print(f"Number of features: {len(feature_cols)}")
+        print(f"Creating targets for horizons {', '.join(horizons)}...")
+        print(f"X shape: {X.shape}, y shape: {y_seq.shape}")
+
+    # === STEP 3: Sequence Creation ===
+    with trace.stage('sequences'):
+        X_seq, y_seq = create_sequences(X, y_seq, window=window_size)
+
+        # === STEP 4: Train/Val/Test Split ===
+        split1, split2 = split_points(len(X_seq))
+        y_train, y_val, y_test = y_seq[:split1], y_seq[split1:split2], y_seq[split2:]
+        print(f"Sequence shapes - Train: {X_seq[:split1].shape}, Val: {X_seq[split1:split2].shape}, Test: {X_seq[split2:].shape}")
+
+    # === STEP 5: Scaling ===
+    with trace.stage('scaling'):
+        # Scale the flat feature matrix once; windows are cut from it on the fly, so the
+        # n x window x features tensor is never materialised. The scaler sees exactly the
+        # rows covered by the training windows.
+        print("Scaling input features with RobustScaler...")
+        scaler_X, X_scaled = scale_inputs(X, split1, window_size)
+        X_tf = tf.constant(X_scaled)
+
+        print("Scaling target with log1p and MinMaxScaler...")
+        scaler_y = fit_target_scaler(y_train)
+        y_train_scaled = scale_targets(scaler_y, y_train)
+        y_val_scaled = scale_targets(scaler_y, y_val)
+        y_test_scaled = scale_targets(scaler_y, y_test)
+
+        train_ds = make_window_dataset(X_tf, y_train_scaled, 0, split1, window_size, batch_size, shuffle=True)
+        val_ds = make_window_dataset(X_tf, y_val_scaled, split1, split2, window_size, batch_size)
+
+    # === STEP 6: Teacher Model (LSTM) ===
+    with trace.stage('teacher'):
+        cache_key = teacher_cache_key(dict(TEACHER_CONFIG, horizons=horizons), X_scaled, y_train_scaled,
+                                      y_val_scaled, split1, split2)
+        teacher_model_path = os.path.join(TEACHER_CACHE_DIR, f"teacher_{cache_key}.keras")
+        teacher_preds_path = os.path.join(TEACHER_CACHE_DIR, f"teacher_{cache_key}_preds.npz")
+
+        if os.path.exists(teacher_preds_path):
+            print(f"Loading cached teacher predictions: {teacher_preds_path}")
+            with np.load(teacher_preds_path) as cached:
+                teacher_pred_train = cached['teacher_pred_train']
+                teacher_pred_val = cached['teacher_pred_val']
+        else:
+            print("Training DNN Teacher model...")
+            teacher_model = build_teacher(TEACHER_CONFIG, X_scaled.shape[-1], len(horizons))
+
+            callbacks = [
+                EarlyStopping(monitor='val_loss', patience=TEACHER_CONFIG['early_stopping_patience'], restore_best_weights=True),
+                ReduceLROnPlateau(monitor='val_loss', factor=TEACHER_CONFIG['lr_reduce_factor'],
+                                  patience=TEACHER_CONFIG['lr_reduce_patience'],
+                                  min_lr=TEACHER_CONFIG['min_learning_rate']),
+                trace.epoch_callback('teacher'),
+            ]
+
+            teacher_model.fit(
+                train_ds,
+                validation_data=val_ds,
+                epochs=TEACHER_CONFIG['epochs'],
+                callbacks=callbacks,
+                verbose=verbose
+            )
+
+            teacher_pred_train = teacher_model.predict(
+                make_window_dataset(X_tf, y_train_scaled, 0, split1, window_size, batch_size), verbose=0)
+            teacher_pred_val = teacher_model.predict(val_ds, verbose=0)
+
+            os.makedirs(TEACHER_CACHE_DIR, exist_ok=True)
+            teacher_model.save(teacher_model_path)
+            np.savez(teacher_preds_path, teacher_pred_train=teacher_pred_train, teacher_pred_val=teacher_pred_val)
+            print(f"Cached teacher model and predictions under key {cache_key}")
+
+    # === STEP 7: Student Model (Small MLP) ===
+    with trace.stage('student'):
+        print("Training MLP Student via Knowledge Distillation...")
+        # The student sees the same windows flattened to window_size * features inputs
+        student_train_ds = make_window_dataset(X_tf, teacher_pred_train, 0, split1, window_size, batch_size, shuffle=True, flatten=True)
+        student_val_ds = make_window_dataset(X_tf, teacher_pred_val, split1, split2, window_size, batch_size, flatten=True)
+        test_ds = make_window_dataset(X_tf, y_test_scaled, split2, len(X_seq), window_size, batch_size, flatten=True)
+
+        # Keep small MLP (32 → 16 → 8 → horizons) for blockchain compatibility
+        mlp_student = Sequential([
+            Dense(32, activation='relu', input_shape=(window_size * X_scaled.shape[-1],)),
+            Dropout(0.3),
+            Dense(16, activation='relu'),
+            Dropout(0.3),
+            Dense(8, activation='relu'),
+            Dense(len(horizons), activation='linear')
+        ])
+
+        student_epochs = STUDENT_EPOCHS
+        if init_weights:
+            global_weights = load_mlp_weights(init_weights)
+            expected = [w.shape for w in mlp_student.get_weights()]
+            if [w.shape for w in global_weights] != expected:
+                raise ValueError(f"{init_weights} does not fit this household's student (expected shapes {expected})")
+            mlp_student.set_weights(global_weights)
+            student_epochs = finetune_epochs
+            print(f"Warm-starting student from {init_weights}, fine-tuning for {finetune_epochs} epochs")
+
+        mlp_student.compile(optimizer=Adam(1e-4), loss=smape_loss, metrics=['mae'])
+
+        callbacks_mlp = [
+            ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=5, min_lr=1e-6),
+            EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True),
+            trace.epoch_callback('student'),
+        ]
+
+        # --finetune-epochs 0 evaluates the warm-start weights as they are
+        trained_epochs = 0
+        if student_epochs > 0:
+            history = mlp_student.fit(
+                student_train_ds,
+                validation_data=student_val_ds,
+                epochs=student_epochs,
+                callbacks=callbacks_mlp,
+                verbose=verbose
+            )
+            trained_epochs = len(history.history['loss'])
+
+    # === STEP 8: Evaluation with STRONG Calibration ===
+    with trace.stage('evaluation'):
+        print("Evaluating MLP Student...")
+        y_pred_scaled = mlp_student.predict(test_ds, verbose=0)
+
+        # Inverse transform
+        y_pred_original = unscale_targets(scaler_y, y_pred_scaled)
+
+        # === STEP 9: Metrics & Output ===
+        horizon_metrics = {}
+        for j, name in enumerate(horizons):
+            y_pred_h = calibrate_predictions(y_pred_original[:, j], y_test[:, j])
+            horizon_metrics[name] = {
+                'rmse': float(np.sqrt(mean_squared_error(y_test[:, j], y_pred_h))),
+                'mae': float(mean_absolute_error(y_test[:, j], y_pred_h)),
+                'smape': float(smape(y_test[:, j], y_pred_h)),
+            }
+            if j == 0:
+                y_test_true, y_pred_final = y_test[:, 0], y_pred_h
+        rmse, mae, smape_score = (horizon_metrics[horizons[0]][key] for key in ('rmse', 'mae', 'smape'))
+
+    for name, scores in horizon_metrics.items():
+        print(f"\nFinal Results ({name} total):")
+        print(f"RMSE: {scores['rmse']:.2f} kW")
+        print(f"MAE: {scores['mae']:.2f} kW")
+        print(f"sMAPE: {scores['smape']:.2f}%")
+
+    # Output predictions
+    print("\n============================================================")
+    print("         FINAL PREDICTION OUTPUT")
+    print("============================================================")
+    num_predictions = min(10, len(y_test_true))
+    for i in range(num_predictions):
+        actual = y_test_true[i]
+        pred = y_pred_final[i]
+        error = abs(pred - actual) / actual * 100 if actual != 0 else 0
+        status = "✅ Success" if error < 5 else "⚠️  Warning"
+        print(f"Prediction {i+1}:")
+        print(f"  Actual: {actual:.2f} kW")
+        print(f"  Predicted: {pred:.2f} kW")
+        print(f"  Error: {error:.1f}% → {status}")
+        print()
+
+    # === STEP 10: Save Weights ===
+    with trace.stage('save'):
+        save_mlp_weights(mlp_student, output_path)
+        # Serving runs the uncalibrated student, so record its raw test quality with the scalers
+        save_scalers(scalers_path_for(output_path), scaler_X, scaler_y, horizons,
+                     **forecast_quality(y_test, y_pred_original))
+
+    metrics = {
+        'dataset': csv_path,
+        'output': output_path,
+        'rmse': float(rmse),
+        'mae': float(mae),
+        'smape': float(smape_score),
+        'n_train': int(split1),
+        'n_val': int(split2 - split1),
+        'n_test': int(len(X_seq) - split2),
+        'warm_start': bool(init_weights),
+        'student_epochs': trained_epochs,
+        'horizons': horizon_metrics,
+    }
+    trace.write('run', wall_s=time.perf_counter() - run_start, stages=trace.stages, **metrics)
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train one household's local MLP student.")
+    parser.add_argument('--data', default=DEFAULT_DATASET, help='household energy CSV')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='where to write the student .npz')
+    parser.add_argument('--init-from', default=None,
+                        help='global model .npz to warm-start the student from (see GLOBAL_MODEL_NPZ in aggregate.py)')
+    parser.add_argument('--finetune-epochs', type=int, default=FINETUNE_EPOCHS)
+    parser.add_argument('--horizons', nargs='+', default=list(DEFAULT_HORIZONS), choices=list(HORIZONS),
+                        help='forecast horizons the student predicts (dropped if the data is too short)')
+    parser.add_argument('--verify-chain', action='store_true',
+                        help='check the --init-from artifact against the global model on chain first')
+    args = parser.parse_args()
+    if args.verify_chain and not args.init_from:
+        parser.error('--verify-chain needs --init-from')
+    if args.verify_chain:
+        verify_global_artifact(args.init_from)
+    with profiled():
+        train_household(args.data, args.output, init_weights=args.init_from, finetune_epochs=args.finetune_epochs,
+                        horizons=args.horizons)
+
+
+if __name__ == "__main__":
+    main()